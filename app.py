@@ -3,14 +3,40 @@ from pymongo import MongoClient
 import pandas as pd
 import matplotlib.pyplot as plt
 from time import perf_counter;
+from indexes import missingIndexes, describeIndex, REQUIRED_INDEXES, COMPACT_INDEXES
+from queries import normalizeID, normalizeUploader, findVideo, pageUploaderVideos, countUploaderVideos, findReverseRelated, countReverseRelated
+from queryCache import QueryCache
+from sampling import randomSample, densityGrid, gridExtent
+from timeSeries import topTrending, videoHistory
+from crawlLog import loadRuns
+from graphAnalytics import topPageRank, graphStats
+from dashboardStats import loadStats, computeStats
+from compactSchema import COMPACT_COLLECTION, Codec, currentSchema
+from instrumentation import CommandMonitor, configure, registry, commandTable, explain, planSummary
+from queryRunner import QueryRunner
+from searchIndex import searchReady, searchUploaders, searchVideoIDs
+from partitions import LATEST, ALL, listPartitions, routeVideos, allVideos
+import os
 
 # 1. DATABASE CONNECTION AND SETUP
+# Records the time, documents and bytes of every MongoDB command the app sends (instrumentation.py).
+# Metrics go to metrics/app.prom and slow commands to metrics/app.jsonl.
+@st.cache_resource
+def get_command_monitor():
+    configure("app", os.path.join(os.getcwd(), "metrics"))
+    return CommandMonitor()
+
+command_monitor = get_command_monitor()
+# Everything MongoDB does from here on in this run is counted as query time, the rest as render time.
+page_start = perf_counter()
+command_monitor.startRun()
+
 # Connects to the database and keeps the connection open.
 @st.cache_resource
 def connect_to_database():
     try:
         # Tries to connect to MongoDB on the default port.
-        db_client = MongoClient("mongodb://localhost:27017")
+        db_client = MongoClient("mongodb://localhost:27017", event_listeners=[command_monitor])
         # Checks the connection status.
         db_client.admin.command('ping') 
         return db_client
@@ -20,66 +46,248 @@ def connect_to_database():
 
 mongo_client = connect_to_database()
 
+# Which schema the last dataInsertion.py run wrote ("full" or "compact"), re-read once a minute.
+@st.cache_data(ttl=60)
+def load_video_schema(_db):
+    return currentSchema(_db)
+
+# Expands compact documents back into the Video shape (compactSchema.py); holds the category and uploader names.
+@st.cache_resource
+def get_codec(_db):
+    return Codec(_db)
+
 if mongo_client:
     db = mongo_client["YoutubeData"]
-    video_collection = db["Video"] # Main collection reference
+    video_schema = load_video_schema(db)
+    if video_schema == "compact":
+        video_collection = db[COMPACT_COLLECTION] # Main collection reference
+        codec = get_codec(db)
+    elif video_schema == "partitioned":
+        # One collection per crawl snapshot (partitions.py); routed once the sidebar below says which crawls to read.
+        video_collection = None
+        codec = None
+    else:
+        video_collection = db["Video"] # Main collection reference
+        codec = None
 else:
     # Stops the application if the database connection fails.
     st.stop()
 
+# Checks once every few minutes that the indexes the queries below rely on exist.
+@st.cache_data(ttl=300)
+def check_indexes(_collection, schema, scope=None):
+    return [describeIndex(index) for index in missingIndexes(_collection, COMPACT_INDEXES if schema == "compact" else REQUIRED_INDEXES)]
+
+# Reads the precomputed dashboard metrics. It runs on a query_runner worker thread, which has no Streamlit script
+# context, so it is not an st.cache_data function: the dashboard caches it in query_cache (cleared after each load).
+def read_dashboard_stats(db, compact):
+    stats = loadStats(db)
+    if stats is None:
+        # DashboardStats has not been built yet (dataInsertion.py refreshes it after each load).
+        stats = computeStats(db[COMPACT_COLLECTION] if compact else allVideos(db), compact)
+    return stats
+
+# One query cache per app.py process, shared by every session.
+@st.cache_resource
+def get_query_cache():
+    return QueryCache()
+
+query_cache = get_query_cache()
+
+# One thread pool per app.py process runs the independent queries of a page at the same time (queryRunner.py).
+@st.cache_resource
+def get_query_runner():
+    return QueryRunner()
+
+query_runner = get_query_runner()
+# The reverse-related lookup is stopped by MongoDB if it runs longer than this.
+REVERSE_TIMEOUT = 5.0
+# Search-as-you-type lookups: results past this are dropped rather than holding the page.
+SEARCH_TIMEOUT = 2.0
+SEARCH_PAGE_SIZE = 20
+SEARCH_MODES = {"Prefix": "prefix", "Fuzzy": "fuzzy", "Full text": "text"}
+PAGE_SIZES = [25, 50, 100, 200]
+# Drops cached results if dataInsertion.py has loaded new data since they were stored.
+query_cache.checkGeneration(db)
+
+# Whether the UploaderSearch collection (searchIndex.py) has been built, re-checked once a minute.
+@st.cache_data(ttl=60)
+def search_index_ready(_db):
+    return searchReady(_db)
+
+# The snapshots the partitioned layout has loaded, newest last, re-read once a minute.
+@st.cache_data(ttl=60)
+def load_partitions(_db):
+    return listPartitions(_db)
+
+# The CrawlRuns report (crawlLog.py) only changes when the logs are re-parsed, so it is re-read every few minutes.
+@st.cache_data(ttl=300)
+def load_crawl_runs(_db):
+    return loadRuns(_db)
+
+# Rewrites metrics/app.prom at most every 30 seconds (the cached call is skipped in between).
+@st.cache_data(ttl=30)
+def flush_metrics():
+    return registry.flush()
+
+# Keyset paging (paging.py): a page is fetched from the last key of the page before it, so each session keeps the
+# start token of every page it has visited. Going back pops a token; a new query starts again from the first page.
+def result_pages(name, query_key):
+    state = st.session_state.setdefault(name, {"query": None, "starts": [None]})
+    if state["query"] != query_key:
+        state["query"] = query_key
+        state["starts"] = [None]
+    return state
+
+def page_buttons(name, state, next_token):
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("Previous", key=f"{name}_prev", disabled=len(state["starts"]) == 1):
+        state["starts"].pop()
+        st.rerun()
+    col_page.caption(f"page {len(state['starts'])}")
+    if col_next.button("Next", key=f"{name}_next", disabled=next_token is None):
+        state["starts"].append(next_token)
+        st.rerun()
+
+# One page of an uploader's videos (just the listed columns) and, side by side, how many videos it has.
+def show_uploader_videos(uploader):
+    page_size = st.selectbox("Videos per page", PAGE_SIZES, index=0, key="uploader_page_size")
+    state = result_pages("uploader_videos", (uploader, page_size, video_scope))
+    after = state["starts"][-1]
+    results = query_runner.gather({
+        "videos": lambda: query_cache.get("uploaderVideos", [video_scope, uploader, after, page_size],
+                                          lambda: pageUploaderVideos(video_collection, uploader, after, page_size, codec)),
+        "count": lambda: query_cache.get("uploaderCount", [video_scope, uploader], lambda: countUploaderVideos(db, video_collection, uploader, codec)),
+    })
+    if results["videos"]["error"]:
+        st.error(f"Uploader lookup failed: {results['videos']['error']}")
+        return False
+    (videos, next_token), cache_hit = results["videos"]["value"]
+    if not videos:
+        return False
+    total = results["count"]["value"][0] if not results["count"]["error"] else None
+    st.write(f"{uploader}: {total if total is not None else 'unknown number of'} videos")
+    st.write(f"Query time: {max(results['videos']['seconds'], results['count']['seconds']):.4f} seconds")
+    st.caption(query_cache.describe(cache_hit))
+    st.dataframe(pd.DataFrame(videos, columns=["videoID", "category", "snapshot", "views", "rating", "duration"]), hide_index=True)
+    page_buttons("uploader_videos", state, next_token)
+    return True
+
 # 2. UI SETUP AND NAVIGATION
 st.set_page_config(page_title="YouTube Data Analytics", layout="wide")
 st.title("YouTube Data Engine")
 
 # Sets up the main menu in the sidebar.
 st.sidebar.header("Menu")
-current_page = st.sidebar.radio("Select View:", ["Dashboard & Charts", "Search Videos", "Analytics"])
+current_page = st.sidebar.radio("Select View:", ["Dashboard & Charts", "Search Videos", "Analytics", "Trending", "Crawl Quality", "Performance"])
+
+# Partitioned layout: queries read the newest crawl unless the sidebar picks an older one or all of them,
+# which fans every query out over the partitions and merges the results.
+video_scope = None
+if video_schema == "partitioned":
+    partition_snapshots = load_partitions(db)
+    scope_label = st.sidebar.selectbox("Crawl snapshots:", ["Latest crawl", "All snapshots"] + partition_snapshots[::-1])
+    video_scope = {"Latest crawl": LATEST, "All snapshots": ALL}.get(scope_label, scope_label)
+    video_collection = routeVideos(db, video_scope, partition_snapshots)
+
+for missing_index in check_indexes(video_collection, video_schema, video_scope):
+    st.warning(f"Missing index on {video_collection.name} ({missing_index}); queries on it will scan the whole collection. Run dataInsertion.py to build it.")
 
 # 3. DASHBOARD MODULE (Data Visualization)
 if current_page == "Dashboard & Charts":
     st.header("Data Dashboard")
     
-    # Quick Metric: Total video count
-    total_videos = video_collection.count_documents({})
-    st.metric(label="Total Videos Loaded", value=f"{total_videos:,}")
-
-    # Chart 1: Category Counts
-    st.subheader("Distribution by Category")
-    start_time = perf_counter()
-    # MongoDB aggregation to count videos per category.
-    count_pipeline = [
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    category_data = list(video_collection.aggregate(count_pipeline))
-    end_time = perf_counter()
-    time = end_time - start_time
-    if category_data:
-        df_categories = pd.DataFrame(category_data)
-        df_categories.rename(columns={"_id": "Category", "count": "Count"}, inplace=True)
-        
-        # Bar chart visualization
-        st.bar_chart(df_categories.set_index("Category"))
-    else:
-        st.warning("No data found in MongoDB.")
-    st.write(f"time taken: {time}")
+    # Placeholders in page order. The stats document and the plot data are fetched at the same time
+    # and each placeholder is filled as soon as its query returns.
+    metric_slot = st.empty()
+    stats_slot = st.empty()
+    
     # Chart 2: Views vs Rating Scatter Plot
+    # The plot controls are read first so the plot query can start together with the stats query.
     st.subheader("Views vs. Rating")
-    st.write("Correlation between rating and view count (Uses a 1000-record sample)")
+    plot_mode = st.radio("Plot:", ["Random sample", "Density grid (all records)"], horizontal=True)
     
-    # Fetches a random sample for fast plotting.
-    sample_records = list(video_collection.find({}, {"views": 1, "rating": 1, "category": 1, "_id": 0}).limit(1000))
+    if plot_mode == "Random sample":
+        sample_size = st.slider("Sample size", min_value=100, max_value=20000, value=1000, step=100)
+        st.write(f"Correlation between rating and view count (Uses a {sample_size}-record random sample)")
+        # Fetches a random sample for fast plotting ($sample on the server).
+        plot_query = lambda: randomSample(video_collection, sample_size, codec is not None)
+    else:
+        view_bins = st.slider("Views resolution (bins)", min_value=10, max_value=100, value=40, step=5)
+        rating_bins = st.slider("Rating resolution (bins)", min_value=5, max_value=50, value=20, step=5)
+        st.write("Number of videos in each (rating, views) cell, counted over every record in MongoDB")
+        # Only the grid of counts is sent back, however many records are in the collection.
+        plot_query = lambda: densityGrid(video_collection, view_bins, rating_bins, codec is not None)
+    plot_slot = st.empty()
     
-    if sample_records:
-        df_scatter = pd.DataFrame(sample_records)
+    start_time = perf_counter()
+    stats_query = lambda: query_cache.get("dashboardStats", [video_schema], lambda: read_dashboard_stats(db, video_schema == "compact"))
+    for result in query_runner.stream({"stats": stats_query, "plot": plot_query}):
+        slot = stats_slot if result["name"] == "stats" else plot_slot
+        if result["error"]:
+            slot.error(f"{result['name']} query {'timed out' if result['timedOut'] else 'failed'}: {result['error']}")
+            continue
         
-        # Plots the scatter graph.
-        fig, ax = plt.subplots()
-        ax.scatter(df_scatter['rating'], df_scatter['views'], alpha=0.5, c='blue')
-        ax.set_xlabel("Rating")
-        ax.set_ylabel("Views")
-        st.pyplot(fig)
+        if result["name"] == "stats":
+            dashboard_stats = result["value"][0] or {}
+            # Quick Metric: Total video count
+            total_videos = dashboard_stats.get("total", 0)
+            metric_slot.metric(label="Total Videos Loaded", value=f"{total_videos:,}")
+            
+            with stats_slot.container():
+                # Chart 1: Category Counts
+                st.subheader("Distribution by Category")
+                # Category counts come from the DashboardStats document, already sorted by count.
+                category_data = dashboard_stats.get("categories", [])[:10]
+                if category_data:
+                    df_categories = pd.DataFrame(category_data)
+                    df_categories.rename(columns={"_id": "Category", "count": "Count"}, inplace=True)
+                    
+                    # Bar chart visualization
+                    st.bar_chart(df_categories.set_index("Category"))
+                else:
+                    st.warning("No data found in MongoDB.")
+                
+                # Videos per crawl snapshot
+                snapshot_data = dashboard_stats.get("snapshots", [])
+                if snapshot_data:
+                    st.subheader("Videos per Crawl Snapshot")
+                    df_snapshots = pd.DataFrame(snapshot_data)
+                    df_snapshots.rename(columns={"_id": "Snapshot", "count": "Count"}, inplace=True)
+                    st.line_chart(df_snapshots.set_index("Snapshot"))
+                if dashboard_stats.get("refreshed"):
+                    st.caption(f"Stats refreshed {dashboard_stats['refreshed']:%Y-%m-%d %H:%M}")
+                st.write(f"stats query time: {result['seconds']:.4f} seconds")
+        
+        elif plot_mode == "Random sample":
+            sample_records = result["value"]
+            if sample_records:
+                with plot_slot.container():
+                    df_scatter = pd.DataFrame(sample_records)
+                    
+                    # Plots the scatter graph.
+                    fig, ax = plt.subplots()
+                    ax.scatter(df_scatter['rating'], df_scatter['views'], alpha=0.5, c='blue')
+                    ax.set_xlabel("Rating")
+                    ax.set_ylabel("Views")
+                    st.pyplot(fig)
+                    st.write(f"plot query time: {result['seconds']:.4f} seconds")
+        else:
+            density = result["value"]
+            with plot_slot.container():
+                # Plots the density grid with a log colour scale (empty cells left blank); rating on x, log10(views + 1) on y.
+                fig, ax = plt.subplots()
+                views_min, views_max, rating_min, rating_max = gridExtent()
+                image = ax.imshow([[count or float("nan") for count in column] for column in zip(*density)], origin="lower", aspect="auto",
+                                  extent=[rating_min, rating_max, views_min, views_max], norm="log", cmap="viridis")
+                fig.colorbar(image, ax=ax, label="Videos")
+                ax.set_xlabel("Rating")
+                ax.set_ylabel("log10(Views + 1)")
+                st.pyplot(fig)
+                st.write(f"plot query time: {result['seconds']:.4f} seconds")
+    time = perf_counter() - start_time
+    # With both queries in flight together the page waits for the slower one, not the sum of both.
+    st.write(f"dashboard query time: {time:.4f} seconds")
         
 # 4. SEARCH MODULE (Interactive Query)
 elif current_page == "Search Videos":
@@ -92,13 +300,21 @@ elif current_page == "Search Videos":
         video_id_input = st.text_input("Enter Video ID (e.g., yZIkFwxLUeU)")
         if st.button("Search Video"):
             start_time = perf_counter();
-            # Queries MongoDB for a single video record.
-            record_result = video_collection.find_one({"videoID": video_id_input.strip()})
+            # The video record (or a cached copy) and its view history across crawls are fetched at the same time.
+            video_id = normalizeID(video_id_input)
+            results = query_runner.gather({
+                "video": lambda: query_cache.get("video", [video_scope, video_id], lambda: findVideo(video_collection, video_id, codec)),
+                "history": lambda: videoHistory(db, video_id),
+            })
             end_time = perf_counter();
             time = end_time - start_time;
-            if record_result:
+            record_result, cache_hit = results["video"]["value"] or (None, False)
+            if results["video"]["error"]:
+                st.error(f"Video lookup failed: {results['video']['error']}")
+            elif record_result:
                 st.success(f"Record Found: {record_result.get('videoID')}")
-                st.success(f"Time taken: {time}")
+                st.success(f"Query time: {time:.4f} seconds")
+                st.caption(query_cache.describe(cache_hit))
                 # Prepares data for a clean table display.
                 display_data = {
                     "Metric": ["Uploader", "Category", "Duration (sec)", "Views", "Rating", "Related Videos Count"],
@@ -116,31 +332,64 @@ elif current_page == "Search Videos":
                 df_friendly = pd.DataFrame(display_data)
                 st.table(df_friendly.set_index('Metric'))
                 
+                # Views of the video in every crawl that saw it.
+                history = results["history"]["value"]
+                if history and len(history) > 1:
+                    st.line_chart(pd.DataFrame(history).set_index("d")[["views"]])
+                
                 # Shows related IDs in a collapsible section.
                 with st.expander("View Full List of Related Video IDs"):
                     st.write(", ".join(record_result.get('related', [])))
 
             else:
                 st.error("Video ID not found in the database.")
+                # A partial or mistyped ID: offer the IDs that start with what was typed.
+                suggestions = searchVideoIDs(video_collection, video_id, 10, compact=codec is not None)
+                if suggestions:
+                    st.write("Video IDs starting with that: " + ", ".join(suggestions))
                 
     elif search_criteria == "Uploader Name":
-        uploader_input = st.text_input("Enter Uploader Name")
-        if st.button("Search Uploader"):
-            start_time = perf_counter();
-            # Queries MongoDB for multiple videos by the uploader (limited to 5).
-            uploader_results = list(video_collection.find({"uploader": uploader_input.strip()}).limit(5))
-            end_time = perf_counter();
-            time = end_time-start_time;
-            if uploader_results:
-                st.write(f"Found {len(uploader_results)} videos (showing top 5):")
-                st.write(f"Time taken: {time}");
-                # Iterates and displays results in expandable sections.
-                for video in uploader_results:
-                    with st.expander(f"{video.get('category')} - {video.get('videoID')}"):
-                        st.write(f"Views: {video.get('views')}")
-                        st.write(f"Rating: {video.get('rating')}")
-                        st.write(f"Related Videos: {video.get('related')}")
-            else:
+        if search_index_ready(db):
+            # Matches come from UploaderSearch (searchIndex.py): prefix of the case-insensitive name,
+            # trigram similarity for misspellings, or a full-text search over names and categories.
+            search_mode = st.radio("Match:", list(SEARCH_MODES), horizontal=True)
+            uploader_input = st.text_input("Enter Uploader Name (or part of it)")
+            search_page = st.number_input("Results page", min_value=1, value=1, step=1, key="uploader_page") - 1
+            search_text = normalizeUploader(uploader_input)
+            if search_text:
+                mode = SEARCH_MODES[search_mode]
+                start_time = perf_counter();
+                results = query_runner.gather({
+                    "matches": lambda: query_cache.get("uploaderSearch", [mode, search_text, search_page],
+                                                       lambda: searchUploaders(db, search_text, mode, search_page, SEARCH_PAGE_SIZE)),
+                }, SEARCH_TIMEOUT)
+                end_time = perf_counter();
+                time = end_time - start_time;
+                if results["matches"]["error"]:
+                    st.error(f"Uploader search failed: {results['matches']['error']}")
+                else:
+                    (matches, has_more), cache_hit = results["matches"]["value"]
+                    if matches:
+                        first = search_page * SEARCH_PAGE_SIZE + 1
+                        st.write(f"Uploaders {first}-{first + len(matches) - 1}{' (more on the next page)' if has_more else ''}")
+                        st.write(f"Query time: {time:.4f} seconds");
+                        st.caption(query_cache.describe(cache_hit))
+                        df_matches = pd.DataFrame(matches)
+                        df_matches["categories"] = df_matches["categories"].apply(", ".join)
+                        st.dataframe(df_matches, use_container_width=True, hide_index=True)
+                        # Videos of the chosen uploader, found by its exact name on the (uploader, videoID) index.
+                        show_uploader_videos(st.selectbox("Show videos of", [match["name"] for match in matches]))
+                    elif search_page:
+                        st.info("No more results.")
+                    else:
+                        st.error("No uploader matches that. Try Fuzzy for misspelled names.")
+        else:
+            st.info("Uploader search index not built yet (run dataInsertion.py or searchIndex.py); only exact names are found.")
+            uploader_input = st.text_input("Enter Uploader Name")
+            if st.button("Search Uploader"):
+                # Remembered for this session so the Previous/Next buttons keep showing the same uploader.
+                st.session_state["exact_uploader"] = normalizeUploader(uploader_input)
+            if st.session_state.get("exact_uploader") and not show_uploader_videos(st.session_state["exact_uploader"]):
                 st.error("Uploader not found.")
 
 # 5. SPARK ANALYTICS MODULE (Scalable Processing)
@@ -151,24 +400,208 @@ elif current_page == "Analytics":
     st.subheader("Algorithm: Reverse Related Search")
     target_id = st.text_input("Enter Target Video ID to find videos that reference it", "yZIkFwxLUeU")
     
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
     if st.button("Run Reverse Index Check"):
-        # Queries Mongo using the 'related' array index. This mimics the core MapReduce logic 
-        # (finding all records that point to a specific key).
-        start_time = perf_counter();
-        pointing_to_me = list(video_collection.find({"related": target_id}))
-        end_time = perf_counter();
-        time = end_time-start_time;
-        if pointing_to_me:
-            st.write(f"Found {len(pointing_to_me)} videos that recommend **{target_id}**:")
-            
-            # Displays results in a simple table.
-            df_related = pd.DataFrame(pointing_to_me)
-            st.dataframe(df_related[['videoID', 'uploader', 'category']])
+        # Remembered for this session so the Previous/Next buttons keep paging the same target.
+        st.session_state["reverse_target"] = normalizeID(target_id)
+    reverse_target = st.session_state.get("reverse_target")
+    reverse_count_slot = st.empty()
+    reverse_slot = st.empty()
+    
+    # Graph metrics computed offline over the whole related-video network (graphAnalytics.py).
+    st.subheader("Algorithm: Related-Video Graph")
+    node_slot = st.empty()
+    top_slot = st.empty()
+    
+    target = normalizeID(target_id)
+    queries = {
+        "node": lambda: graphStats(db, target),
+        "top": lambda: topPageRank(db, 25),
+    }
+    if reverse_target:
+        # One page of referrers (videoID/uploader/category only), read in videoID order from the last ID of the page before.
+        # The total comes separately from the count the RelatedBy map/reduce job (relatedIndex.py) stores per video.
+        reverse_pages = result_pages("reverse", (reverse_target, page_size, video_scope))
+        after = reverse_pages["starts"][-1]
+        queries["reverse"] = lambda: query_cache.get("reverse", [video_scope, reverse_target, after, page_size],
+                                                     lambda: findReverseRelated(db, video_collection, reverse_target, after, page_size, codec))
+        queries["reverseCount"] = lambda: query_cache.get("reverseCount", [video_scope, reverse_target],
+                                                          lambda: countReverseRelated(db, video_collection, reverse_target, codec))
+    
+    # All of them run together; the reverse lookup is stopped by MongoDB after REVERSE_TIMEOUT seconds
+    # so a slow lookup cannot hold up the graph metrics.
+    for result in query_runner.stream(queries, timeout=REVERSE_TIMEOUT):
+        if result["name"] == "reverseCount":
+            if not result["error"]:
+                total_referrers = result["value"][0]
+                pages = max(1, -(-total_referrers // page_size))
+                reverse_count_slot.write(f"{total_referrers:,} videos recommend **{reverse_target}** ({pages:,} pages of {page_size})")
+        elif result["name"] == "reverse":
+            with reverse_slot.container():
+                if result["timedOut"]:
+                    st.warning(f"The reverse lookup for {reverse_target} was cancelled after {REVERSE_TIMEOUT:g} seconds.")
+                elif result["error"]:
+                    st.error(f"Reverse lookup failed: {result['error']}")
+                else:
+                    (page_records, next_token), cache_hit = result["value"]
+                    if page_records:
+                        # Displays results in a simple table.
+                        df_related = pd.DataFrame(page_records, columns=['videoID', 'uploader', 'category'])
+                        st.dataframe(df_related)
+                        page_buttons("reverse", reverse_pages, next_token)
+                    else:
+                        st.warning(f"No videos found that list {reverse_target} as related.")
+                    st.write(f"query time: {result['seconds']:.4f} seconds")
+                    st.caption(query_cache.describe(cache_hit))
+        
+        elif result["error"]:
+            (node_slot if result["name"] == "node" else top_slot).error(f"Graph query failed: {result['error']}")
+        
+        elif result["name"] == "node":
+            node_stats = result["value"]
+            if node_stats:
+                col_rank, col_in, col_out, col_component = node_slot.container().columns(4)
+                col_rank.metric("PageRank", f"{node_stats['pagerank']:.3e}")
+                col_in.metric("In-degree", node_stats['inDegree'])
+                col_out.metric("Out-degree", node_stats['outDegree'])
+                col_component.metric("Component size", f"{node_stats['componentSize']:,}")
+            else:
+                node_slot.info(f"No graph metrics for {target_id}. Run graphAnalytics.py to compute them.")
+        
+        else:
+            top_ranked = result["value"]
+            if top_ranked:
+                with top_slot.container():
+                    st.write("Most central videos by PageRank:")
+                    st.dataframe(pd.DataFrame(top_ranked, columns=["videoID", "pagerank", "inDegree", "outDegree", "componentSize"]))
+
+
+# 6. TRENDING MODULE (Views per day across crawl snapshots)
+elif current_page == "Trending":
+    st.header("Trending Videos")
+    st.write("Videos ranked by views gained per day between the crawls that saw them (computed at ingestion).")
+    
+    trend_category = st.text_input("Category filter (optional)")
+    trend_limit = st.slider("Number of videos", min_value=10, max_value=200, value=25, step=5)
+    
+    start_time = perf_counter();
+    trending = topTrending(db, trend_limit, trend_category.strip() or None)
+    end_time = perf_counter();
+    time = end_time-start_time;
+    if trending:
+        df_trending = pd.DataFrame(trending, columns=["videoID", "uploader", "category", "viewsPerDay", "views", "observations", "firstSeen", "lastSeen"])
+        st.dataframe(df_trending)
+        
+        # Views of one of the listed videos over every crawl that saw it.
+        history_id = st.selectbox("Show view history for", df_trending["videoID"])
+        history = videoHistory(db, history_id)
+        if history:
+            df_history = pd.DataFrame(history)
+            st.line_chart(df_history.set_index("d")[["views"]])
+    else:
+        st.warning("No trend data found. Run dataInsertion.py to build it.")
+    st.write(f"query time: {time:.4f} seconds")
+
+# 7. CRAWL QUALITY MODULE (log.txt of every crawl, checked against its depth files)
+elif current_page == "Crawl Quality":
+    st.header("Crawl Quality")
+    st.write("Crawl speed from each snapshot's log.txt, checked against the rows in its depth files and what cleansing kept.")
+    
+    start_time = perf_counter();
+    crawl_runs = load_crawl_runs(db)
+    end_time = perf_counter();
+    time = end_time-start_time;
+    if crawl_runs:
+        flagged = [run for run in crawl_runs if run["flags"]]
+        col_runs, col_flagged, col_videos = st.columns(3)
+        col_runs.metric("Crawls", len(crawl_runs))
+        col_flagged.metric("Crawls with problems", len(flagged))
+        col_videos.metric("Videos logged", f"{sum(run['videos'] or 0 for run in crawl_runs):,}")
+        
+        # One row per crawl, with the videos/sec of every depth side by side.
+        df_runs = pd.DataFrame([{
+            "snapshot": run["_id"],
+            "start": run["start"],
+            "hours": round(run["wallSeconds"] / 3600, 1) if run["wallSeconds"] is not None else None,
+            "videos": run["videos"],
+            "videos/sec": run["videosPerSec"],
+            **{f"depth {check['depth']} videos/sec": check["videosPerSec"] for check in run["depths"]},
+            "depth files": ", ".join(map(str, run["depthFiles"])),
+            "reject rate": run["rejectRate"],
+            "problems": "; ".join(run["flags"]),
+        } for run in crawl_runs])
+        st.dataframe(df_runs, hide_index=True)
+        
+        st.subheader("Videos/sec by depth")
+        speeds = df_runs.set_index("snapshot")[[column for column in df_runs.columns if column.startswith("depth ") and column.endswith("videos/sec")]]
+        st.line_chart(speeds)
+        
+        st.subheader("Reject rate per crawl")
+        rejects = df_runs.set_index("snapshot")["reject rate"].dropna()
+        if len(rejects):
+            st.bar_chart(rejects)
         else:
-            st.warning(f"No videos found that list {target_id} as related.")
-        st.write(f"time taken: {time}")
+            st.info("No cleansing manifest was found when the logs were parsed; run dataCleansing.py, then crawlLog.py.")
+        
+        for run in flagged:
+            st.warning(f"{run['_id']}: {'; '.join(run['flags'])}")
+        
+        # Logged videos against the rows found in each depth file of one crawl.
+        chosen_run = st.selectbox("Depth files of", [run["_id"] for run in crawl_runs])
+        run = next(run for run in crawl_runs if run["_id"] == chosen_run)
+        st.dataframe(pd.DataFrame(run["depths"], columns=["depth", "videos", "seconds", "videosPerSec", "file", "lines", "rows", "rejected", "rejectRate", "status"]), hide_index=True)
+    else:
+        st.warning("No crawl logs parsed yet. Run crawlLog.py.")
+    st.write(f"query time: {time:.4f} seconds")
 
+# 8. PERFORMANCE MODULE (MongoDB command monitoring)
+elif current_page == "Performance":
+    st.header("Performance")
+    st.write("Every MongoDB command this app.py process has sent, and the slowest recent ones with their query plans.")
+    
+    command_monitor.slowMs = st.number_input("Slow query threshold (ms)", min_value=1, value=int(command_monitor.slowMs), step=10)
+    
+    # Time of the last run of every page, split into MongoDB time and everything else (Python and rendering).
+    page_times = {}
+    for labels, value in registry.series("page_seconds"):
+        page_times.setdefault(labels["page"], {})[labels["part"]] = round(value * 1000, 1)
+    if page_times:
+        st.subheader("Last run of each page (ms)")
+        st.dataframe(pd.DataFrame.from_dict(page_times, orient="index", columns=["total", "mongodb", "render"]))
+    
+    st.subheader("Commands by collection")
+    command_stats = commandTable()
+    if command_stats:
+        st.dataframe(pd.DataFrame(command_stats))
+    
+    st.subheader("Recent slow queries")
+    slow_queries = command_monitor.recentSlow()
+    if slow_queries:
+        df_slow = pd.DataFrame(slow_queries, columns=["time", "command", "collection", "ms", "docs", "bytes"])
+        st.dataframe(df_slow)
+        explainable = [number for number, entry in enumerate(slow_queries) if entry["query"]]
+        if explainable:
+            chosen = st.selectbox("Explain query", explainable,
+                                  format_func=lambda number: f"{slow_queries[number]['time']:%H:%M:%S} {slow_queries[number]['command']} {slow_queries[number]['collection']} ({slow_queries[number]['ms']} ms)")
+            # Asks MongoDB which plan it picks for the query (the query itself is not run again).
+            try:
+                plan = explain(mongo_client, slow_queries[chosen])
+                st.write(f"Winning plan: {planSummary(plan)}")
+                with st.expander("Full explain() output"):
+                    st.json(plan.get("queryPlanner", plan), expanded=False)
+            except Exception as e:
+                st.error(f"explain failed: {e}")
+    else:
+        st.info(f"No command has taken longer than {command_monitor.slowMs} ms yet.")
 
+# Splits this run of the page into time spent waiting for MongoDB and time spent building the page.
+page_time = perf_counter() - page_start
+mongo_time, mongo_commands = command_monitor.runTime()
+registry.set("page_seconds", page_time, page=current_page, part="total")
+registry.set("page_seconds", mongo_time, page=current_page, part="mongodb")
+registry.set("page_seconds", page_time - mongo_time, page=current_page, part="render")
+st.sidebar.caption(f"page {page_time * 1000:,.0f} ms · MongoDB {mongo_time * 1000:,.0f} ms in {mongo_commands} commands · render {(page_time - mongo_time) * 1000:,.0f} ms")
+flush_metrics()
 
 """ 
 Pseudocode:
@@ -178,7 +611,7 @@ BEGIN PROGRAM
 1. CONNECT TO DATABASE
    FUNCTION connect_to_database():
        TRY
-           connect to MongoDB at localhost:27017
+           connect to MongoDB at localhost:27017 with the command monitor attached
            run ping command to verify connection
            RETURN database client
        CATCH error
@@ -191,46 +624,51 @@ BEGIN PROGRAM
        stop program
    ELSE:
        db = mongo_client["YoutubeData"]
-       video_collection = db["Video"]
+       IF the last load used the compact schema (Meta "videoSchema"):
+           video_collection = db["VideoCompact"], read through a codec that turns
+           category/uploader codes, short field names and per-snapshot observations
+           back into Video documents (compactSchema.py)
+       ELSE IF it used the partitioned layout (one Video_<snapshot> collection per crawl, partitions.py):
+           video_collection is chosen after the page setup by the sidebar "Crawl snapshots" box:
+               Latest crawl (default) -> the newest partition
+               a snapshot date        -> that crawl's partition
+               All snapshots          -> every partition, finds merged in key order and aggregations run with $unionWith
+           the snapshot choice is part of every cached query key and resets the result pages
+       ELSE:
+           video_collection = db["Video"]
 
 2. SETUP USER INTERFACE
    configure page with title "YouTube Data Analytics"
    show main title "YouTube Data Engine (Milestone 4)"
 
    sidebar menu:
-       options = ["Dashboard & Charts", "Search Videos", "Scalable Analytics"]
+       options = ["Dashboard & Charts", "Search Videos", "Analytics", "Trending", "Crawl Quality", "Performance"]
        current_page = user selection
 
 3. DASHBOARD & CHARTS MODULE
    IF current_page == "Dashboard & Charts":
        show header "Data Dashboard"
-
-       // Metric: total videos
-       total_videos = count all documents in video_collection
-       display metric "Total Videos Loaded" = total_videos
-
-       // Chart 1: Category Counts
-       run aggregation pipeline:
-           group by category, count videos
-           sort by count descending
-           limit to top 10
-       category_data = results
-
-       IF category_data not empty:
-           convert to table (Category, Count)
-           show bar chart of counts per category
-       ELSE:
-           show warning "No data found"
-
-       // Chart 2: Views vs Rating Scatter Plot
-       show subheader "Views vs Rating"
-       explain correlation plot
-
-       sample_records = fetch up to 1000 documents with fields (views, rating, category)
-       IF sample_records not empty:
-           convert to table
-           plot scatter chart: x=rating, y=views
-           show chart
+       make empty placeholders for the metric, the stats charts and the plot
+
+       read plot mode ("Random sample" or "Density grid") and its sliders
+       plot_query = $sample of N documents with fields (views, rating, category)
+                    OR count documents per (rating bin, log views bin) on the server
+
+       run together on the query thread pool (queryRunner.py), each with a timeout:
+           stats = DashboardStats document (kept in the query cache until the next load)
+           plot data = plot_query
+       AS EACH query finishes:
+           IF it failed or timed out: show the error in its placeholder
+           IF stats:
+               fill metric "Total Videos Loaded" = stats.total
+               IF stats.categories not empty:
+                   show bar chart of the 10 largest categories
+               ELSE:
+                   show warning "No data found"
+               show line chart of videos per crawl snapshot
+           IF plot data:
+               plot scatter chart (x=rating, y=views) OR the grid as a heat map
+       show the dashboard query time (the slower of the two queries, not their sum)
 
 4. SEARCH VIDEOS MODULE
    ELSE IF current_page == "Search Videos":
@@ -241,44 +679,99 @@ BEGIN PROGRAM
        IF search_criteria == "Video ID":
            video_id_input = user text input
            IF user clicks "Search Video":
-               record_result = find one document where videoID = input
+               run together: record_result = find one document where videoID = input (or the cached copy)
+                             history = every crawl observation of the video (VideoSeries)
                IF record_result exists:
                    show success message
                    prepare table with metrics:
                        uploader, category, duration, views, rating, related count
                    display table
+                   IF seen in more than one crawl: plot views per crawl
                    expandable section: show list of related video IDs
                ELSE:
                    show error "Video ID not found"
+                   show up to 10 video IDs starting with the input
 
        ELSE IF search_criteria == "Uploader Name":
-           uploader_input = user text input
-           IF user clicks "Search Uploader":
-               uploader_results = find up to 5 documents where uploader = input
-               IF results exist:
-                   show message "Found N videos"
-                   FOR each video in results:
-                       expandable section with:
-                           category + videoID
-                           views, rating, related videos
+           IF the UploaderSearch collection exists (searchIndex.py):
+               match = user chooses ["Prefix", "Fuzzy", "Full text"]; uploader_input = user text input; page
+               matches = one page of uploaders (or the cached page), stopped after 2 seconds:
+                   Prefix: lowercase name starts with input, in name order
+                   Fuzzy: names sharing enough trigrams with input, most similar first
+                   Full text: text search over names and categories, best score first
+               IF matches exist:
+                   show table of name, videos, views, categories (and similarity)
+                   uploader = user picks one of the matches
+                   show_uploader_videos(uploader)
                ELSE:
-                   show error "Uploader not found"
+                   show error "No uploader matches"
+           ELSE:
+               IF user clicks "Search Uploader": remember the input for this session
+               show_uploader_videos(remembered uploader), or error "Uploader not found"
+
+       show_uploader_videos(uploader):
+           run together: one page of the uploader's videos in videoID order, after the last ID of the previous page
+                         (only videoID, category, snapshot, views, rating, duration)
+                         the uploader's video count (from UploaderSearch, else counted on the index)
+           show the count and the page as a table, with Previous / Next buttons
 
-5. SCALABLE ANALYTICS MODULE
-   ELSE IF current_page == "Scalable Analytics":
-       show header "Scalable Data Processing"
-       show info message about MapReduce-like query
+5. ANALYTICS MODULE
+   ELSE IF current_page == "Analytics":
+       show header "Data Processing"
 
        show subheader "Reverse Related Search"
        target_id = user text input (default example ID)
-
-       IF user clicks "Run Reverse Index Check":
-           pointing_to_me = find all documents where 'related' array contains target_id
-           IF results exist:
-               show message "Found N videos that recommend target_id"
-               convert results to table with columns (videoID, uploader, category)
-               display table
-           ELSE:
-               show warning "No videos found that list target_id"
+       make placeholders for the reverse lookup, the node's graph metrics and the PageRank table
+
+       run together on the query thread pool, stopped by MongoDB after REVERSE_TIMEOUT seconds:
+           node_stats = GraphStats document for target_id
+           top_ranked = 25 GraphStats documents with the highest PageRank
+           IF a target was submitted with "Run Reverse Index Check" (remembered for the session):
+               referrers = one page of rows size 25/50/100/200 (videoID, uploader, category) of the videos
+                           whose related list holds target_id, in videoID order after the previous page's last ID
+                           (compact schema: that page of the RelatedBy referrer list), or the cached copy
+               total = count stored in the RelatedBy document for target_id
+       AS EACH query finishes:
+           total: show "N videos recommend target_id (P pages)"
+           reverse lookup: IF timed out show "cancelled"; ELSE IF referrers exist:
+               display table (videoID, uploader, category) with Previous / Next buttons
+           ELSE show warning "No videos found that list target_id"
+           node_stats: show PageRank, in-degree, out-degree and component size
+           top_ranked: show table of the most central videos
+
+6. TRENDING MODULE
+   ELSE IF current_page == "Trending":
+       read optional category filter and number of videos
+       trending = top VideoTrend documents sorted by viewsPerDay
+       IF results exist:
+           show table of videoID, uploader, category, viewsPerDay, views, crawl dates
+           user picks one video: plot its views from every VideoSeries bucket
+       ELSE:
+           show warning "No trend data found"
+
+7. CRAWL QUALITY MODULE
+   ELSE IF current_page == "Crawl Quality":
+       crawl_runs = every CrawlRuns document (crawlLog.py), re-read every 5 minutes
+       IF runs exist:
+           show number of crawls, crawls with problems and videos logged
+           show table: snapshot, start, hours, videos, videos/sec (overall and per depth), depth files, reject rate, problems
+           plot videos/sec per depth across snapshots and the reject rate per crawl
+           show a warning for every crawl with problems (truncated/missing files, slow depths, stalls, high reject rate)
+           user picks a crawl: show logged videos vs. file lines vs. kept/rejected rows per depth
+       ELSE:
+           show warning "No crawl logs parsed yet"
+
+8. PERFORMANCE MODULE
+   ELSE IF current_page == "Performance":
+       (every command goes through a CommandMonitor registered on the client, see instrumentation.py)
+       show last total / MongoDB / render time of every page
+       show count, mean and max time, documents and bytes per (command, collection)
+       show the most recent commands slower than the threshold
+       user picks one: run explain (queryPlanner) on it and show the winning plan
+
+9. AFTER EVERY PAGE
+   page time = time since the run started, MongoDB time = time of this run's commands
+   show both (and the render time in between) in the sidebar
+   rewrite metrics/app.prom at most every 30 seconds
 
 END PROGRAM """
\ No newline at end of file
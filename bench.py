@@ -0,0 +1,253 @@
+# Benchmark suite: builds a synthetic crawl in the allData TSV format, then times cleansing, ingestion, the derived collections
+# and every query that app.py and run_mongo_checks.py run. Prints (and optionally saves) a JSON report with p50/p95/p99
+# latencies and throughput so runs can be compared. Runs against a real mongod or, with --backend mongomock, in-process.
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+from math import ceil, gcd
+from time import perf_counter
+
+import dataCleansing
+import dataInsertion
+from dashboardStats import refreshStats, loadStats
+from queries import findVideo, findUploaderVideos, findReverseRelated, countReverseRelated
+from relatedIndex import buildRelatedBy
+from searchIndex import buildSearchIndex, searchUploaders
+from sampling import randomSample, densityGrid
+from timeSeries import buildTimeSeries, topTrending
+from run_mongo_checks import CHECKS
+
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+CATEGORIES = ["Music", "Entertainment", "Comedy", "People & Blogs", "Film & Animation", "Sports", "News & Politics",
+              "Gadgets & Games", "Howto & DIY", "Autos & Vehicles", "Travel & Places", "Pets & Animals", "UNA"]
+DEPTH_SHARE = [0.01, 0.1, 0.89] # share of a snapshot's rows at BFS depth 0, 1, 2
+REJECT_RATE = 0.002 # share of truncated rows, which cleanRow rejects
+BENCH_DATABASE = "YoutubeDataBench"
+FIRST_SNAPSHOT = date(2008, 4, 1)
+
+# 1. SYNTHETIC CRAWL
+
+def videoID(number):
+    # Deterministic 11 character ID for a video number (odd multiplier mod 2^64, so every number gets its own ID).
+    mixed = (number * 0x9E3779B97F4A7C15 + 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF
+    chars = []
+    for _ in range(11):
+        chars.append(ID_ALPHABET[mixed & 63])
+        mixed >>= 6
+    return "".join(chars)
+
+def videoTraits(number):
+    # Per-video values that stay the same across snapshots.
+    h = (number * 2654435761) & 0xFFFFFFFF
+    return {
+        "uploader": f"user{h % 5000:04d}",
+        "age": 300 + h % 900,
+        "category": CATEGORIES[h % len(CATEGORIES)],
+        "duration": 30 + h % 600,
+        "views": h % 200000,
+        "growth": h % 800,
+    }
+
+def generateCrawl(dataDir, rows, snapshots, seed=42):
+    # Writes dataDir/<YYMMDD>/<YYMMDD>/{0,1,2}.txt plus log.txt. The same videos reappear across snapshots
+    # with growing view counts, and related IDs favour low video numbers so some videos are very popular.
+    rng = random.Random(seed)
+    perSnapshot = max(1, rows // snapshots)
+    pool = max(perSnapshot + 1, perSnapshot * 3 // 2)
+    written = 0
+    for index in range(snapshots):
+        snapshot = (FIRST_SNAPSHOT + timedelta(days=2 * index)).strftime("%y%m%d") # a crawl every other day
+        folder = os.path.join(dataDir, snapshot, snapshot)
+        os.makedirs(folder, exist_ok=True)
+        # An affine permutation of the pool picks distinct videos without keeping a list of them.
+        step = rng.randrange(1, pool)
+        while gcd(step, pool) != 1:
+            step = rng.randrange(1, pool)
+        offset = rng.randrange(pool)
+        position = 0
+        counts = []
+        for depth, share in enumerate(DEPTH_SHARE):
+            depthRows = perSnapshot - position if depth == len(DEPTH_SHARE) - 1 else max(1, ceil(perSnapshot * share))
+            with open(os.path.join(folder, f"{depth}.txt"), "w", encoding="utf-8", buffering=1 << 20) as out:
+                for _ in range(depthRows):
+                    number = (step * position + offset) % pool
+                    position += 1
+                    traits = videoTraits(number)
+                    related = [videoID(int(pool * rng.random() ** 3)) for _ in range(rng.randint(0, 20))]
+                    fields = [videoID(number), traits["uploader"], str(traits["age"]), traits["category"],
+                              str(traits["duration"]), str(traits["views"] + traits["growth"] * index),
+                              f"{rng.uniform(0, 5):.2f}", str(rng.randint(0, 3000)), str(rng.randint(0, 3000))] + related
+                    if rng.random() < REJECT_RATE:
+                        fields = fields[:5]
+                    out.write("\t".join(fields) + "\n")
+            counts.append(depthRows)
+        with open(os.path.join(folder, "log.txt"), "w", encoding="utf-8") as log:
+            log.write("BFS crawl\n\nvideo ID, uploader, age, category, length, views, rate, ratings, comments, related ID\n\n")
+            log.write(f"start:  {snapshot} 00:00:00\nfinish: {snapshot} 01:00:00\n\ndepth\tvideo\ttime\n")
+            for depth, count in enumerate(counts):
+                log.write(f"{depth}\t{count}\t{max(1, count // 50)}\n")
+            log.write(f"total\t{sum(counts)}\t{sum(max(1, count // 50) for count in counts)}\n")
+        written += sum(counts)
+    return written
+
+# 2. TIMING HELPERS
+
+def percentile(sortedValues, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not sortedValues:
+        return None
+    return sortedValues[min(len(sortedValues) - 1, max(0, ceil(fraction * len(sortedValues)) - 1))]
+
+def latencySummary(samples):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "meanMs": round(1000 * total / len(ordered), 4),
+        "p50Ms": round(1000 * percentile(ordered, 0.50), 4),
+        "p95Ms": round(1000 * percentile(ordered, 0.95), 4),
+        "p99Ms": round(1000 * percentile(ordered, 0.99), 4),
+        "opsPerSec": round(len(ordered) / total, 2) if total else None,
+    }
+
+def timeStage(name, action, units=None):
+    # Runs one pipeline stage. Stages the backend cannot run (mongomock lacks some server features) are reported as skipped.
+    start_time = perf_counter()
+    try:
+        count = action()
+    except Exception as e:
+        print(f"{name}: skipped ({type(e).__name__}: {e})")
+        return {"skipped": f"{type(e).__name__}: {e}"}
+    seconds = perf_counter() - start_time
+    result = {"seconds": round(seconds, 4)}
+    if units:
+        result[units] = count
+        result[f"{units}PerSec"] = round(count / seconds, 2) if seconds else None
+    print(f"{name}: {result}")
+    return result
+
+# 3. QUERIES (the same calls app.py and run_mongo_checks.py make)
+
+def queryPlan(db, pool, rng):
+    collection = db["Video"]
+    randomID = lambda: videoID(rng.randrange(pool))
+    popularID = lambda: videoID(int(pool * rng.random() ** 3))
+    randomUploader = lambda: f"user{rng.randrange(5000):04d}"
+    # The run_mongo_checks.py checks are the ones it runs after a load (on its fixed video and uploader).
+    checks = {f"checks.{name}": (lambda check=check: check(collection)) for name, check in CHECKS.items()}
+    return {
+        "app.dashboardStats": lambda: loadStats(db),
+        "app.randomSample": lambda: randomSample(collection, 1000),
+        "app.densityGrid": lambda: densityGrid(collection),
+        "app.findVideo": lambda: findVideo(collection, randomID()),
+        "app.findUploaderVideos": lambda: findUploaderVideos(collection, randomUploader()),
+        "app.searchPrefix": lambda: searchUploaders(db, randomUploader()[:6], "prefix"),
+        "app.searchFuzzy": lambda: searchUploaders(db, randomUploader().replace("user", "usr"), "fuzzy"),
+        "app.searchText": lambda: searchUploaders(db, rng.choice(CATEGORIES).split()[0], "text"),
+        "app.reverseRelated": lambda: findReverseRelated(db, collection, popularID()),
+        "app.reverseCount": lambda: countReverseRelated(db, collection, popularID()),
+        "app.topTrending": lambda: topTrending(db),
+        **checks,
+    }
+
+def runQueries(db, pool, repeat, seed=42):
+    rng = random.Random(seed)
+    results = {}
+    for name, query in queryPlan(db, pool, rng).items():
+        samples = []
+        try:
+            for _ in range(repeat):
+                start_time = perf_counter()
+                query()
+                samples.append(perf_counter() - start_time)
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"{name}: skipped ({type(e).__name__}: {e})")
+            continue
+        results[name] = latencySummary(samples)
+        print(f"{name}: {results[name]}")
+    return results
+
+# 4. DRIVER
+
+def connect(backend, uri):
+    if backend == "mongomock":
+        # In-process stand-in for quick runs without a server (pip install mongomock).
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    return MongoClient(uri)
+
+def runBenchmark(rows, snapshots, backend, uri, repeat, workers=None, writers=dataInsertion.WRITERS,
+                 batchSize=dataInsertion.BATCH_SIZE, workDir=None, seed=42):
+    keep = workDir is not None
+    workDir = workDir or tempfile.mkdtemp(prefix="fresh-mongos-bench-")
+    dataDir, cleanDir = os.path.join(workDir, "allData"), os.path.join(workDir, "cleanData")
+    client = connect(backend, uri)
+    db = client[BENCH_DATABASE]
+    report = {"config": {"rows": rows, "snapshots": snapshots, "backend": backend, "repeat": repeat,
+                         "workers": workers or os.cpu_count(), "writers": writers, "batchSize": batchSize, "seed": seed},
+              "stages": {}}
+    stages = report["stages"]
+    try:
+        stages["generate"] = timeStage("generate", lambda: generateCrawl(dataDir, rows, snapshots, seed), "rows")
+        stages["cleanse"] = timeStage("cleanse", lambda: dataCleansing.cleanAll(dataDir, cleanDir, workers, force=True)["rows"], "rows")
+        shards = [name for name in sorted(os.listdir(cleanDir)) if not name.startswith("_")]
+        jsonPaths = [os.path.join(cleanDir, name) for name in shards]
+        stages["ingest"] = timeStage("ingest", lambda: dataInsertion.main(shards, batchSize, writers, client=client, database=BENCH_DATABASE,
+                                                                          cleanDir=cleanDir, derived=False)["documents"], "documents")
+        stages["relatedBy"] = timeStage("relatedBy", lambda: buildRelatedBy(db, jsonPaths, workers, rebuild=True))
+        stages["timeSeries"] = timeStage("timeSeries", lambda: buildTimeSeries(db, jsonPaths, rebuild=True))
+        stages["dashboardStats"] = timeStage("dashboardStats", lambda: refreshStats(db))
+        stages["uploaderSearch"] = timeStage("uploaderSearch", lambda: buildSearchIndex(db), "uploaders")
+        pool = max(2, rows // snapshots * 3 // 2)
+        report["queries"] = runQueries(db, pool, repeat, seed)
+    finally:
+        if not keep:
+            client.drop_database(BENCH_DATABASE)
+            shutil.rmtree(workDir, ignore_errors=True)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cleansing, ingestion and the app.py/run_mongo_checks.py queries on synthetic data")
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic crawl rows across all snapshots (10k to 10M)")
+    parser.add_argument("--snapshots", type=int, default=4)
+    parser.add_argument("--backend", choices=["mongodb", "mongomock"], default="mongodb")
+    parser.add_argument("--uri", default=dataInsertion.MONGO_URI)
+    parser.add_argument("--repeat", type=int, default=50, help="runs of each query")
+    parser.add_argument("--workers", type=int, default=None, help="cleansing / map processes")
+    parser.add_argument("--writers", type=int, default=dataInsertion.WRITERS)
+    parser.add_argument("--batch", type=int, default=dataInsertion.BATCH_SIZE)
+    parser.add_argument("--keep", default=None, help="keep the generated data (and bench database) in this folder")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", default=None, help="also save the JSON report to this file")
+    args = parser.parse_args()
+
+    report = runBenchmark(args.rows, args.snapshots, args.backend, args.uri, args.repeat,
+                          args.workers, args.writers, args.batch, args.keep, args.seed)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+
+
+"""
+Pseudocode:
+
+runBenchmark(rows, snapshots, backend, repeat):
+    generate a synthetic crawl: for each snapshot, depth files 0/1/2 and log.txt in the allData layout,
+        the same videos reappearing with growing views, a few truncated rows
+    time cleansing (dataCleansing.cleanAll) into a temporary cleanData folder
+    time ingestion (dataInsertion.main) into the YoutubeDataBench database
+    time the RelatedBy, time series, DashboardStats and UploaderSearch builds
+    FOR each app.py / run_mongo_checks.py query:
+        run it 'repeat' times with random (or popular) IDs and uploaders, and uploader searches by prefix, misspelling and category word
+        record p50 / p95 / p99 / mean latency and queries per second
+    drop the bench database and temporary files (unless --keep)
+    print the JSON report
+
+"""
@@ -0,0 +1,184 @@
+# Optional compact storage schema for the video records (dataInsertion.py --schema compact).
+# One VideoCompact document per video instead of one Video document per video per snapshot:
+#   {_id: videoID, u: uploader code, c: category code, a: age, d: duration, r: related IDs packed 8 bytes each,
+#    s: [{t: snapshot, v: views, q: rating, n: ratings, m: comments (, r: related if it changed)}]}
+# Categories and uploaders are stored once in the Categories/Uploaders lookup collections ({_id: code, name}).
+# Codes are only ever added, never reassigned, so the live and the staging collection can share the lookups.
+from bson import Binary
+from pymongo import UpdateOne
+from threading import Lock
+import base64
+
+COMPACT_COLLECTION = "VideoCompact"
+SCHEMA_ID = "videoSchema" # Meta document naming the schema of the last load ("full" or "compact")
+UPLOADER_CACHE = 100000 # uploader names app.py keeps in memory
+# Per-snapshot fields: full name -> short name.
+OBSERVATION_FIELDS = {"snapshot": "t", "views": "v", "rating": "q", "ratings": "n", "comments": "m"}
+# Stages that turn VideoCompact into one {category, snapshot, views, rating} row per observation,
+# so the aggregations written for Video (dashboardStats.py, sampling.py) run on either schema.
+OBSERVATIONS = [
+    {"$unwind": "$s"},
+    {"$project": {"videoID": "$_id", "category": "$c", "snapshot": "$s.t", "views": "$s.v", "rating": "$s.q"}},
+]
+
+def currentSchema(db):
+    document = db["Meta"].find_one({"_id": SCHEMA_ID})
+    return document["value"] if document else "full"
+
+def setSchema(db, schema):
+    db["Meta"].update_one({"_id": SCHEMA_ID}, {"$set": {"value": schema}}, upsert=True)
+
+def packIDs(ids):
+    # A YouTube ID is 11 base64url characters carrying 64 bits, so it fits in 8 bytes.
+    # Lists with any ID that does not round-trip (wrong length or alphabet) are kept as strings.
+    packed = []
+    for video_id in ids:
+        try:
+            raw = base64.urlsafe_b64decode(video_id + "=")
+        except (ValueError, TypeError):
+            return list(ids)
+        if len(raw) != 8 or base64.urlsafe_b64encode(raw)[:11].decode() != video_id:
+            return list(ids)
+        packed.append(raw)
+    return Binary(b"".join(packed))
+
+def unpackIDs(value):
+    if isinstance(value, bytes):
+        return [base64.urlsafe_b64encode(value[i:i + 8])[:11].decode() for i in range(0, len(value), 8)]
+    return list(value or [])
+
+class Dictionary:
+    # name <-> code for one lookup collection. Used by the loader, which is the only process that adds codes.
+    def __init__(self, collection):
+        self.collection = collection
+        self.codes = {entry["name"]: entry["_id"] for entry in collection.find()}
+        self.pending = []
+        self.lock = Lock()
+        self.flushLock = Lock()
+
+    def code(self, name):
+        if name is None:
+            return None
+        code = self.codes.get(name)
+        if code is None:
+            with self.lock:
+                code = self.codes.get(name)
+                if code is None:
+                    code = self.codes[name] = len(self.codes)
+                    self.pending.append({"_id": code, "name": name})
+        return code
+
+    def flush(self):
+        # Writes new codes before any document that uses them. flushLock makes a writer wait until another writer's
+        # flush (which may hold its codes) has finished, so app.py never reads a code that has no name yet.
+        with self.flushLock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if pending:
+                self.collection.insert_many(pending, ordered=False)
+
+def openDictionaries(db):
+    categories, uploaders = db["Categories"], db["Uploaders"]
+    categories.create_index("name", unique=True)
+    uploaders.create_index("name", unique=True)
+    return Dictionary(categories), Dictionary(uploaders)
+
+def encodeUpdate(document, categories, uploaders):
+    # Upsert of one cleaned document into its video's compact record. Fields that do not change between crawls
+    # are only set the first time the video is seen; the snapshot's observation replaces any earlier one for the
+    # same snapshot, so reloading a shard is harmless. Related is repeated in an observation only if it differs.
+    related = packIDs(document.get("related") or [])
+    observation = {short: document.get(field) for field, short in OBSERVATION_FIELDS.items()}
+    static = {"u": uploaders.code(document.get("uploader")), "c": categories.code(document.get("category")),
+              "a": document.get("age"), "d": document.get("duration"), "r": related}
+    return UpdateOne({"_id": document["videoID"]}, [
+        {"$set": {short: {"$ifNull": ["$" + short, {"$literal": value}]} for short, value in static.items()}},
+        {"$set": {"s": {"$concatArrays": [
+            {"$filter": {"input": {"$ifNull": ["$s", []]}, "cond": {"$ne": ["$$this.t", observation["t"]]}}},
+            {"$cond": [{"$eq": ["$r", {"$literal": related}]}, {"$literal": [observation]}, {"$literal": [dict(observation, r=related)]}]},
+        ]}}},
+    ], upsert=True)
+
+class Codec:
+    # Expands VideoCompact documents back into the Video document shape for app.py.
+    # Categories are few and loaded once; uploader names are fetched in batches as documents need them.
+    def __init__(self, db):
+        self.db = db
+        self.categories = {entry["_id"]: entry["name"] for entry in db["Categories"].find()}
+        self.uploaders = {}
+        self.lock = Lock()
+
+    def categoryName(self, code):
+        if code is not None and code not in self.categories:
+            # Added by a load since the codec was created.
+            self.categories.update((entry["_id"], entry["name"]) for entry in self.db["Categories"].find())
+        return self.categories.get(code)
+
+    def uploaderNames(self, codes):
+        missing = {code for code in codes if code is not None and code not in self.uploaders}
+        if missing:
+            found = {entry["_id"]: entry["name"] for entry in self.db["Uploaders"].find({"_id": {"$in": sorted(missing)}})}
+            with self.lock:
+                if len(self.uploaders) + len(found) > UPLOADER_CACHE:
+                    self.uploaders.clear()
+                self.uploaders.update(found)
+        return {code: self.uploaders.get(code) for code in codes}
+
+    def uploaderCode(self, name):
+        entry = self.db["Uploaders"].find_one({"name": name})
+        return entry["_id"] if entry else None
+
+    def decode(self, documents, snapshot=None):
+        # One Video-shaped document per compact document: the observation from the given snapshot,
+        # or from the latest one. Documents without observations (projections) keep their static fields.
+        names = self.uploaderNames([document.get("u") for document in documents])
+        decoded = []
+        for document in documents:
+            video = {"videoID": document["_id"]}
+            if "u" in document:
+                video["uploader"] = names.get(document["u"])
+            if "c" in document:
+                video["category"] = self.categoryName(document["c"])
+            for short, field in (("a", "age"), ("d", "duration")):
+                if short in document:
+                    video[field] = document[short]
+            if "r" in document:
+                video["related"] = unpackIDs(document["r"])
+            observations = sorted(document.get("s") or [], key=lambda obs: obs["t"])
+            if snapshot is not None:
+                observations = [obs for obs in observations if obs["t"] == snapshot]
+            if observations:
+                latest = observations[-1]
+                for field, short in OBSERVATION_FIELDS.items():
+                    video[field] = latest.get(short)
+                if "r" in latest:
+                    video["related"] = unpackIDs(latest["r"])
+            decoded.append(video)
+        return decoded
+
+    def decodeOne(self, document, snapshot=None):
+        return self.decode([document], snapshot)[0] if document else None
+
+
+"""
+Pseudocode:
+
+packIDs(ids): base64url-decode each 11-character ID to 8 bytes and concatenate them (strings if any ID does not fit)
+
+Dictionary(lookup collection):
+    load every {_id: code, name}
+    code(name): existing code, or the next free code (remembered as pending)
+    flush(): insert the pending codes (before any document using them is written)
+
+encodeUpdate(document):
+    upsert VideoCompact {_id: videoID}:
+        u, c, a, d, r = uploader code, category code, age, duration, packed related (only if not set yet)
+        s = s without any entry for this snapshot + {t, v, q, n, m} (plus r if related differs from the stored one)
+
+Codec(db).decode(documents, snapshot):
+    look up the uploader names of the documents (one query for the ones not cached)
+    FOR each document:
+        videoID, uploader, category, age, duration, related from the static fields
+        views, rating, ratings, comments, snapshot from the latest (or the given) observation
+
+"""
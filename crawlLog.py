@@ -0,0 +1,252 @@
+# Parses the log.txt the crawler wrote into every snapshot folder and stores one CrawlRuns document per crawl:
+# start/finish time, and for every BFS depth the logged video count, the seconds it took and the videos/sec.
+# Each depth is checked against its N.txt file (line count) and against what cleanRow kept and rejected from it
+# (the cleansing manifest), so slow, truncated or badly rejected crawls show up before they are loaded.
+# app.py shows the report on its Crawl Quality page.
+from pymongo import MongoClient, ReplaceOne
+from multiprocessing import Pool, cpu_count
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+import argparse
+import os
+import re
+from dataCleansing import findSnapshotDirs, loadManifest, countLines, DEPTH_FILE
+from instrumentation import configure, registry, stage
+
+MONGO_URI = "mongodb://localhost:27017"
+LOG_NAME = "log.txt"
+# Some logs were cut short by the crawler: times like "080414 ::", blank or "?" seconds, an empty "last".
+TIME_LINE = re.compile(r"^(start|finish):\s+(\d{6})\s+(\d{1,2}:\d{2}:\d{2})\s*$")
+DEPTH_LINE = re.compile(r"^(\d+|total)\s+(\d+)(?:\s+(\d+|\?))?\s*$")
+COUNT_LINE = re.compile(r"^(last|new)(?:\s+(\d+))?\s*$")
+REJECT_FACTOR = 3 # a depth rejecting over this many times the median reject rate of that depth is flagged...
+MIN_REJECTS = 5 # ...if it rejected at least this many rows (two bad rows in a 180-row depth 0 file are not a problem)
+SLOW_FACTOR = 0.5 # a depth crawled at less than this share of the median videos/sec of that depth is flagged
+STALL_FACTOR = 1.5 # a crawl whose start-to-finish time is this much longer than its logged crawl time is flagged
+
+def parseLog(path):
+    # {start, finish, depths: {depth: (videos, seconds)}, total: (videos, seconds), last, new} of one log.txt.
+    # Values the crawler did not write are None.
+    parsed = {"start": None, "finish": None, "depths": {}, "total": None, "last": None, "new": None}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            match = TIME_LINE.match(line)
+            if match:
+                parsed[match.group(1)] = datetime.strptime(f"{match.group(2)} {match.group(3)}", "%y%m%d %H:%M:%S")
+                continue
+            match = DEPTH_LINE.match(line)
+            if match:
+                seconds = match.group(3)
+                counts = (int(match.group(2)), int(seconds) if seconds and seconds.isdigit() else None)
+                if match.group(1) == "total":
+                    parsed["total"] = counts
+                else:
+                    parsed["depths"][int(match.group(1))] = counts
+                continue
+            match = COUNT_LINE.match(line)
+            if match:
+                parsed[match.group(1)] = int(match.group(2)) if match.group(2) else None
+    return parsed
+
+def rate(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+def crawlRun(task):
+    # Worker entry point: parses one log and checks every logged depth against its depth file and manifest entry.
+    snapshot, logPath, depthFiles, entries = task
+    log = parseLog(logPath)
+    depths = []
+    flags = []
+    rows = rejected = 0
+    for depth in sorted(set(log["depths"]) | set(depthFiles)):
+        videos, seconds = log["depths"].get(depth, (None, None))
+        path = depthFiles.get(depth)
+        entry = entries.get(depth)
+        check = {"depth": depth, "videos": videos, "seconds": seconds, "videosPerSec": rate(videos, seconds),
+                 "file": os.path.basename(path) if path else None, "lines": countLines(path) if path else None}
+        if entry:
+            # A manifest made with --maxRows only covers the first rows of the file.
+            check.update(rows=entry["rows"], rejected=entry["rejected"], sampled=entry.get("maxRows") is not None,
+                         rejectRate=rate(entry["rejected"], entry["rows"] + entry["rejected"]))
+            rows += entry["rows"]
+            rejected += entry["rejected"]
+        if videos is None:
+            check["status"] = "unlogged"
+        elif path is None:
+            check["status"] = "missing"
+        elif check["lines"] < videos:
+            check["status"] = "truncated"
+            flags.append(f"depth {depth} truncated ({check['lines']:,} of {videos:,} rows)")
+        elif check["lines"] > videos:
+            check["status"] = "extra"
+            flags.append(f"depth {depth} has {check['lines'] - videos:,} more rows than logged")
+        else:
+            check["status"] = "ok"
+        depths.append(check)
+
+    # Every depth the log reports was crawled, so each one should have its file, however deep the files on disk go.
+    for check in depths:
+        if check["status"] == "missing":
+            flags.append(f"depth {check['depth']} file missing")
+    if log["start"] is None or log["finish"] is None:
+        flags.append("no start or finish time")
+    untimed = [depth for depth, (_, seconds) in sorted(log["depths"].items()) if seconds is None]
+    if untimed:
+        flags.append(f"no crawl time for depth {', '.join(map(str, untimed))}")
+    wall = (log["finish"] - log["start"]).total_seconds() if log["start"] and log["finish"] else None
+    videos, seconds = log["total"] or (None, None)
+    if videos is None:
+        videos = sum(v for v, _ in log["depths"].values())
+    if seconds is None and not untimed:
+        seconds = sum(s for _, s in log["depths"].values())
+    if wall and seconds and wall > STALL_FACTOR * seconds:
+        flags.append(f"ran {wall / 3600:.1f} h for {seconds / 3600:.1f} h of crawling")
+    return {
+        "_id": snapshot,
+        "log": logPath,
+        "start": log["start"],
+        "finish": log["finish"],
+        "wallSeconds": wall,
+        "videos": videos,
+        "crawlSeconds": seconds,
+        "videosPerSec": rate(videos, seconds),
+        "last": log["last"],
+        "new": log["new"],
+        "depths": depths,
+        "depthFiles": sorted(depthFiles),
+        "rows": rows,
+        "rejected": rejected,
+        "rejectRate": rate(rejected, rows + rejected),
+        "flags": flags,
+    }
+
+def flagSlowDepths(runs, factor=SLOW_FACTOR):
+    # Compares every depth's videos/sec with the median of the same depth over all crawls.
+    speeds = {}
+    for run in runs:
+        for check in run["depths"]:
+            if check["videosPerSec"] is not None:
+                speeds.setdefault(check["depth"], []).append(check["videosPerSec"])
+    medians = {depth: median(values) for depth, values in speeds.items()}
+    for run in runs:
+        for check in run["depths"]:
+            typical = medians.get(check["depth"])
+            if check["videosPerSec"] is not None and typical and check["videosPerSec"] < factor * typical:
+                check["slow"] = True
+                run["flags"].append(f"depth {check['depth']} slow ({check['videosPerSec']:.2f} videos/sec, median {typical:.2f})")
+    return medians
+
+def flagRejectDepths(runs, factor=REJECT_FACTOR, minimum=MIN_REJECTS):
+    # Compares every depth's reject rate with the median of the same depth over all crawls, like flagSlowDepths.
+    rates = {}
+    for run in runs:
+        for check in run["depths"]:
+            if check.get("rejectRate") is not None:
+                rates.setdefault(check["depth"], []).append(check["rejectRate"])
+    medians = {depth: median(values) for depth, values in rates.items()}
+    for run in runs:
+        for check in run["depths"]:
+            typical = medians.get(check["depth"])
+            if check.get("rejectRate") is not None and check["rejected"] >= minimum and check["rejectRate"] > factor * (typical or 0):
+                check["rejectHigh"] = True
+                run["flags"].append(f"depth {check['depth']} rejects {check['rejectRate']:.1%} of rows (median {typical:.1%})")
+    return medians
+
+def findLogs(dataDir, cleanDir):
+    # One task per snapshot with a log: its depth files and their entries in the cleansing manifest.
+    manifest = loadManifest(cleanDir) if cleanDir else {}
+    tasks = []
+    for snapshot, snapshotDir in findSnapshotDirs(dataDir):
+        logPath = os.path.join(snapshotDir, LOG_NAME)
+        if not os.path.exists(logPath):
+            continue
+        depthFiles, entries = {}, {}
+        for name in os.listdir(snapshotDir):
+            match = DEPTH_FILE.match(name)
+            if match:
+                depth, path = int(match.group(1)), os.path.join(snapshotDir, name)
+                depthFiles[depth] = path
+                key = os.path.relpath(path, dataDir).replace(os.sep, "/")
+                if key in manifest:
+                    entries[depth] = manifest[key]
+        tasks.append((snapshot, logPath, depthFiles, entries))
+    return tasks
+
+def ingestLogs(db, dataDir, cleanDir=None, workers=None):
+    # Parses every log in parallel and replaces the CrawlRuns documents. Returns the runs, oldest first.
+    start_time = perf_counter()
+    tasks = findLogs(dataDir, cleanDir)
+    runs = []
+    if tasks:
+        with Pool(processes=min(workers or cpu_count(), len(tasks))) as pool:
+            runs = list(pool.imap_unordered(crawlRun, tasks))
+    runs.sort(key=lambda run: run["_id"])
+    flagSlowDepths(runs)
+    flagRejectDepths(runs)
+    parsed = datetime.now()
+    if runs:
+        db["CrawlRuns"].bulk_write([ReplaceOne({"_id": run["_id"]}, dict(run, parsed=parsed), upsert=True) for run in runs], ordered=False)
+    for run in runs:
+        for check in run["depths"]:
+            if check["videosPerSec"] is not None:
+                registry.set("crawl_videos_per_second", check["videosPerSec"], snapshot=run["_id"], depth=check["depth"])
+        if run["rejectRate"] is not None:
+            registry.set("crawl_reject_rate", run["rejectRate"], snapshot=run["_id"])
+        registry.set("crawl_flags", len(run["flags"]), snapshot=run["_id"])
+    print(f"parsed {len(runs)} crawl logs in {perf_counter() - start_time:.4f} seconds")
+    return runs
+
+def loadRuns(db):
+    return list(db["CrawlRuns"].find({}, {"log": 0}).sort("_id", 1))
+
+def printReport(runs):
+    print(f"{'snapshot':<9}{'hours':>7}{'videos':>10}{'vid/s':>8}  {'vid/s by depth':<28}{'rejected':>9}  flags")
+    for run in runs:
+        hours = f"{run['wallSeconds'] / 3600:.1f}" if run["wallSeconds"] is not None else "?"
+        speeds = " ".join(f"{check['depth']}:{check['videosPerSec']:.2f}" for check in run["depths"] if check["videosPerSec"] is not None)
+        overall = f"{run['videosPerSec']:.2f}" if run["videosPerSec"] is not None else "?"
+        rejected = f"{run['rejectRate']:.2%}" if run["rejectRate"] is not None else "-"
+        print(f"{run['_id']:<9}{hours:>7}{run['videos']:>10,}{overall:>8}  {speeds:<28}{rejected:>9}  {'; '.join(run['flags'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse the crawl logs into CrawlRuns and report crawl throughput and reject rates")
+    parser.add_argument("--data", default=os.path.join(os.getcwd(), "allData"))
+    parser.add_argument("--clean", default=os.path.join(os.getcwd(), "cleanData"), help="folder holding the cleansing _manifest.json")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--metrics", default=os.path.join(os.getcwd(), "metrics"), help="folder for crawlLog.prom and crawlLog.jsonl")
+    args = parser.parse_args()
+
+    configure("crawlLog", args.metrics)
+    client = MongoClient(MONGO_URI)
+    with stage("crawlLog"):
+        runs = ingestLogs(client["YoutubeData"], args.data, args.clean, args.workers)
+    printReport(runs)
+    registry.flush()
+
+
+"""
+Pseudocode:
+
+findLogs(dataDir):
+    FOR each snapshot folder with a log.txt: its N.txt depth files and their cleansing manifest entries
+
+crawlRun(snapshot) in a worker process:
+    read start/finish times, the "depth video time" table, total, last and new from log.txt
+    FOR each depth in the log or on disk:
+        videos/sec = logged videos / logged seconds
+        lines = line count of N.txt; rows/rejected = what cleanRow kept/rejected (manifest)
+        status = missing (no file) | truncated (fewer lines than logged) | extra | ok
+        flag truncated files
+    flag logged depths without a depth file, logs without start/finish or depth times,
+    and crawls that ran over 1.5x longer than their logged crawl time (stalled)
+
+ingestLogs(db, dataDir):
+    run crawlRun over all snapshots in a process pool
+    flag depths crawled at under half the median videos/sec of that depth
+    flag depths that rejected at least 5 rows and over 3x the median reject rate of that depth
+    replace every CrawlRuns document; set the videos/sec, reject rate and flag gauges
+    print one report line per crawl
+
+"""
@@ -0,0 +1,93 @@
+# Materializes the dashboard metrics (totals, category counts, per-snapshot counts and view/rating histograms) into the DashboardStats collection.
+# dataInsertion.py refreshes it after every load, so app.py reads one small document instead of aggregating the whole Video collection on every rerun.
+from pymongo import MongoClient
+from time import perf_counter
+from compactSchema import COMPACT_COLLECTION, OBSERVATIONS, currentSchema
+from partitions import allVideos
+
+MONGO_URI = "mongodb://localhost:27017"
+STATS_ID = "current"
+# Histogram bucket boundaries. Views grow by powers of ten; ratings run from 0 to 5.
+VIEW_BOUNDARIES = [0, 10, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000, 10000000000]
+RATING_BOUNDARIES = [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5.01]
+
+def statsPipeline(compact=False):
+    # One pass over Video computes every metric side by side with $facet.
+    # compact: VideoCompact is first unwound into one row per observation and category codes are turned back into names.
+    categoryNames = [
+        {"$lookup": {"from": "Categories", "localField": "_id", "foreignField": "_id", "as": "name"}},
+        {"$project": {"_id": {"$arrayElemAt": ["$name.name", 0]}, "count": 1}},
+    ] if compact else []
+    return (OBSERVATIONS if compact else []) + [
+        {"$facet": {
+            "totals": [{"$count": "videos"}],
+            "categories": [
+                {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+            ] + categoryNames,
+            "snapshots": [
+                {"$group": {"_id": "$snapshot", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "views": [
+                {"$match": {"views": {"$type": "number"}}},
+                {"$bucket": {"groupBy": "$views", "boundaries": VIEW_BOUNDARIES, "default": "other", "output": {"count": {"$sum": 1}}}},
+            ],
+            "ratings": [
+                {"$match": {"rating": {"$type": "number"}}},
+                {"$bucket": {"groupBy": "$rating", "boundaries": RATING_BOUNDARIES, "default": "other", "output": {"count": {"$sum": 1}}}},
+            ],
+        }},
+        {"$project": {
+            "_id": {"$literal": STATS_ID},
+            "total": {"$ifNull": [{"$arrayElemAt": ["$totals.videos", 0]}, 0]},
+            "categories": 1,
+            "snapshots": 1,
+            "views": 1,
+            "ratings": 1,
+            "refreshed": "$$NOW",
+        }},
+    ]
+
+def computeStats(collection, compact=False):
+    # Runs the pipeline and returns the stats document without storing it.
+    results = list(collection.aggregate(statsPipeline(compact)))
+    return results[0] if results else None
+
+def refreshStats(db, compact=None):
+    # Recomputes the stats and replaces the DashboardStats document in place with $merge.
+    # compact=None reads whichever schema the last load wrote.
+    start_time = perf_counter()
+    if compact is None:
+        compact = currentSchema(db) == "compact"
+    pipeline = statsPipeline(compact) + [{"$merge": {"into": "DashboardStats", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}]
+    # The partitioned layout is aggregated over the union of its partitions (partitions.py).
+    (db[COMPACT_COLLECTION] if compact else allVideos(db)).aggregate(pipeline)
+    print(f"DashboardStats refreshed in {perf_counter() - start_time:.4f} seconds")
+
+def loadStats(db):
+    return db["DashboardStats"].find_one({"_id": STATS_ID})
+
+if __name__ == "__main__":
+    client = MongoClient(MONGO_URI)
+    refreshStats(client["YoutubeData"])
+
+
+"""
+Pseudocode:
+
+refreshStats(db):
+    IF the last load used the compact schema:
+        aggregate VideoCompact instead, unwound to one row per snapshot observation,
+        and look the category names up in Categories
+    IF it used the partitioned layout: aggregate the union of every Video_<snapshot> partition
+    aggregate Video once with $facet:
+        totals     = count of documents
+        categories = count per category, largest first
+        snapshots  = count per crawl snapshot, oldest first
+        views      = $bucket histogram of views (powers of ten)
+        ratings    = $bucket histogram of rating (half-star steps)
+    shape the result into one document with _id "current" and a refreshed time
+    $merge it into DashboardStats, replacing the previous document
+
+"""
@@ -1,57 +1,292 @@
-# Creates a cleaned up and smaller subset for testing in a json file. maxRows allows users to set a limit on how many lines to put into the output file. (Cleansing/Transformation)
+# Creates cleaned JSONL shards from the raw crawl data, one shard per depth file of every snapshot. maxRows allows users to set a limit on how many lines to put into each output file. (Cleansing/Transformation)
+import argparse
 import csv
+import hashlib
 import json
 import os
+import re
+from datetime import datetime
+from multiprocessing import Pool, cpu_count
+from time import perf_counter
+from instrumentation import configure, registry, stage
+from jsonCodec import dumpLine
 
-def cleanRow(row):
+# Depth files are named 0.txt, 1.txt, ... next to a log.txt (and sometimes newid.txt) that we skip.
+DEPTH_FILE = re.compile(r"^(\d+)\.txt$")
+# Snapshot folders are named after the crawl date (YYMMDD).
+SNAPSHOT_DIR = re.compile(r"^\d{6}$")
+MANIFEST_NAME = "_manifest.json" # leading underscore so Spark and the loaders skip it
+WRITE_BUFFER = 1 << 20 # 1 MB buffered writer per worker
+FLUSH_ROWS = 5000 # rows collected before each writelines call
+SHARD_FORMAT = 2 # bumped whenever cleanRow's output changes, so older shards get re-cleansed
+
+def cleanRow(row, snapshot=None):
     if len(row) < 9: # Clean out empty/incomplete rows
         return None
     try:
         # Transforms the row into data that is normalized & can be used.
+        # The numeric fields are checked with isdigit() before converting on purpose: converting once and catching
+        # ValueError is no faster here (most fields are valid, and a failed int() raises), and int() would also accept
+        # the padded " 0 " placeholders of unavailable videos, which are kept as None.
         return {
             "videoID": row[0].strip(),
             "uploader": row[1].strip(),
+            "age": int(row[2]) if row[2].isdigit() else None, # days between Feb 15, 2005 and the upload
             "category": row[3].strip(), # trim out whitespaces
             "duration": int(row[4]) if row[4].isdigit() else None,
             "views": int(row[5]) if row[5].isdigit() else None,
             "rating": float(row[6]) if row[6].replace('.', '', 1).isdigit() else None,
-            "related": [r.strip() for r in row[9:] if r.strip()]
+            "ratings": int(row[7]) if row[7].isdigit() else None, # number of ratings
+            "comments": int(row[8]) if row[8].isdigit() else None,
+            "related": [r for r in map(str.strip, row[9:]) if r],
+            "snapshot": snapshot # crawl date (YYMMDD) the row was observed on
         }
-    except Exception: # error 
+    except Exception: # error
         return None
 
-def processRows(inp, outp, maxRows=None): # maxRows provides a max amount to parse to keep within a data limit, but can be deleted if you want to parse the entire file
-    with open(inp, 'r', encoding='utf-8') as f, open(outp, 'w', encoding='utf-8') as out:
+def processRows(inp, outp, maxRows=None, snapshot=None): # maxRows provides a max amount to parse to keep within a data limit, but can be deleted if you want to parse the entire file
+    # Streams the input through cleanRow and returns how many rows were kept and rejected.
+    kept = 0
+    rejected = 0
+    pending = []
+    # Lines are encoded straight to UTF-8 bytes by jsonCodec.py (orjson when installed).
+    with open(inp, 'r', encoding='utf-8') as f, open(outp, 'wb', buffering=WRITE_BUFFER) as out:
         reader = csv.reader(f, delimiter='\t')
         for i, row in enumerate(reader):
             if maxRows and i >= maxRows: # If reached limit, stop there
                 break
-            clean = cleanRow(row)
+            clean = cleanRow(row, snapshot)
             # If row is correctly cleaned by cleanRow(row)
             if clean:
-                out.write(json.dumps(clean) + '\n') 
+                pending.append(dumpLine(clean))
+                kept += 1
+                if len(pending) >= FLUSH_ROWS:
+                    out.writelines(pending)
+                    pending.clear()
+            else:
+                rejected += 1
+        out.writelines(pending)
+    return {"rows": kept, "rejected": rejected}
+
+def findSnapshotDirs(dataDir):
+    # (snapshot, folder) for every dated snapshot. Snapshots are stored either as
+    # allData/<date>/<date>/ (the original download) or flat as <date>/.
+    found = []
+    for snapshot in sorted(os.listdir(dataDir)):
+        snapshotDir = os.path.join(dataDir, snapshot)
+        if not SNAPSHOT_DIR.match(snapshot) or not os.path.isdir(snapshotDir):
+            continue
+        nested = os.path.join(snapshotDir, snapshot)
+        found.append((snapshot, nested if os.path.isdir(nested) else snapshotDir))
+    return found
+
+def findDepthFiles(dataDir):
+    # Finds every depth file (N.txt) in every dated snapshot.
+    found = []
+    for snapshot, snapshotDir in findSnapshotDirs(dataDir):
+        for name in os.listdir(snapshotDir):
+            match = DEPTH_FILE.match(name)
+            if match:
+                found.append((snapshot, int(match.group(1)), os.path.join(snapshotDir, name)))
+    found.sort(key=lambda item: (item[0], item[1]))
+    return found
+
+def shardName(snapshot, depth):
+    return f"{snapshot}_{depth}.json"
+
+def fileDigest(path):
+    # sha256 of the file contents, read in 1 MB blocks.
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(WRITE_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def countLines(path):
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(WRITE_BUFFER), b''):
+            count += block.count(b'\n')
+    return count
+
+def loadManifest(outDir):
+    path = os.path.join(outDir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError) as e:
+        print(f"ignoring unreadable manifest {path}: {e}")
+        return {}
+
+def cleanFile(task):
+    # Worker entry point: cleans one depth file into its own output shard. When a previous
+    # manifest entry is passed in, the file is hashed first and skipped if its content is unchanged
+    # (and, in verify mode, the existing shard still has the expected number of rows).
+    snapshot, depth, inp, outp, maxRows, previous, verify = task
+    start_time = perf_counter()
+    info = os.stat(inp)
+    digest = fileDigest(inp)
+    if previous and previous.get("sha256") == digest and os.path.exists(outp):
+        if not verify or countLines(outp) == previous.get("rows"):
+            stats = dict(previous, size=info.st_size, mtime=info.st_mtime, input=inp, skipped=True)
+            return stats
+    stats = processRows(inp, outp, maxRows, snapshot)
+    stats.update({
+        "snapshot": snapshot,
+        "depth": depth,
+        "input": inp,
+        "output": os.path.basename(outp),
+        "size": info.st_size,
+        "mtime": info.st_mtime,
+        "sha256": digest,
+        "seconds": round(perf_counter() - start_time, 4),
+        "skipped": False,
+        "format": SHARD_FORMAT,
+    })
+    return stats
+
+def needsWork(path, outp, previous, force, verify):
+    # Cheap pre-check done before any worker is started: a file whose size and mtime match
+    # its manifest entry (and whose shard is still there) is not even hashed unless verifying.
+    if force or verify or not previous or not os.path.exists(outp):
+        return True
+    info = os.stat(path)
+    return info.st_size != previous.get("size") or info.st_mtime != previous.get("mtime")
+
+def writeManifest(outDir, files, workers, duration):
+    # files: {input path relative to the data folder: stats of its shard}.
+    manifest = {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "workers": workers,
+        "seconds": round(duration, 4),
+        "rows": sum(stats["rows"] for stats in files.values()),
+        "rejected": sum(stats["rejected"] for stats in files.values()),
+        "cleansed": sum(1 for stats in files.values() if not stats["skipped"]),
+        "files": dict(sorted(files.items())),
+    }
+    with open(os.path.join(outDir, MANIFEST_NAME), 'w', encoding='utf-8') as out:
+        json.dump(manifest, out, indent=2)
+    return manifest
+
+def cleanAll(dataDir, outDir, workers=None, maxRows=None, force=False, verify=False):
+    # Fans every new or changed depth file out over a process pool. Each worker streams its own
+    # shard to disk and only sends back a small stats dict, so memory stays flat however big the crawl is.
+    # force re-cleanses everything; verify re-hashes every input and re-counts every existing shard.
+    os.makedirs(outDir, exist_ok=True)
+    workers = workers or cpu_count()
+    previousFiles = {} if force else loadManifest(outDir)
+
+    files = {}
+    tasks = []
+    for snapshot, depth, path in findDepthFiles(dataDir):
+        key = os.path.relpath(path, dataDir).replace(os.sep, "/")
+        outp = os.path.join(outDir, shardName(snapshot, depth))
+        previous = previousFiles.get(key)
+        # A manifest entry only counts if it was made with the same row limit and shard format.
+        if previous and (previous.get("maxRows") != maxRows or previous.get("format") != SHARD_FORMAT):
+            previous = None
+        if needsWork(path, outp, previous, force, verify):
+            tasks.append((snapshot, depth, path, outp, maxRows, previous, verify))
+        else:
+            files[key] = dict(previous, skipped=True)
+    # Largest files first so one big shard does not end up running alone at the end.
+    tasks.sort(key=lambda task: os.path.getsize(task[2]), reverse=True)
+    print(f"{len(tasks)} files to check, {len(files)} unchanged")
+
+    start_time = perf_counter()
+    if tasks:
+        with Pool(processes=min(workers, len(tasks))) as pool:
+            for stats in pool.imap_unordered(cleanFile, tasks, chunksize=1):
+                key = os.path.relpath(stats.pop("input"), dataDir).replace(os.sep, "/")
+                stats["maxRows"] = maxRows
+                files[key] = stats
+                if stats["skipped"]:
+                    print(f"{key}: unchanged")
+                else:
+                    print(f"{key}: {stats['rows']} rows, {stats['rejected']} rejected, {stats['seconds']}s")
+    duration = perf_counter() - start_time
+
+    # Counters for the metrics files: rows kept and rejected by cleanRow in the files cleansed by this run.
+    for stats in files.values():
+        registry.inc("files_total", status="unchanged" if stats["skipped"] else "cleansed")
+        if not stats["skipped"]:
+            registry.inc("rows_total", stats["rows"], snapshot=stats["snapshot"], outcome="kept")
+            registry.inc("rows_total", stats["rejected"], snapshot=stats["snapshot"], outcome="rejected")
+
+    removed = sorted(set(previousFiles) - set(files))
+    for key in removed:
+        print(f"{key}: input no longer exists, dropped from manifest")
+
+    manifest = writeManifest(outDir, files, workers, duration)
+    print(f"cleansed {manifest['cleansed']} of {len(files)} files ({manifest['rows']} rows, {manifest['rejected']} rejected) in {duration:.4f} seconds")
+    return manifest
 
 if __name__ == "__main__":
-    contents = os.listdir(".\\allData")
-    print(contents)
-    for item in contents:
-        inputPath = os.getcwd() + "\\allData\\" + item + "\\" + item + "\\" + "3.txt"
-        outputPath = os.getcwd() + "\\cleanData\\" + item + ".json";
-        print(inputPath);
-        processRows(inputPath,outputPath)
+    parser = argparse.ArgumentParser(description="Cleanse every crawl snapshot into JSONL shards")
+    parser.add_argument("--data", default=os.path.join(os.getcwd(), "allData"))
+    parser.add_argument("--out", default=os.path.join(os.getcwd(), "cleanData"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--maxRows", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="re-cleanse every file even if unchanged")
+    parser.add_argument("--verify", action="store_true", help="re-hash every input and re-count every shard")
+    parser.add_argument("--parquet", default=None, help="also export re-cleansed snapshots to this Parquet dataset folder")
+    parser.add_argument("--metrics", default=os.path.join(os.getcwd(), "metrics"), help="folder for dataCleansing.prom and dataCleansing.jsonl")
+    args = parser.parse_args()
 
+    configure("dataCleansing", args.metrics)
+    with stage("cleanse"):
+        manifest = cleanAll(args.data, args.out, args.workers, args.maxRows, args.force, args.verify)
+    if args.parquet:
+        # Conversion stage: only snapshots with a freshly cleansed shard are rewritten (pyarrow is only needed here).
+        from parquetExport import exportParquet
+        changed = {stats["snapshot"] for stats in manifest["files"].values() if not stats["skipped"]}
+        with stage("parquet"):
+            exportParquet(args.out, args.parquet, None if args.force or not os.path.isdir(args.parquet) else changed)
+    registry.flush()
 
-""" 
+
+"""
 Pseudocode:
 
-open input file for reading
-open output file for writing
+processRows(input, output, maxRows, snapshot):
+    open input file for reading
+    open output file for writing (1 MB buffer)
+
+    for each line (i, row) in input file:
+        if maxRows is set and i >= maxRows:
+            stop loop
+        clean = cleanRow(row, snapshot) (keeps age, ratings, comments and the snapshot date)
+        if clean is valid:
+            add clean object to pending lines (encoded as a JSON line by orjson/msgspec/json)
+            if pending lines reach FLUSH_ROWS:
+                write pending lines to output file
+        else:
+            count row as rejected
+    write remaining pending lines
+    return kept and rejected counts
 
-for each line (i, row) in input file:
-    if maxRows is set and i >= maxRows:
-        stop loop
-    clean = cleanRow(row)
-    if clean is valid:
-        write clean object to output file
+cleanAll(dataDir, outDir, workers, force, verify):
+    load the previous _manifest.json (unless force)
+    find every <date>/<date>/N.txt depth file
+    for each file:
+        if size and mtime match the manifest and the shard exists (and not verify):
+            keep the old entry
+        else:
+            queue the file
+    sort queued files largest first
+    start a pool of worker processes
+    for each queued file (in any order):
+        hash the file
+        if the hash matches the manifest (and, when verifying, the shard row count matches):
+            keep the old shard
+        else:
+            cleanse the file and record its row count, rejects, size, mtime, hash and time
+    write _manifest.json with per-file stats and totals
+    count files cleansed/unchanged and rows kept/rejected per snapshot (instrumentation.py)
+    if --parquet is given:
+        export the snapshots that were re-cleansed to the Parquet dataset (parquetExport.py)
+    write the stage times and counters to metrics/dataCleansing.prom and metrics/dataCleansing.jsonl
 
-"""
\ No newline at end of file
+"""
@@ -1,104 +1,378 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from datetime import datetime
 import argparse
-import json
 import os
+import re
+import sys
 from time import perf_counter
+from indexes import VIDEO_KEY, REQUIRED_INDEXES, COMPACT_INDEXES, ensureIndexes
+from relatedIndex import buildRelatedBy
+from dashboardStats import refreshStats
+from timeSeries import buildTimeSeries
+from searchIndex import buildSearchIndex
+from queryCache import bumpGeneration
+from compactSchema import COMPACT_COLLECTION, encodeUpdate, openDictionaries, setSchema
+from partitions import (PARTITION_SHARDS, partitionName, registerPartition, listPartitions, retiredSnapshots,
+                        dropPartitions)
+from jsonCodec import iterDocuments
+from instrumentation import CommandMonitor, configure, recordStage, registry, stage
+from run_mongo_checks import runChecks
+
+# This is the default spot that mongoDB runs at.
+# If this doesn't work then check where MongoDB Compass is running the database.
+MONGO_URI = "mongodb://localhost:27017"
+BATCH_SIZE = 5000 # documents per insert_many call
+WRITERS = 4 # concurrent writer threads sharing the client's connection pool
+SNAPSHOT_NAME = re.compile(r"^(\d{6})")
+
+def shardSnapshot(path):
+    # cleanData shards are named <YYMMDD>_<depth>.json, so the crawl date is the file name prefix.
+    name = os.path.basename(path)
+    match = SNAPSHOT_NAME.match(name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+def shardState(jsonPath):
+    info = os.stat(jsonPath)
+    return {"size": info.st_size, "mtime": info.st_mtime}
+
+def readBatches(jsonPath, batchSize):
+    # Lazily reads a JSONL file and yields lists of at most batchSize documents,
+    # so only the batches in flight are ever held in memory. Every document is
+    # tagged with the crawl date of its shard.
+    # Lines are decoded straight from the file's binary blocks by jsonCodec.py.
+    snapshot = shardSnapshot(jsonPath)
+    batch = []
+    for document in iterDocuments(jsonPath, onError=lambda e: print(f"skipping line due to JSON error: {e}")):
+        document["snapshot"] = snapshot
+        batch.append(document)
+        if len(batch) >= batchSize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insertBatch(collection, batch, label):
+    # Unordered bulk insert: the server can apply the batch in any order and one bad
+    # document does not stop the rest of the batch.
+    start_time = perf_counter()
+    try:
+        written = len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        written = e.details.get("nInserted", 0)
+        rejectedBatch(label, e)
+    return reportBatch(label, "inserted", written, perf_counter() - start_time)
+
+def upsertBatch(collection, batch, label):
+    # Idempotent write keyed on (videoID, snapshot): reloading a shard replaces its
+    # documents instead of duplicating them.
+    start_time = perf_counter()
+    requests = [UpdateOne({"videoID": document["videoID"], "snapshot": document["snapshot"]},
+                          {"$set": document}, upsert=True) for document in batch]
+    try:
+        result = collection.bulk_write(requests, ordered=False)
+        written = result.upserted_count + result.modified_count
+    except BulkWriteError as e:
+        written = e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        rejectedBatch(label, e)
+    return reportBatch(label, "upserted", written, perf_counter() - start_time)
+
+def compactBatch(dictionaries, collection, batch, label):
+    # Compact schema (compactSchema.py): each document becomes an upsert into its video's single record.
+    # New category/uploader codes are written to the lookup collections before the documents that use them.
+    start_time = perf_counter()
+    categories, uploaders = dictionaries
+    requests = [encodeUpdate(document, categories, uploaders) for document in batch]
+    categories.flush()
+    uploaders.flush()
+    try:
+        result = collection.bulk_write(requests, ordered=False)
+        written = result.upserted_count + result.modified_count
+    except BulkWriteError as e:
+        written = e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        rejectedBatch(label, e)
+    return reportBatch(label, "merged", written, perf_counter() - start_time)
+
+def rejectedBatch(label, error):
+    rejected = len(error.details.get("writeErrors", []))
+    registry.inc("documents_rejected_total", rejected)
+    print(f"{label}: {rejected} documents rejected by the server")
+
+def reportBatch(label, verb, written, duration):
+    registry.inc("documents_written_total", written, mode=verb)
+    registry.inc("batch_seconds_total", duration, mode=verb)
+    registry.inc("batches_total", mode=verb)
+    print(f"{label}: {verb} {written} documents in {duration:.4f} seconds ({written / max(duration, 1e-9):,.0f} docs/sec)")
+    return written
+
+def cleanFolder(cleanDir=None):
+    return cleanDir or os.path.join(os.getcwd(), "cleanData")
+
+def loadShards(collection, input, batchSize, writers, write, cleanDir=None):
+    # Streams every shard through the writer pool and returns the number of documents written.
+    total = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        for path in input:
+            jsonPath = os.path.join(cleanFolder(cleanDir), path)
+            batches = 0
+            for number, batch in enumerate(readBatches(jsonPath, batchSize)):
+                # Back-pressure: stop reading until a writer frees up, so at most
+                # two batches per writer are held in memory at any time.
+                if len(pending) >= writers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total += sum(future.result() for future in done)
+                pending.add(executor.submit(write, collection, batch, f"{path} batch {number}"))
+                batches += 1
+            if not batches:
+                print(f"No valid data found in {path}")
+        total += sum(future.result() for future in pending)
+    return total
+
+def recordShards(db, input, replace=False, cleanDir=None, registry="LoadedShards"):
+    # LoadedShards remembers which shard files (and which version of them) are in Video
+    # (LoadedShardsCompact does the same for VideoCompact).
+    shards = db[registry]
+    if replace:
+        shards.delete_many({})
+    for path in input:
+        state = shardState(os.path.join(cleanFolder(cleanDir), path))
+        shards.replace_one({"_id": path}, dict(state, loaded=datetime.now()), upsert=True)
+
+def newShards(db, input, cleanDir=None, registry="LoadedShards"):
+    # Shards never loaded before, or rewritten by the cleansing step since the last load.
+    loaded = {shard["_id"]: shard for shard in db[registry].find()}
+    changed = []
+    for path in input:
+        state = shardState(os.path.join(cleanFolder(cleanDir), path))
+        previous = loaded.get(path)
+        if not previous or previous["size"] != state["size"] or previous["mtime"] != state["mtime"]:
+            changed.append(path)
+    return changed
+
+def loadPartitions(db, input, batchSize, writers, mode, cleanDir=None):
+    # Partitioned layout (partitions.py): every snapshot is loaded into its own Video_<YYMMDD> collection through a
+    # staging copy, so a reload replaces one crawl while the other partitions stay readable.
+    # Returns (documents written, shards loaded, {snapshot: documents written} for every partition it loaded).
+    bySnapshot = {}
+    for path in input:
+        bySnapshot.setdefault(shardSnapshot(path), []).append(path)
+    for snapshot in sorted(retiredSnapshots(db) & set(bySnapshot)):
+        print(f"skipping retired snapshot {snapshot}")
+        del bySnapshot[snapshot]
+    if mode == "incremental":
+        # A new or changed shard reloads its whole snapshot; partitions without changes are not touched.
+        changed = {shardSnapshot(path) for path in newShards(db, [path for paths in bySnapshot.values() for path in paths], cleanDir, PARTITION_SHARDS)}
+        print(f"{len(changed)} new or changed snapshots to load")
+        stale = []
+        bySnapshot = {snapshot: paths for snapshot, paths in bySnapshot.items() if snapshot in changed}
+    else:
+        # Partitions of snapshots no longer in cleanData go, like their documents would from a rebuilt Video.
+        stale = [snapshot for snapshot in listPartitions(db) if snapshot not in bySnapshot]
+
+    total = 0
+    loaded = []
+    partitions = {}
+    for snapshot, paths in sorted(bySnapshot.items()):
+        staging = db[partitionName(snapshot) + "_staging"]
+        staging.drop()
+        staging.create_index(VIDEO_KEY, unique=True)
+        written = loadShards(staging, paths, batchSize, writers, insertBatch, cleanDir)
+        ensureIndexes(staging)
+        staging.rename(partitionName(snapshot), dropTarget=True)
+        registerPartition(db, snapshot, written)
+        partitions[snapshot] = written
+        total += written
+        loaded += paths
+    dropPartitions(db, stale)
+    recordShards(db, loaded, replace=(mode != "incremental"), cleanDir=cleanDir, registry=PARTITION_SHARDS)
+    return total, loaded, partitions
+
+def main(input, batchSize=BATCH_SIZE, writers=WRITERS, mode="rebuild", client=None, database="YoutubeData", cleanDir=None, derived=True, schema="full"):
+    # client/database/cleanDir let other tools (bench.py) load into another server or database;
+    # derived=False skips the collections built from Video after the load.
+    # schema="compact" loads VideoCompact (one record per video, see compactSchema.py) instead of Video,
+    # schema="partitioned" one Video_<YYMMDD> collection per snapshot (partitions.py).
+
+    # maxPoolSize matches the number of writer threads so each one always has a connection.
+    # The command monitor adds per-command times, documents and bytes to the metrics files.
+    client = client or MongoClient(MONGO_URI, maxPoolSize=writers, event_listeners=[CommandMonitor()])
 
-def main(input):
-    
-    # This is the default spot that mongoDB runs at.
-    # If this doesn't work then check where MongoDB Compass is running the database.
-    client = MongoClient("mongodb://localhost:27017")
-    
     # The database to use
-    db = client["YoutubeData"]
-    
+    db = client[database]
+
     # The specific collection we want in the database
-    collection = db["Video"]
-    
-    
-    # Clear prior data in collection for now.
-    collection.delete_many({})
-    
-    for path in input:
-        jsonPath = os.getcwd() + "\\cleanData\\" + path
-        documents = []
-        with open(jsonPath, "r", encoding="utf-8") as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    try:
-                        documents.append(json.loads(line))
-                    except json.JSONDecodeError as e:
-                        print(f"skipping line due to JSON error: {e}")
-       
-        # Assuming that documents is not an empty array, insert all of its data into the current collection
-        if documents:
-            start_time = perf_counter()
-            result = collection.insert_many(documents) 
-            end_time = perf_counter()
-            duration = end_time - start_time
-            print(f"inserted {len(result.inserted_ids)} documents into collection")
-            print(f"ingestion took {duration:.4f} seconds")
-        else:
-            print("No valid data found in file")
-        
-    
+    compact = schema == "compact"
+    partitioned = schema == "partitioned"
+    # (the partitioned layout has one collection per snapshot, named by loadPartitions)
+    name = COMPACT_COLLECTION if compact else "Video"
+    collection = db[name]
+    shardRegistry = "LoadedShardsCompact" if compact else "LoadedShards"
+    required = COMPACT_INDEXES if compact else REQUIRED_INDEXES
+    if compact:
+        # Compact records are keyed by _id = videoID and merged one snapshot at a time, in both modes.
+        merge = partial(compactBatch, openDictionaries(db))
+
+    start_time = perf_counter()
+    if partitioned:
+        total, input, partitions = loadPartitions(db, input, batchSize, writers, mode, cleanDir)
+    elif mode == "incremental":
+        # Only shards that are new or changed are upserted straight into Video,
+        # which stays fully readable the whole time.
+        input = newShards(db, input, cleanDir, shardRegistry)
+        print(f"{len(input)} new or changed shards to load")
+        if not compact:
+            collection.create_index(VIDEO_KEY, unique=True)
+        total = loadShards(collection, input, batchSize, writers, merge if compact else upsertBatch, cleanDir)
+        recordShards(db, input, cleanDir=cleanDir, registry=shardRegistry)
+        ensureIndexes(collection, required)
+    else:
+        # Full reload into a staging collection that is then renamed over Video in one step,
+        # so app.py keeps reading the old data until the new data is complete.
+        staging = db[name + "_staging"]
+        staging.drop()
+        if not compact:
+            staging.create_index(VIDEO_KEY, unique=True)
+        total = loadShards(staging, input, batchSize, writers, merge if compact else insertBatch, cleanDir)
+        # The query indexes are built before the swap so Video is never served without them.
+        ensureIndexes(staging, required)
+        staging.rename(name, dropTarget=True)
+        recordShards(db, input, replace=True, cleanDir=cleanDir, registry=shardRegistry)
+    # Tells app.py (and refreshStats below) which collection to read.
+    setSchema(db, schema)
+    duration = perf_counter() - start_time
+    print(f"wrote {total} documents into collection")
+    print(f"ingestion took {duration:.4f} seconds ({total / max(duration, 1e-9):,.0f} docs/sec)")
+    recordStage("ingest", duration, mode=mode, schema=schema, documents=total, shards=len(input))
+
+    # Derived collections: an incremental load only merges the shards it just loaded.
+    if derived:
+        jsonPaths = [os.path.join(cleanFolder(cleanDir), path) for path in input]
+        with stage("relatedBy"):
+            buildRelatedBy(db, jsonPaths, rebuild=(mode != "incremental"))
+        with stage("timeSeries"):
+            buildTimeSeries(db, jsonPaths, rebuild=(mode != "incremental"))
+        with stage("dashboardStats"):
+            refreshStats(db)
+        with stage("uploaderSearch"):
+            buildSearchIndex(db, compact)
+    # Tells every running app.py that its cached query results are stale.
+    bumpGeneration(db)
+
+
     # This line ensures that the data has been properly added to the collection by querying
     # the database to fetch the number of documents inside the video collection.
-    print(f"There are {collection.count_documents({})} documents in the video collection")
-        
+    if partitioned:
+        for snapshot, written in sorted(partitions.items()):
+            print(f"There are {db[partitionName(snapshot)].count_documents({})} documents in the {partitionName(snapshot)} collection ({written} written)")
+    else:
+        print(f"There are {collection.count_documents({})} documents in the {name} collection")
+    return {"documents": total, "seconds": duration}
+
 if __name__ == "__main__":
-    paths = os.listdir(".\\cleanData")
-    main(paths);
+    parser = argparse.ArgumentParser(description="Load the cleanData shards into MongoDB")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="documents per insert_many call")
+    parser.add_argument("--writers", type=int, default=WRITERS, help="concurrent writer threads")
+    parser.add_argument("--mode", choices=["rebuild", "incremental"], default="rebuild",
+                        help="rebuild: reload everything through a staging collection; incremental: upsert only new shards")
+    parser.add_argument("--schema", choices=["full", "compact", "partitioned"], default="full",
+                        help="compact: one VideoCompact record per video with coded categories/uploaders (compactSchema.py); "
+                             "partitioned: one Video_<YYMMDD> collection per crawl snapshot (partitions.py)")
+    parser.add_argument("--check", action="store_true",
+                        help="run the run_mongo_checks.py regression checks after the load and exit with status 1 if any fails")
+    parser.add_argument("--metrics", default=os.path.join(os.getcwd(), "metrics"), help="folder for dataInsertion.prom and dataInsertion.jsonl")
+    args = parser.parse_args()
+    if args.check and args.schema == "compact":
+        parser.error("--check runs the Video queries, which the compact schema does not have")
+
+    # Files starting with "_" (like the cleansing manifest) are not data shards.
+    paths = [name for name in sorted(os.listdir(os.path.join(os.getcwd(), "cleanData"))) if not name.startswith("_")]
+    configure("dataInsertion", args.metrics)
+    main(paths, args.batch, args.writers, args.mode, schema=args.schema);
+    registry.flush()
+    if args.check:
+        with stage("checks"):
+            report = runChecks(MongoClient(MONGO_URI)["YoutubeData"])
+        registry.flush()
+        sys.exit(1 if report["failures"] else 0)
 
-""" 
+"""
 Pseudocode:
 
 BEGIN PROGRAM
 
-1. DEFINE FUNCTION main(input_files):
+1. DEFINE FUNCTION readBatches(file, batchSize):
+   snapshot = crawl date from the file name (<YYMMDD>_<depth>.json)
+   FOR each non-blank line of file (read in 8 MB binary blocks, see jsonCodec.py):
+       TRY
+           parse line as JSON (msgspec/orjson when installed), set its snapshot and add it to the current batch
+       CATCH JSON error:
+           print "skipping line due to JSON error"
+       IF batch holds batchSize documents:
+           yield batch and start a new one
+   yield the last partial batch
+
+2. DEFINE FUNCTION loadShards(collection, input_files, batchSize, writers, write):
+   FOR each filename in input_files:
+       FOR each batch from readBatches(cleanData\filename, batchSize):
+           IF 2 * writers batches are already in flight:
+               wait for one to finish
+           hand batch to a writer thread:
+               rebuild:     insert_many(batch, ordered=False)
+               incremental: bulk_write(UpdateOne({videoID, snapshot}, $set doc, upsert), ordered=False)
+               print docs written and docs/sec for the batch
+   wait for remaining batches
+
+3. DEFINE FUNCTION main(input_files, batchSize, writers, mode, schema):
 
    // Step 1: Connect to MongoDB
-   connect to MongoDB at "mongodb://localhost:27017"
+   connect to MongoDB at "mongodb://localhost:27017" with a pool of 'writers' connections
+   and a command monitor that times every command (instrumentation.py)
    select database "YoutubeData"
-   select collection "Video"
-
-   // Step 2: Reset collection
-   delete all documents from "Video" collection
+   select collection "Video" (or "VideoCompact" and LoadedShardsCompact if schema is compact)
 
-   // Step 3: Process each input file
-   FOR each filename in input_files:
-       build full path = current working directory + "\cleanData\" + filename
-       create empty list 'documents'
-
-       OPEN file at full path
-       FOR each line in file:
-           trim whitespace
-           IF line is not empty:
-               TRY
-                   parse line as JSON
-                   append parsed object to 'documents'
-               CATCH JSON error:
-                   print "skipping line due to JSON error"
-
-   // Step 4: Insert into MongoDB
-   IF 'documents' list is not empty:
-       record start time
-       insert all documents into collection
-       record end time
-       calculate duration = end - start
-       print "inserted N documents"
-       print "ingestion took X seconds"
+   // Step 2: Load
+   IF mode is incremental:
+       keep only files missing from LoadedShards or changed since they were loaded
+       ensure unique index on (videoID, snapshot)
+       loadShards(Video, files, upsert)
+       record the files in LoadedShards
+       build any missing query index (indexes.py)
    ELSE:
-       print "No valid data found in file"
+       drop "Video_staging" and create the unique (videoID, snapshot) index on it
+       loadShards(Video_staging, all files, insert)
+       build the query indexes (indexes.py) on "Video_staging"
+       rename "Video_staging" to "Video", replacing the old collection
+       reset LoadedShards to all files
+   (partitioned schema: each snapshot with new or changed shards, or every snapshot on a rebuild, is loaded
+    into Video_<snapshot>_staging, indexed and renamed to Video_<snapshot>; retired snapshots are skipped and
+    a rebuild drops the partitions of snapshots no longer in cleanData, see partitions.py)
+   (compact schema: instead of insert/upsert, each document's static fields are set once per video with
+    coded uploader/category and packed related IDs, and its snapshot observation is added to the video's
+    s array, replacing any earlier one for that snapshot; new codes go to Categories/Uploaders first)
+   store the schema in Meta so app.py and refreshStats read the right collection
+   print total written, total time and overall docs/sec
+   record the ingest stage time; each batch adds to the documents written/rejected counters
+
+   // Step 3: Derived collections
+   merge the loaded files into the RelatedBy reverse index (relatedIndex.py),
+   and the VideoSeries/VideoTrend time series (timeSeries.py),
+   rebuilding them from scratch unless the load was incremental
+   refresh the DashboardStats document (dashboardStats.py)
+   rebuild the UploaderSearch prefix/fuzzy/text search collection (searchIndex.py)
+   bump the load generation so app.py drops its cached query results (queryCache.py)
 
-   // Step 5: Verify ingestion
-   count = number of documents in collection
+   // Step 4: Verify ingestion
+   count = number of documents in collection (in each partition it loaded, for the partitioned schema)
    print "There are count documents in the video collection"
 
-2. MAIN EXECUTION:
-   list all files in ".\cleanData" directory
-   call main(list_of_files)
+4. MAIN EXECUTION:
+   read --batch, --writers, --mode and --schema options
+   list all data files in ".\cleanData" directory (skipping _manifest.json)
+   call main(list_of_files, batch, writers, mode, schema)
+   write metrics/dataInsertion.prom and metrics/dataInsertion.jsonl
+   IF --check: run the run_mongo_checks.py checks against the new data and exit with status 1 if any failed
 
-END PROGRAM """
\ No newline at end of file
+END PROGRAM """
@@ -1,59 +1,160 @@
 # Reduces dataset by randomly finding a subset of lines. This reduction is done to work with a smaller dataset during milestones 1-3.
-import csv
+# The input is read in a single pass with reservoir sampling, so memory only depends on the number of lines kept, not the input size.
 import argparse
+import json
+import math
+import os
 import random
-from collections import defaultdict
+import re
 
 # Random sample
-random.seed(42)
-
-def reduceData(inp, outp, targetNum):
-    lines = []
-    with open(inp, 'r', encoding='utf-8') as f:
-        for line in f:
-            lines.append(line.strip())
-    # If number of lines in file is less than targetNum, use the whole file
-    if len(lines) <= targetNum:
-        print("File smaller than target size. Copying all lines.")
-        sampled = lines
+SEED = 42
+SNAPSHOT_NAME = re.compile(r"(\d{6})")
+
+def inputFiles(inputs):
+    # Accepts files and folders (every data file in a folder, skipping "_" files like the cleansing manifest).
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if not name.startswith("_"))
+        else:
+            files.append(path)
+    return files
+
+def readLines(files):
+    # Yields (file, line) for every non-empty line of every file, one line at a time.
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield path, line
+
+def uniform(rng):
+    # Uniform value in (0, 1); random() can return exactly 0.0, which has no logarithm.
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return value
+
+def reservoirSample(items, targetNum, rng):
+    # Algorithm L: keeps a uniform random sample of targetNum items from a stream of unknown length.
+    # Instead of drawing a random number per item it computes how many items to skip before the next replacement.
+    if targetNum <= 0:
+        return []
+    reservoir = []
+    items = iter(items)
+    for item in items:
+        reservoir.append(item)
+        if len(reservoir) == targetNum:
+            break
+    if len(reservoir) < targetNum:
+        return reservoir
+    w = math.exp(math.log(uniform(rng)) / targetNum)
+    nextIndex = targetNum + math.floor(math.log(uniform(rng)) / math.log(1 - w))
+    for index, item in enumerate(items, start=targetNum):
+        if index == nextIndex:
+            reservoir[rng.randrange(targetNum)] = item
+            w *= math.exp(math.log(uniform(rng)) / targetNum)
+            nextIndex += math.floor(math.log(uniform(rng)) / math.log(1 - w)) + 1
+    return reservoir
+
+def stratifiedSample(items, targetNum, key, rng):
+    # Algorithm R per stratum: up to targetNum items from every value of key(item).
+    reservoirs = {}
+    seen = {}
+    for item in items:
+        stratum = key(item)
+        count = seen.get(stratum, 0) + 1
+        seen[stratum] = count
+        reservoir = reservoirs.setdefault(stratum, [])
+        if len(reservoir) < targetNum:
+            reservoir.append(item)
+        else:
+            slot = rng.randrange(count)
+            if slot < targetNum:
+                reservoir[slot] = item
+    for stratum in sorted(reservoirs, key=str):
+        print(f"  {stratum}: kept {len(reservoirs[stratum])} of {seen[stratum]} lines")
+    return [item for stratum in sorted(reservoirs, key=str) for item in reservoirs[stratum]]
+
+def categoryKey(item):
+    try:
+        return json.loads(item[1]).get("category")
+    except (ValueError, AttributeError):
+        return None
+
+def snapshotKey(item):
+    match = SNAPSHOT_NAME.search(os.path.basename(item[0]))
+    return match.group(1) if match else None
+
+STRATA = {"category": categoryKey, "snapshot": snapshotKey}
+
+def reduceData(inp, outp, targetNum, stratify=None, seed=SEED):
+    # inp can be one file, a folder or a list of them; all of them are sampled together in one pass.
+    # With stratify ("category" or "snapshot") targetNum lines are kept for every category/snapshot.
+    rng = random.Random(seed)
+    lines = readLines(inputFiles(inp))
+    if stratify:
+        sampled = stratifiedSample(lines, targetNum, STRATA[stratify], rng)
     else:
-        # Random sample 
-        sampled = random.sample(lines, targetNum)
+        sampled = reservoirSample(lines, targetNum, rng)
+        # If number of lines in the input is less than targetNum, the whole input is kept
+        if len(sampled) < targetNum:
+            print("File smaller than target size. Copying all lines.")
     # Saved dataset
     with open(outp, 'w', encoding='utf-8', newline='') as out:
-        for line in sampled:
+        for _, line in sampled:
             out.write(line + '\n')
 
     print(f"Data reduction complete. {len(sampled)} lines saved to {outp}.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Reduce dataset to manageable size")
-    parser.add_argument("inp")
+    parser.add_argument("inp", nargs="+", help="input file(s) or folder(s), e.g. cleanData")
     parser.add_argument("outp")
     parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--stratify", choices=sorted(STRATA), default=None, help="keep --n lines per category or per snapshot")
+    parser.add_argument("--seed", type=int, default=SEED)
     args = parser.parse_args()
 
-    reduceData(args.inp, args.outp, args.n)
+    reduceData(args.inp, args.outp, args.n, args.stratify, args.seed)
 
 
 """
 Pseudocode:
 
-Algorithm sampleData(input, output, targetNum)
-    # reduce dataset size by randomly selecting a subset of lines
+Algorithm sampleData(inputs, output, targetNum, stratify, seed)
+    # reduce dataset size by randomly selecting a subset of lines in one pass
 
-    Initialize empty list lines
+    rng ← random generator seeded with seed
+    stream ← every non-empty line of every input file
 
-    Open input for reading
-        For each line in input:
-            Remove newline characters
-            Append line to lines
-    Close input
-
-    If number of lines ≤ targetNum then
-        sampled ← lines
+    If stratify is not set then
+        # Algorithm L reservoir sampling
+        reservoir ← first targetNum lines of stream
+        w ← exp(log(random) / targetNum)
+        next ← position of the next line to keep, skipping floor(log(random) / log(1 - w)) lines
+        For each remaining line in stream:
+            If line is at position next then
+                replace a random reservoir slot with line
+                w ← w * exp(log(random) / targetNum)
+                next ← next + floor(log(random) / log(1 - w)) + 1
+            End If
+        sampled ← reservoir
     Else
-        sampled ← randomly select targetNum lines from lines
+        # Algorithm R per category/snapshot
+        For each line in stream:
+            s ← stratum of line, seen[s] ← seen[s] + 1
+            If reservoir[s] holds fewer than targetNum lines then
+                append line to reservoir[s]
+            Else
+                j ← random integer in [0, seen[s])
+                If j < targetNum then reservoir[s][j] ← line
+            End If
+        sampled ← all reservoirs
     End If
 
     Open output for writing
@@ -63,4 +164,4 @@ Algorithm sampleData(input, output, targetNum)
 
     Print "Data reduction complete. Saved", number of sampled, "lines."
 End Algorithm
-"""
\ No newline at end of file
+"""
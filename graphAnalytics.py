@@ -0,0 +1,232 @@
+# Graph analytics over the related-video network: PageRank, in/out-degree, weakly connected components and k-hop neighborhoods.
+# Video IDs are interned to int32 node numbers and the edges are stored as a CSR adjacency (indptr/indices NumPy arrays),
+# which is a few bytes per edge instead of a dict of string lists. Results are saved to the GraphStats collection for app.py.
+from pymongo import MongoClient, ASCENDING, DESCENDING, InsertOne
+from array import array
+import numpy as np
+import argparse
+import os
+from time import perf_counter
+from jsonCodec import iterDocuments, decodeLinks
+
+MONGO_URI = "mongodb://localhost:27017"
+BATCH_SIZE = 5000
+
+class VideoGraph:
+    # Directed graph in CSR form: the out-neighbors of node i are indices[indptr[i]:indptr[i + 1]].
+    def __init__(self, ids, indptr, indices, index=None):
+        self.ids = ids # node number -> videoID
+        # videoID -> node number. buildGraph hands over the dict it interned the IDs with, so no second copy is built.
+        self.index = index if index is not None else {video_id: node for node, video_id in enumerate(ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.n = len(ids)
+
+    def sources(self):
+        # Source node of every edge, aligned with indices.
+        return np.repeat(np.arange(self.n, dtype=np.int32), np.diff(self.indptr))
+
+def buildGraph(jsonPaths):
+    # Reads the related lists of every shard into a deduplicated CSR graph. Edges seen in several snapshots are kept once.
+    index = {}
+    ids = []
+    src = array("i")
+    dst = array("i")
+
+    def intern(video_id):
+        node = index.get(video_id)
+        if node is None:
+            node = index[video_id] = len(ids)
+            ids.append(video_id)
+        return node
+
+    for jsonPath in jsonPaths:
+        # Only videoID and related are decoded from each line.
+        for document in iterDocuments(jsonPath, decodeLinks):
+            node = intern(document["videoID"])
+            for target in document.get("related") or []:
+                src.append(node)
+                dst.append(intern(target))
+
+    n = len(ids)
+    # Sorting the packed (src, dst) keys both removes duplicate edges and groups edges by source.
+    keys = np.unique(np.frombuffer(src, dtype=np.int32).astype(np.int64) * n + np.frombuffer(dst, dtype=np.int32))
+    sources = (keys // max(n, 1)).astype(np.int32)
+    indices = (keys % max(n, 1)).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return VideoGraph(ids, indptr, indices, index)
+
+def degrees(graph):
+    outDegree = np.diff(graph.indptr).astype(np.int32)
+    inDegree = np.bincount(graph.indices, minlength=graph.n).astype(np.int32)
+    return inDegree, outDegree
+
+def pagerank(graph, damping=0.85, tol=1e-9, maxIter=100):
+    # Power iteration. Rank from nodes without out-links (videos only seen as a related target) is spread evenly.
+    n = graph.n
+    if n == 0:
+        return np.zeros(0)
+    outDegree = np.diff(graph.indptr)
+    sources = graph.sources()
+    dangling = outDegree == 0
+    weights = 1.0 / np.where(dangling, 1, outDegree)
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(maxIter):
+        share = rank * weights
+        spread = np.bincount(graph.indices, weights=share[sources], minlength=n)
+        updated = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+        delta = np.abs(updated - rank).sum()
+        rank = updated
+        if delta < tol:
+            break
+    print(f"PageRank converged after {iteration + 1} iterations (delta {delta:.2e})")
+    return rank
+
+def components(graph):
+    # Weakly connected components by min-label propagation over both edge directions,
+    # with pointer jumping (label = label[label]) so long chains collapse quickly.
+    labels = np.arange(graph.n, dtype=np.int32)
+    sources = graph.sources()
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[sources], labels[graph.indices])
+        np.minimum.at(labels, sources, smallest)
+        np.minimum.at(labels, graph.indices, smallest)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, previous):
+            return labels
+
+def neighbors(indptr, indices, frontier):
+    # Every CSR row of the frontier nodes, concatenated: each row's offsets into indices are indptr[node] + 0..count-1,
+    # built with one np.repeat instead of a Python slice per node.
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    rowStarts = np.cumsum(counts) - counts # where each row begins in the output
+    positions = np.arange(counts.sum()) + np.repeat(starts - rowStarts, counts)
+    return indices[positions]
+
+def kHop(graph, video_id, k=2, undirected=False):
+    # Nodes reachable from video_id in 1..k hops: {hop: [videoIDs]}.
+    start = graph.index.get(video_id)
+    if start is None:
+        return {}
+    if undirected:
+        # Adds reversed edges by building the transposed CSR once.
+        order = np.argsort(graph.indices, kind="stable")
+        reverseIndptr = np.zeros(graph.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(graph.indices, minlength=graph.n), out=reverseIndptr[1:])
+        reverseIndices = graph.sources()[order]
+    visited = np.zeros(graph.n, dtype=bool)
+    visited[start] = True
+    frontier = np.array([start], dtype=np.int64)
+    hops = {}
+    for hop in range(1, k + 1):
+        reached = neighbors(graph.indptr, graph.indices, frontier)
+        if undirected:
+            reached = np.concatenate([reached, neighbors(reverseIndptr, reverseIndices, frontier)])
+        reached = np.unique(reached)
+        reached = reached[~visited[reached]]
+        if reached.size == 0:
+            break
+        visited[reached] = True
+        hops[hop] = [graph.ids[node] for node in reached]
+        frontier = reached
+    return hops
+
+def saveGraphStats(db, graph, rank, inDegree, outDegree, labels):
+    # Writes one GraphStats document per node into a staging collection and swaps it in.
+    componentSize = np.bincount(labels, minlength=graph.n)
+    staging = db["GraphStats_staging"]
+    staging.drop()
+    batch = []
+    for node in range(graph.n):
+        batch.append(InsertOne({
+            "videoID": graph.ids[node],
+            "pagerank": float(rank[node]),
+            "inDegree": int(inDegree[node]),
+            "outDegree": int(outDegree[node]),
+            "component": int(labels[node]),
+            "componentSize": int(componentSize[labels[node]]),
+        }))
+        if len(batch) >= BATCH_SIZE:
+            staging.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        staging.bulk_write(batch, ordered=False)
+    staging.create_index([("videoID", ASCENDING)], unique=True)
+    staging.create_index([("pagerank", DESCENDING)])
+    staging.rename("GraphStats", dropTarget=True)
+
+def analyze(db, jsonPaths):
+    start_time = perf_counter()
+    graph = buildGraph(jsonPaths)
+    print(f"graph: {graph.n} videos, {graph.indices.size} edges ({(graph.indptr.nbytes + graph.indices.nbytes) / 2**20:.1f} MB CSR) in {perf_counter() - start_time:.4f} seconds")
+    inDegree, outDegree = degrees(graph)
+    rank = pagerank(graph)
+    labels = components(graph)
+    print(f"{len(np.unique(labels))} weakly connected components, largest has {np.bincount(labels).max()} videos")
+    if db is not None:
+        saveGraphStats(db, graph, rank, inDegree, outDegree, labels)
+    print(f"graph analytics took {perf_counter() - start_time:.4f} seconds")
+    return graph
+
+def topPageRank(db, limit=25):
+    return list(db["GraphStats"].find({}, {"_id": 0}).sort("pagerank", DESCENDING).limit(limit))
+
+def graphStats(db, video_id):
+    return db["GraphStats"].find_one({"videoID": video_id}, {"_id": 0})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PageRank, degrees, components and k-hop neighborhoods of the related-video graph")
+    parser.add_argument("--khop", default=None, help="print the k-hop neighborhood of this videoID")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--undirected", action="store_true", help="follow related links in both directions for --khop")
+    parser.add_argument("--no-save", action="store_true", help="do not write GraphStats to MongoDB")
+    args = parser.parse_args()
+
+    folder = os.path.join(os.getcwd(), "cleanData")
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if not name.startswith("_")]
+    db = None if args.no_save else MongoClient(MONGO_URI)["YoutubeData"]
+    graph = analyze(db, paths)
+    if args.khop:
+        for hop, reached in kHop(graph, args.khop, args.k, args.undirected).items():
+            print(f"{hop} hop(s): {len(reached)} videos, e.g. {', '.join(reached[:10])}")
+
+
+"""
+Pseudocode:
+
+buildGraph(files):
+    FOR each document in files:
+        give document.videoID and every related ID an int32 node number (first come, first numbered)
+        add an edge videoID -> related for each related ID
+    sort and deduplicate the edges as (src * n + dst) keys
+    indptr = running total of edges per source, indices = edge targets
+
+pagerank(graph):
+    rank = 1/n for every node
+    REPEAT until the total change is tiny (or 100 times):
+        every node sends rank / outDegree to each out-neighbor (np.bincount over the edges)
+        rank of nodes with no out-links is shared evenly by all nodes
+        rank = (1 - 0.85) / n + 0.85 * received
+
+components(graph):
+    label = own node number
+    REPEAT until no label changes:
+        both ends of every edge take the smaller of their labels
+        follow label = label[label] until stable
+
+kHop(graph, video, k):
+    frontier = {video}
+    FOR hop in 1..k:
+        frontier = unvisited out-neighbors (and in-neighbors if undirected) of frontier (all CSR rows gathered at once)
+
+saveGraphStats: write {videoID, pagerank, inDegree, outDegree, component, componentSize}
+to GraphStats_staging and rename it over GraphStats
+
+"""
@@ -0,0 +1,43 @@
+# Declares the indexes that the queries in app.py and run_mongo_checks.py rely on, builds them and reports any that are missing.
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# One document per video per crawl date. The videoID prefix also serves find_one({"videoID": ...}).
+VIDEO_KEY = [("videoID", ASCENDING), ("snapshot", ASCENDING)]
+
+# Every index the Video collection needs, with the query it serves.
+REQUIRED_INDEXES = [
+    {"keys": VIDEO_KEY, "unique": True}, # find_one({"videoID": ...})
+    {"keys": [("uploader", ASCENDING), ("videoID", ASCENDING)]}, # find({"uploader": ...}), paged in videoID order (paging.py)
+    {"keys": [("related", ASCENDING), ("videoID", ASCENDING)]}, # find({"related": target_id}) paged in videoID order (multikey over the array)
+    {"keys": [("category", ASCENDING)]}, # $group / filters by category
+    {"keys": [("views", DESCENDING), ("rating", DESCENDING)]}, # views vs. rating sample and top-viewed lists
+]
+
+# The VideoCompact collection (compactSchema.py) is keyed by _id = videoID, which MongoDB always indexes.
+COMPACT_INDEXES = [
+    {"keys": [("u", ASCENDING), ("_id", ASCENDING)]}, # find({"u": uploader code}), paged in _id order
+    {"keys": [("c", ASCENDING)]}, # filters by category code
+]
+
+def ensureIndexes(collection, required=REQUIRED_INDEXES):
+    # Builds any missing index. Existing indexes with the same keys are left alone, so this is cheap to rerun.
+    missing = missingIndexes(collection, required)
+    if missing:
+        models = [IndexModel(index["keys"], unique=index.get("unique", False), background=True) for index in missing]
+        names = collection.create_indexes(models)
+        print(f"created indexes on {collection.name}: {', '.join(names)}")
+    return missing
+
+def keyDirection(direction):
+    # The server may report 1 as 1.0; text, hashed and 2dsphere keys have a string type and are kept as they are.
+    return int(direction) if isinstance(direction, (int, float)) else direction
+
+def missingIndexes(collection, required=REQUIRED_INDEXES):
+    # Compares the declared indexes against the key patterns that actually exist on the collection.
+    existing = [[(field, keyDirection(direction)) for field, direction in info["key"]]
+                for info in collection.index_information().values()]
+    return [index for index in required if [(field, keyDirection(direction)) for field, direction in index["keys"]] not in existing]
+
+def describeIndex(index):
+    names = {ASCENDING: "asc", DESCENDING: "desc"}
+    return ", ".join(f"{field} {names.get(keyDirection(direction), direction)}" for field, direction in index["keys"])
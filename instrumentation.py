@@ -0,0 +1,324 @@
+# Shared instrumentation for the pipeline scripts and app.py: stage timers, counters and MongoDB command monitoring.
+# Metrics are written to metrics/<job>.prom in the Prometheus text format (for node_exporter's textfile collector)
+# and events (stage timings, slow commands, a final summary) are appended to metrics/<job>.jsonl, one JSON object per line.
+from pymongo import monitoring
+from bson.raw_bson import RawBSONDocument
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+import bson
+import contextvars
+import itertools
+import json
+import os
+
+PREFIX = "youtube"
+SLOW_MS = 100 # commands slower than this are logged and kept for the Performance page
+RECENT_SLOW = 50 # slow commands kept in memory
+# pymongo hands listeners the decoded reply, not its wire size, and re-encoding every reply costs about as much as
+# decoding it. Reply bytes are measured on one reply in BYTES_SAMPLE (counted BYTES_SAMPLE times) and on every slow command.
+BYTES_SAMPLE = 16
+# Fields the driver adds to every command; they are not part of the query and explain rejects them.
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+                 "apiVersion", "apiStrict", "apiDeprecationErrors", "signature"}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+
+# name -> (Prometheus type, help text). Every metric written by the scripts is declared here.
+METRICS = {
+    "stage_seconds": ("gauge", "Wall time of the last run of a pipeline stage"),
+    "stage_runs_total": ("counter", "Pipeline stage runs, by outcome"),
+    "files_total": ("counter", "Depth files seen by the cleansing step, by status"),
+    "rows_total": ("counter", "Rows read by cleanRow, by snapshot and outcome (kept/rejected)"),
+    "documents_written_total": ("counter", "Documents written to MongoDB by the loader"),
+    "documents_rejected_total": ("counter", "Documents the server refused during a bulk write"),
+    "batch_seconds_total": ("counter", "Time spent in bulk write calls"),
+    "batches_total": ("counter", "Bulk write calls"),
+    "mongo_commands_total": ("counter", "MongoDB commands, by command name and collection"),
+    "mongo_command_failures_total": ("counter", "MongoDB commands that failed"),
+    "mongo_command_seconds_total": ("counter", "Time spent waiting for MongoDB commands"),
+    "mongo_command_seconds_max": ("gauge", "Slowest MongoDB command"),
+    "mongo_command_docs_total": ("counter", "Documents returned (or written) by MongoDB commands"),
+    "mongo_command_bytes_total": ("counter", "BSON bytes of MongoDB replies (estimated from a sample of the replies)"),
+    "page_seconds": ("gauge", "Last run of an app.py page: total, MongoDB and render time"),
+    "crawl_videos_per_second": ("gauge", "Crawl throughput from log.txt, by snapshot and BFS depth"),
+    "crawl_reject_rate": ("gauge", "Share of a crawl's rows rejected by cleanRow"),
+    "crawl_flags": ("gauge", "Problems found in a crawl (truncated or missing depth files, slow depths, high reject rate)"),
+    "check_seconds": ("gauge", "Time of the last run of a run_mongo_checks.py check"),
+    "check_failed": ("gauge", "1 if the last run of a run_mongo_checks.py check failed its snapshot or latency comparison"),
+}
+
+class Registry:
+    def __init__(self, job="youtube", outDir=None):
+        self.job = job
+        self.outDir = outDir # None: metrics are only kept in memory
+        self.values = {} # (name, labels) -> value
+        self.lock = Lock()
+
+    def key(self, name, labels):
+        if name not in METRICS:
+            raise KeyError(f"undeclared metric {name}")
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def max(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+    def get(self, name, **labels):
+        return self.values.get(self.key(name, labels), 0)
+
+    def series(self, name):
+        # [(labels dict, value)] of one metric.
+        with self.lock:
+            return [(dict(labels), value) for (metric, labels), value in self.values.items() if metric == name]
+
+    def event(self, kind, **fields):
+        # Appends one line to the JSON log.
+        if self.outDir is None:
+            return
+        line = json.dumps(dict({"time": datetime.now().isoformat(timespec="milliseconds"), "job": self.job, "event": kind}, **fields), default=str)
+        with self.lock:
+            os.makedirs(self.outDir, exist_ok=True)
+            with open(os.path.join(self.outDir, f"{self.job}.jsonl"), "a", encoding="utf-8") as log:
+                log.write(line + "\n")
+
+    def prometheus(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        lines = []
+        for name in sorted({metric for (metric, _), _ in values}):
+            kind, description = METRICS[name]
+            lines.append(f"# HELP {PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for (metric, labels), value in values:
+                if metric == name:
+                    labelText = ",".join(f'{label}="{escapeLabel(text)}"' for label, text in (("job", self.job),) + labels)
+                    lines.append(f"{PREFIX}_{name}{{{labelText}}} {value:.6g}" if isinstance(value, float) else f"{PREFIX}_{name}{{{labelText}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        # Rewrites the Prometheus file (through a temporary file, so a scrape never sees half of it)
+        # and logs every current value as a summary event.
+        if self.outDir is None:
+            return None
+        os.makedirs(self.outDir, exist_ok=True)
+        path = os.path.join(self.outDir, f"{self.job}.prom")
+        with open(path + ".tmp", "w", encoding="utf-8") as out:
+            out.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+        self.event("summary", metrics=[dict(labels, metric=name, value=value) for name in sorted(METRICS) for labels, value in self.series(name)])
+        return path
+
+def escapeLabel(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# One registry per process; configure() names it and turns on the output files.
+registry = Registry()
+
+def configure(job, outDir=None):
+    registry.job = job
+    registry.outDir = outDir
+    return registry
+
+@contextmanager
+def stage(name):
+    # Times one pipeline stage: with stage("ingest"): ...
+    start = perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        recordStage(name, perf_counter() - start, outcome)
+
+def recordStage(name, seconds, outcome="ok", **fields):
+    # For stages a script already times itself; fields are extra values for the JSON log (e.g. documents=...).
+    registry.set("stage_seconds", seconds, stage=name)
+    registry.inc("stage_runs_total", stage=name, outcome=outcome)
+    registry.event("stage", stage=name, outcome=outcome, seconds=round(seconds, 4), **fields)
+
+def commandCollection(event):
+    # Collection a command works on: the value of its first field (find: "Video"), or getMore's "collection".
+    target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+    return target if isinstance(target, str) else ""
+
+def replyDocuments(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    return reply.get("n", 0) if isinstance(reply.get("n"), int) else 0
+
+def replyBytes(reply):
+    # Raw replies (RawBSONDocument) already hold their bytes; decoded ones are encoded again.
+    return len(reply.raw) if isinstance(reply, RawBSONDocument) else len(bson.encode(reply))
+
+def explainableCommand(event):
+    # A copy of a read command without the driver's session fields, or None for other commands.
+    if event.command_name not in EXPLAINABLE:
+        return None
+    return {field: value for field, value in event.command.items() if field not in DRIVER_FIELDS}
+
+class CommandMonitor(monitoring.CommandListener):
+    # Records every command a client sends: count, time, documents and (sampled) reply bytes per (command, collection).
+    # Commands slower than slowMs are logged with their query so app.py can explain() them.
+    # Pass it to the client (MongoClient(uri, event_listeners=[monitor])). Events are delivered on the thread
+    # that ran the command, so a run started with startRun() collects the commands sent from its context
+    # (including queryRunner.py workers, which run in a copy of it) and app.py can split a page's time
+    # into MongoDB time and render time.
+    def __init__(self, metrics=None, slowMs=SLOW_MS, keep=RECENT_SLOW, bytesSample=BYTES_SAMPLE):
+        self.metrics = metrics or registry
+        self.slowMs = slowMs
+        self.bytesSample = bytesSample
+        self.replies = itertools.count() # next() on a count is atomic, so threads can share it
+        self.slow = deque(maxlen=keep) # most recent slow commands, newest last
+        self.inFlight = {} # (request_id, connection_id) -> (collection, explainable command)
+        self.lock = Lock()
+        self.run = contextvars.ContextVar("commandRun", default=None) # [(start, end)] of the current run's commands
+
+    def started(self, event):
+        with self.lock:
+            self.inFlight[(event.request_id, event.connection_id)] = (commandCollection(event), explainableCommand(event))
+
+    def succeeded(self, event):
+        with self.lock:
+            collection, query = self.inFlight.pop((event.request_id, event.connection_id), ("", None))
+        seconds = event.duration_micros / 1e6
+        docs = replyDocuments(event.reply)
+        slow = seconds * 1000 >= self.slowMs
+        sampled = next(self.replies) % self.bytesSample == 0
+        size = replyBytes(event.reply) if slow or sampled else None
+        labels = {"command": event.command_name, "collection": collection}
+        self.metrics.inc("mongo_commands_total", **labels)
+        self.metrics.inc("mongo_command_seconds_total", seconds, **labels)
+        self.metrics.max("mongo_command_seconds_max", seconds, **labels)
+        self.metrics.inc("mongo_command_docs_total", docs, **labels)
+        if sampled:
+            self.metrics.inc("mongo_command_bytes_total", size * self.bytesSample, **labels)
+        self.addRunTime(seconds)
+        if slow:
+            entry = {"time": datetime.now(), "database": event.database_name, "command": event.command_name,
+                     "collection": collection, "ms": round(seconds * 1000, 2), "docs": docs, "bytes": size, "query": query}
+            with self.lock:
+                self.slow.append(entry)
+            self.metrics.event("slow_command", **{field: value for field, value in entry.items() if field != "time"})
+
+    def failed(self, event):
+        with self.lock:
+            collection, _ = self.inFlight.pop((event.request_id, event.connection_id), ("", None))
+        self.metrics.inc("mongo_command_failures_total", command=event.command_name, collection=collection)
+        self.addRunTime(event.duration_micros / 1e6)
+
+    def addRunTime(self, seconds):
+        intervals = self.run.get()
+        if intervals is not None:
+            end = perf_counter()
+            intervals.append((end - seconds, end)) # list.append is atomic, workers can share the list
+
+    def startRun(self):
+        self.run.set([])
+
+    def runTime(self):
+        # (seconds, commands) of the current run. Commands that overlapped (concurrent queries) are counted
+        # once, so the seconds are the wall time during which at least one command was in flight.
+        intervals = sorted(self.run.get() or [])
+        busy = 0.0
+        reached = None
+        for start, end in intervals:
+            if reached is None or start > reached:
+                busy += end - start
+                reached = end
+            elif end > reached:
+                busy += end - reached
+                reached = end
+        return busy, len(intervals)
+
+    def recentSlow(self):
+        with self.lock:
+            return list(reversed(self.slow))
+
+def commandTable(metrics=None):
+    # Per (command, collection) totals for display: count, mean/max ms, documents and bytes.
+    metrics = metrics or registry
+    rows = {}
+    for name, column in (("mongo_commands_total", "count"), ("mongo_command_seconds_total", "seconds"), ("mongo_command_seconds_max", "max"),
+                         ("mongo_command_docs_total", "docs"), ("mongo_command_bytes_total", "bytes")):
+        for labels, value in metrics.series(name):
+            rows.setdefault((labels["command"], labels["collection"]), {})[column] = value
+    table = []
+    for (command, collection), row in sorted(rows.items(), key=lambda item: -item[1].get("seconds", 0)):
+        count = row.get("count", 0)
+        table.append({"command": command, "collection": collection, "count": count,
+                      "mean ms": round(1000 * row.get("seconds", 0) / max(count, 1), 2), "max ms": round(1000 * row.get("max", 0), 2),
+                      "docs": row.get("docs", 0), "bytes": row.get("bytes", 0)})
+    return table
+
+def explain(client, entry, verbosity="queryPlanner"):
+    # Asks the server how it runs a recorded command (no documents are returned).
+    return client[entry["database"]].command({"explain": entry["query"], "verbosity": verbosity})
+
+def planSummary(plan):
+    # One-line description of the winning plan, e.g. "LIMIT <- FETCH <- IXSCAN {uploader: 1}".
+    # find/count explains carry queryPlanner at the top; aggregate explains carry it in their first $cursor stage.
+    planner = plan.get("queryPlanner")
+    if planner is None:
+        for stage in plan.get("stages", []):
+            planner = stage.get("$cursor", {}).get("queryPlanner")
+            if planner:
+                break
+    if not planner:
+        return "no query plan (the command did not read a collection)"
+    steps = []
+    node = planner.get("winningPlan", {})
+    node = node.get("queryPlan", node) # slot-based engine wraps the classic plan
+    while node:
+        step = node.get("stage", "?")
+        if node.get("indexName"):
+            step += f" {node['indexName']}"
+        steps.append(step)
+        children = node.get("inputStages") or [node.get("inputStage")]
+        node = children[0] if children else None
+    return " <- ".join(steps)
+
+
+"""
+Pseudocode:
+
+registry = metrics of this process: {(name, labels): value}
+configure(job, outDir): name the output files outDir/<job>.prom and outDir/<job>.jsonl
+
+stage(name):
+    start timer
+    run the stage
+    set stage_seconds{stage}, count stage_runs_total{stage, outcome}, log a "stage" event
+
+CommandMonitor (registered on a MongoClient):
+    started(event): remember the collection and, for find/aggregate/count/distinct, the command without driver fields
+    succeeded(event):
+        docs = size of the cursor batch (or n)
+        bytes = BSON size of the reply, measured on every 16th reply (counted 16 times) and on slow commands
+        add count, time, max time, docs and bytes to the (command, collection) metrics
+        add the (start, end) of the command to the current run, if one was started
+        IF slower than SLOW_MS: keep it in the recent slow list and log a "slow_command" event
+    failed(event): count the failure
+    runTime(): length of the union of the current run's command intervals, and the number of commands
+
+flush():
+    write every metric to <job>.prom.tmp in Prometheus text format and rename it to <job>.prom
+    log all values as a "summary" event
+
+explain(client, slow command): run {explain: query, verbosity: queryPlanner} on its database
+planSummary(plan): follow winningPlan through its input stages, e.g. "LIMIT <- FETCH <- IXSCAN uploader_1"
+
+"""
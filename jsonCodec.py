@@ -0,0 +1,135 @@
+# Pluggable JSON codec for the cleanse and ingest hot loops. orjson and msgspec are used when they are installed
+# (both optional: pip install orjson msgspec) and the stdlib json module otherwise; every backend writes and reads the
+# same JSON lines. With msgspec the shards are decoded against a typed schema, which checks the field types while parsing.
+# Shards are read in large binary blocks and lines are handed to the decoder as memoryview slices of the block,
+# so no str or bytes copy is made per line.
+from typing import List, Optional, TypedDict
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+BLOCK_SIZE = 8 << 20 # bytes read per call
+
+class VideoKey(TypedDict):
+    videoID: str
+
+class VideoRecord(VideoKey, total=False):
+    # One cleanData line (see dataCleansing.cleanRow). Older shards lack some fields, so only videoID is required.
+    uploader: Optional[str]
+    age: Optional[int]
+    category: Optional[str]
+    duration: Optional[int]
+    views: Optional[int]
+    rating: Optional[float]
+    ratings: Optional[int]
+    comments: Optional[int]
+    related: Optional[List[str]]
+    snapshot: Optional[str]
+
+class LinkRecord(VideoKey, total=False):
+    # Just the fields the related-video graph needs; the decoder skips the rest of the line.
+    related: Optional[List[str]]
+
+if orjson:
+    DUMPS_BACKEND = "orjson"
+    def dumpLine(document):
+        return orjson.dumps(document, option=orjson.OPT_APPEND_NEWLINE)
+elif msgspec:
+    DUMPS_BACKEND = "msgspec"
+    encoder = msgspec.json.Encoder()
+    def dumpLine(document):
+        return encoder.encode(document) + b"\n"
+else:
+    DUMPS_BACKEND = "json"
+    def dumpLine(document):
+        return (json.dumps(document) + "\n").encode("utf-8")
+
+if msgspec:
+    LOADS_BACKEND = "msgspec"
+    # Errors raised for a line that is not valid JSON or does not match the schema.
+    DECODE_ERRORS = (ValueError, msgspec.DecodeError)
+    loads = msgspec.json.Decoder().decode
+    decodeVideo = msgspec.json.Decoder(VideoRecord).decode
+    decodeLinks = msgspec.json.Decoder(LinkRecord).decode
+elif orjson:
+    LOADS_BACKEND = "orjson"
+    DECODE_ERRORS = (ValueError,)
+    loads = decodeVideo = decodeLinks = orjson.loads
+else:
+    LOADS_BACKEND = "json"
+    DECODE_ERRORS = (ValueError,)
+    def loads(data):
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+    decodeVideo = decodeLinks = loads
+
+def isBlank(line):
+    # Only very short lines are checked, which covers the empty lines and bare "\r" of the files we write.
+    return len(line) <= 2 and not bytes(line).strip()
+
+def readLines(path, blockSize=BLOCK_SIZE):
+    # Yields every non-blank line of a file (without its newline) as a memoryview into the current block.
+    # Only a line that spans two blocks is copied.
+    tail = b""
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            block = file.read(blockSize)
+            if not block:
+                break
+            view = memoryview(block)
+            start = 0
+            end = block.find(b"\n")
+            if tail:
+                if end < 0:
+                    tail += block
+                    continue
+                line = tail + block[:end]
+                if not isBlank(line):
+                    yield line
+                start = end + 1
+                end = block.find(b"\n", start)
+            while end >= 0:
+                if not isBlank(view[start:end]):
+                    yield view[start:end]
+                start = end + 1
+                end = block.find(b"\n", start)
+            tail = bytes(view[start:])
+    if not isBlank(tail):
+        yield tail
+
+def iterDocuments(path, decode=decodeVideo, onError=None):
+    # Parsed documents of a JSONL file. Lines that fail to decode are passed to onError(error) and skipped.
+    for line in readLines(path):
+        try:
+            yield decode(line)
+        except DECODE_ERRORS as e:
+            if onError:
+                onError(e)
+
+
+"""
+Pseudocode:
+
+pick the backends once at import:
+    dumpLine = orjson.dumps(+ newline) | msgspec encoder | json.dumps
+    decodeVideo = msgspec decoder typed as VideoRecord | orjson.loads | json.loads
+
+readLines(path):
+    tail = ""
+    REPEAT read the next 8 MB block:
+        IF a partial line is left from the previous block: join it with the start of this block and yield it
+        FOR each newline in the block: yield the bytes since the previous newline (a view, not a copy)
+        keep the bytes after the last newline as the new partial line
+    yield the last partial line
+
+iterDocuments(path, decode):
+    FOR each line in readLines(path):
+        TRY yield decode(line) CATCH a decode or schema error: report it and skip the line
+
+"""
@@ -0,0 +1,49 @@
+# Shared result paging for the Search and Analytics pages. A page is fetched by range ("keyset") on a sorted, indexed key:
+#   find({...query, key: {$gt: last key of the previous page}}, projection).sort(key).limit(...)
+# so page 100 costs the same as page 1 (no skip over the earlier pages) and only the projected columns cross the wire.
+# The total is a separate count query, which app.py runs next to the page instead of counting the rows it fetched.
+from pymongo import ASCENDING
+
+PAGE_SIZE = 50
+
+def keysetPage(collection, query, projection, key="videoID", after=None, pageSize=PAGE_SIZE):
+    # Returns (rows, token for the next page or None). Rows are distinct on key: Video holds one document per
+    # video per crawl, and the extra copies are adjacent in key order, so they are skipped while reading.
+    if after is not None:
+        query = {"$and": [query, {key: {"$gt": after}}]}
+    rows = []
+    # The cursor is read lazily and closed as soon as one row past the page has been seen.
+    with collection.find(query, projection).sort(key, ASCENDING).batch_size(pageSize + 1) as cursor:
+        for document in cursor:
+            if rows and document[key] == rows[-1][key]:
+                continue
+            if len(rows) == pageSize:
+                return rows, rows[-1][key]
+            rows.append(document)
+    return rows, None
+
+def slicePage(offset, ids, pageSize=PAGE_SIZE):
+    # Same (rows, next token) contract for a list fetched with one extra element, where the token is an offset.
+    return ids[:pageSize], (offset + pageSize if len(ids) > pageSize else None)
+
+def countMatches(collection, query, limit=None):
+    # Number of documents matching query, answered from the index when one covers the query.
+    # limit caps the count for "10,000+" style displays on very popular keys.
+    if not query:
+        return collection.estimated_document_count()
+    return collection.count_documents(query, limit=limit) if limit else collection.count_documents(query)
+
+
+"""
+Pseudocode:
+
+keysetPage(collection, query, projection, key, after, pageSize):
+    IF after is given: only keys greater than after
+    read the projected documents in key order (from the index):
+        skip a document whose key equals the previous row's (another crawl of the same video)
+        IF the page is full and another key follows: return the rows and the last key as the next token
+    return the rows and no next token
+
+countMatches(collection, query): count_documents (or the collection's estimated size for an empty query)
+
+"""
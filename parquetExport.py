@@ -0,0 +1,111 @@
+# Converts the cleanData JSONL shards into a Parquet dataset partitioned by snapshot date and category, with an explicit schema.
+# Spark and pandas can then read only the columns (and partitions) a job needs instead of parsing every JSON line.
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.json as pajson
+import argparse
+import os
+import re
+from time import perf_counter
+
+SNAPSHOT_NAME = re.compile(r"^(\d{6})_\d+\.json$")
+
+# Columns stored in the Parquet files (snapshot and category live in the directory names).
+VIDEO_SCHEMA = pa.schema([
+    ("videoID", pa.string()),
+    ("uploader", pa.string()),
+    ("age", pa.int64()),
+    ("category", pa.string()),
+    ("duration", pa.int64()),
+    ("views", pa.int64()),
+    ("rating", pa.float64()),
+    ("ratings", pa.int64()),
+    ("comments", pa.int64()),
+    ("related", pa.list_(pa.string())),
+])
+# Partition columns are always strings: snapshot dates keep their leading zero.
+PARTITIONING = ds.partitioning(pa.schema([("snapshot", pa.string()), ("category", pa.string())]), flavor="hive")
+
+def snapshotShards(cleanDir):
+    # Groups the shard files by crawl snapshot: {"080329": [".../080329_0.json", ...]}.
+    shards = {}
+    for name in sorted(os.listdir(cleanDir)):
+        match = SNAPSHOT_NAME.match(name)
+        if match:
+            shards.setdefault(match.group(1), []).append(os.path.join(cleanDir, name))
+    return shards
+
+def readShard(jsonPath):
+    # Arrow's native JSON reader parses the whole file with the fixed schema (no inference).
+    # A depth file whose rows were all rejected leaves an empty shard, which read_json refuses.
+    if os.path.getsize(jsonPath) == 0:
+        return VIDEO_SCHEMA.empty_table()
+    options = pajson.ParseOptions(explicit_schema=VIDEO_SCHEMA, unexpected_field_behavior="ignore")
+    return pajson.read_json(jsonPath, parse_options=options)
+
+def exportSnapshot(snapshot, jsonPaths, outDir):
+    # Rewrites every partition of one snapshot. Earlier files for this snapshot are replaced;
+    # other snapshots are untouched.
+    table = pa.concat_tables([readShard(path) for path in jsonPaths])
+    table = table.append_column("snapshot", pa.array([snapshot] * table.num_rows, pa.string()))
+    ds.write_dataset(table, outDir, format="parquet", partitioning=PARTITIONING,
+                     basename_template=f"part-{snapshot}-{{i}}.parquet",
+                     existing_data_behavior="delete_matching")
+    return table.num_rows
+
+def exportParquet(cleanDir, outDir, snapshots=None):
+    # snapshots limits the export to the given dates (for example the ones just cleansed); None exports all.
+    start_time = perf_counter()
+    rows = 0
+    shards = snapshotShards(cleanDir)
+    for snapshot in sorted(shards):
+        if snapshots is not None and snapshot not in snapshots:
+            continue
+        count = exportSnapshot(snapshot, shards[snapshot], outDir)
+        rows += count
+        print(f"{snapshot}: {count} rows written to Parquet")
+    print(f"Parquet export of {rows} rows took {perf_counter() - start_time:.4f} seconds")
+    return rows
+
+def openDataset(parquetDir):
+    return ds.dataset(parquetDir, format="parquet", partitioning=PARTITIONING)
+
+def readParquet(parquetDir, columns=None, filter=None):
+    # Local pandas path: only the requested columns are read, and filters on snapshot/category
+    # skip whole directories before any file is opened.
+    # e.g. readParquet("cleanParquet", ["videoID", "views"], pc.field("snapshot") == "080329")
+    return openDataset(parquetDir).to_table(columns=columns, filter=filter).to_pandas()
+
+def categoryCounts(parquetDir, filter=None):
+    # Category counts read from the category column alone.
+    counts = pc.value_counts(openDataset(parquetDir).to_table(columns=["category"], filter=filter)["category"])
+    return sorted(((item["values"].as_py(), item["counts"].as_py()) for item in counts), key=lambda pair: -pair[1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the cleanData shards to a partitioned Parquet dataset")
+    parser.add_argument("--clean", default=os.path.join(os.getcwd(), "cleanData"))
+    parser.add_argument("--out", default=os.path.join(os.getcwd(), "cleanParquet"))
+    parser.add_argument("--snapshot", action="append", help="only export this snapshot date (repeatable)")
+    args = parser.parse_args()
+
+    exportParquet(args.clean, args.out, set(args.snapshot) if args.snapshot else None)
+
+
+"""
+Pseudocode:
+
+exportParquet(cleanDir, outDir, snapshots):
+    group the <YYMMDD>_<depth>.json shards by snapshot date
+    for each snapshot (optionally only the given ones):
+        read every shard of the snapshot with the fixed VIDEO_SCHEMA (an empty shard is an empty table)
+        add a snapshot column
+        write the rows to outDir/snapshot=<date>/category=<category>/part-<date>-N.parquet,
+        replacing the snapshot's previous files
+
+readParquet(parquetDir, columns, filter):
+    open the partitioned dataset
+    read only the requested columns, skipping partitions that fail the filter
+    convert to a pandas DataFrame
+
+"""
@@ -0,0 +1,263 @@
+# Partitioned layout: one Video_<YYMMDD> collection per crawl snapshot instead of a single Video collection holding every crawl.
+# dataInsertion.py --schema partitioned loads each snapshot's shards into its own partition and lists it in Partitions:
+#   {_id: snapshot, collection: "Video_<snapshot>", documents, loaded, retired (only once retired)}
+# Queries are routed by scope: "latest" (the default) reads the newest partition only, a snapshot date reads that crawl,
+# and "all" fans out over every partition. Retiring an old crawl drops its collection, which is instant however large
+# the crawl is, instead of a delete_many that rewrites Video and all of its indexes.
+from pymongo import MongoClient, ASCENDING
+from datetime import datetime
+from functools import cmp_to_key
+from itertools import islice
+import heapq
+import argparse
+from compactSchema import currentSchema
+
+MONGO_URI = "mongodb://localhost:27017"
+PARTITION_COLLECTION = "Partitions"
+PARTITION_PREFIX = "Video_"
+PARTITION_SHARDS = "LoadedShardsPartitioned" # shard registry of the partitioned layout (like LoadedShards for Video)
+LATEST = "latest"
+ALL = "all"
+
+def partitionName(snapshot):
+    return PARTITION_PREFIX + snapshot
+
+def registerPartition(db, snapshot, documents):
+    db[PARTITION_COLLECTION].update_one({"_id": snapshot}, {"$set": {"collection": partitionName(snapshot), "documents": documents,
+                                                                      "loaded": datetime.now()}}, upsert=True)
+
+def listPartitions(db):
+    # Snapshots with a live partition, oldest first.
+    return [entry["_id"] for entry in db[PARTITION_COLLECTION].find({"retired": {"$exists": False}}, {"_id": 1}).sort("_id", ASCENDING)]
+
+def retiredSnapshots(db):
+    return {entry["_id"] for entry in db[PARTITION_COLLECTION].find({"retired": {"$exists": True}}, {"_id": 1})}
+
+def dropPartitions(db, snapshots):
+    # Removes partitions and their registry entries (a rebuild whose input no longer has these snapshots).
+    for snapshot in snapshots:
+        db[partitionName(snapshot)].drop()
+        db[PARTITION_COLLECTION].delete_one({"_id": snapshot})
+        db[PARTITION_SHARDS].delete_many({"_id": {"$regex": f"^{snapshot}_"}})
+
+def retirePartitions(db, snapshots):
+    # Drops the partitions of old crawls. Their registry entries stay, marked retired, so later loads skip their
+    # cleanData shards instead of bringing them back; restorePartitions undoes that.
+    for snapshot in snapshots:
+        db[partitionName(snapshot)].drop()
+        db[PARTITION_COLLECTION].update_one({"_id": snapshot}, {"$set": {"retired": datetime.now(), "documents": 0}}, upsert=True)
+        db[PARTITION_SHARDS].delete_many({"_id": {"$regex": f"^{snapshot}_"}})
+        print(f"retired snapshot {snapshot} (dropped {partitionName(snapshot)})")
+    return list(snapshots)
+
+def retireAllBut(db, keep):
+    # Retires every partition except the newest keep.
+    snapshots = listPartitions(db)
+    return retirePartitions(db, snapshots[:max(len(snapshots) - keep, 0)])
+
+def restorePartitions(db, snapshots):
+    # Lets the next load bring retired snapshots back from their shards.
+    for snapshot in snapshots:
+        db[PARTITION_COLLECTION].update_one({"_id": snapshot}, {"$unset": {"retired": ""}})
+    return list(snapshots)
+
+def unionPipeline(snapshots, pipeline):
+    # Runs pipeline over every partition as one aggregation on the first of them. Leading $match stages are applied
+    # inside each partition, where its indexes serve them, and the rest of the pipeline runs once over the union.
+    head = []
+    for step in pipeline:
+        if "$match" not in step:
+            break
+        head.append(step)
+    unions = [{"$unionWith": {"coll": partitionName(snapshot), "pipeline": head}} for snapshot in snapshots[1:]]
+    return head + unions + pipeline[len(head):]
+
+def documentOrder(keys):
+    # Sort key for merging documents that each partition already returned in (field, direction) order.
+    def compare(a, b):
+        for field, direction in keys:
+            x, y = a.get(field), b.get(field)
+            if x != y:
+                return (1 if x > y else -1) * direction
+        return 0
+    return cmp_to_key(compare)
+
+class PartitionedCursor:
+    # The find().sort().skip().limit().batch_size() chain of a pymongo Cursor over several partitions.
+    # With a sort, each partition is read in order from its own index and the streams are merged lazily, so a page
+    # only pulls about a page from every partition; without one the partitions are read newest first.
+    # The sort fields have to be part of the projection.
+    def __init__(self, partitions, filter, projection):
+        self.partitions = partitions
+        self.filter = filter
+        self.projection = projection
+        self.keys = None
+        self.skipped = 0
+        self.limited = 0
+        self.batch = None
+        self.cursors = []
+
+    def sort(self, key, direction=ASCENDING):
+        self.keys = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def skip(self, count):
+        self.skipped = count
+        return self
+
+    def limit(self, count):
+        self.limited = count
+        return self
+
+    def batch_size(self, size):
+        self.batch = size
+        return self
+
+    def open(self, collection):
+        cursor = collection.find(self.filter, self.projection)
+        if self.keys:
+            cursor = cursor.sort(self.keys)
+        if self.limited:
+            # A partition never has to return more than the whole merged result.
+            cursor = cursor.limit(self.skipped + self.limited)
+        if self.batch:
+            cursor = cursor.batch_size(self.batch)
+        self.cursors.append(cursor)
+        return cursor
+
+    def __iter__(self):
+        if self.keys:
+            merged = heapq.merge(*[self.open(collection) for collection in self.partitions], key=documentOrder(self.keys))
+        else:
+            merged = (document for collection in reversed(self.partitions) for document in self.open(collection))
+        return islice(merged, self.skipped, self.skipped + self.limited if self.limited else None)
+
+    def close(self):
+        for cursor in self.cursors:
+            cursor.close()
+        self.cursors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PartitionedCollection:
+    # Read-only stand-in for Video over several partitions, with the calls queries.py, paging.py, sampling.py,
+    # dashboardStats.py and run_mongo_checks.py make. Lookups try the newest partition first, finds are merged
+    # (PartitionedCursor), counts are summed and aggregations run over the union of the partitions.
+    def __init__(self, db, snapshots):
+        self.snapshots = list(snapshots)
+        self.partitions = [db[partitionName(snapshot)] for snapshot in self.snapshots]
+        self.name = f"{PARTITION_PREFIX}* ({len(self.snapshots)} snapshots)"
+
+    def find_one(self, filter=None, projection=None):
+        for collection in reversed(self.partitions):
+            document = collection.find_one(filter, projection)
+            if document is not None:
+                return document
+        return None
+
+    def find(self, filter=None, projection=None):
+        return PartitionedCursor(self.partitions, filter or {}, projection)
+
+    def count_documents(self, filter, limit=None):
+        total = 0
+        for collection in self.partitions:
+            if limit:
+                total += collection.count_documents(filter, limit=limit - total)
+                if total >= limit:
+                    break
+            else:
+                total += collection.count_documents(filter)
+        return total
+
+    def estimated_document_count(self):
+        return sum(collection.estimated_document_count() for collection in self.partitions)
+
+    def aggregate(self, pipeline, **kwargs):
+        if not self.partitions:
+            return iter([])
+        return self.partitions[0].aggregate(unionPipeline(self.snapshots, pipeline), **kwargs)
+
+    def index_information(self):
+        # The indexes every partition has, so missingIndexes reports one missing from any of them.
+        common = None
+        for collection in self.partitions:
+            indexes = {tuple(map(tuple, info["key"])): (name, info) for name, info in collection.index_information().items()}
+            common = indexes if common is None else {key: value for key, value in common.items() if key in indexes}
+        return dict((common or {}).values())
+
+def routeVideos(db, scope=LATEST, snapshots=None):
+    # The collection Video queries run on under the partitioned layout: the newest partition ("latest"),
+    # one crawl (a snapshot date) or all of them ("all"). snapshots saves re-reading Partitions.
+    if snapshots is None:
+        snapshots = listPartitions(db)
+    if scope == ALL:
+        return PartitionedCollection(db, snapshots)
+    if scope == LATEST:
+        return db[partitionName(snapshots[-1])] if snapshots else PartitionedCollection(db, [])
+    return db[partitionName(scope)]
+
+def allVideos(db):
+    # Every snapshot in the Video document shape: Video, or all partitions when the last load was partitioned.
+    if currentSchema(db) == "partitioned":
+        return routeVideos(db, ALL)
+    return db["Video"]
+
+def singleSnapshot(collection):
+    # True for one partition, which holds each video once; Video and the fan-out hold one document per video per crawl.
+    return not isinstance(collection, PartitionedCollection) and collection.name.startswith(PARTITION_PREFIX)
+
+if __name__ == "__main__":
+    # Imported here because dashboardStats.py reads the partitions through this module.
+    from dashboardStats import refreshStats
+    from queryCache import bumpGeneration
+
+    parser = argparse.ArgumentParser(description="List, retire or restore the per-snapshot partitions of the partitioned layout")
+    parser.add_argument("--retire", nargs="+", metavar="YYMMDD", default=[], help="drop the partitions of these snapshots")
+    parser.add_argument("--keep", type=int, default=None, help="retire all but the newest KEEP partitions")
+    parser.add_argument("--restore", nargs="+", metavar="YYMMDD", default=[], help="let the next load bring retired snapshots back")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client["YoutubeData"]
+    retired = retirePartitions(db, args.retire)
+    if args.keep is not None:
+        retired += retireAllBut(db, args.keep)
+    restorePartitions(db, args.restore)
+    if retired:
+        refreshStats(db)
+        bumpGeneration(db)
+    if args.restore:
+        print("restored snapshots are loaded again by: python dataInsertion.py --schema partitioned --mode incremental")
+    for entry in db[PARTITION_COLLECTION].find().sort("_id", ASCENDING):
+        state = f"retired {entry['retired']:%Y-%m-%d %H:%M}" if "retired" in entry else f"{entry.get('documents', 0):,} documents"
+        print(f"{entry['_id']}  {entry.get('collection', partitionName(entry['_id']))}  {state}")
+
+
+"""
+Pseudocode:
+
+loading (dataInsertion.py --schema partitioned):
+    FOR each snapshot with new or changed shards (all snapshots on a rebuild), skipping retired ones:
+        load its shards into Video_<snapshot>_staging, build the indexes, rename it to Video_<snapshot>
+        record the partition and its document count in Partitions
+    a rebuild drops the partitions of snapshots that are no longer in cleanData
+
+routeVideos(db, scope):
+    latest   -> the newest partition
+    YYMMDD   -> that snapshot's partition
+    all      -> every partition:
+        find_one: newest partition first
+        find:     each partition read in sort order from its index, merged lazily; skip/limit applied to the merge
+        count:    summed over the partitions
+        aggregate: leading $match inside every partition, $unionWith the others, rest of the pipeline once
+
+retire(snapshots): drop their collections, mark them retired in Partitions, forget their shards;
+                   refresh DashboardStats and bump the load generation
+--keep N: retire all but the newest N
+restore(snapshots): clear the retired mark so the next incremental load reloads them
+
+"""
@@ -0,0 +1,78 @@
+# The read queries behind the Search and Analytics pages, shared by app.py and the query cache.
+# With a codec (compactSchema.Codec) the queries read VideoCompact and return documents in the Video shape.
+# List queries return one page (paging.py) with only the columns the page shows; their totals are separate count queries.
+from relatedIndex import findReferrers, countReferrers
+from searchIndex import SEARCH_COLLECTION
+from paging import keysetPage, slicePage, countMatches, PAGE_SIZE
+from partitions import singleSnapshot
+
+# Columns of the list views. Related lists (about 20 IDs per video) are left out; the Video ID search shows them.
+UPLOADER_VIDEO_FIELDS = {"_id": 0, "videoID": 1, "category": 1, "snapshot": 1, "views": 1, "rating": 1, "duration": 1}
+# Compact: the static fields plus the last observation added.
+COMPACT_VIDEO_FIELDS = {"u": 1, "c": 1, "d": 1, "s": {"$slice": -1}}
+REVERSE_FIELDS = {"_id": 0, "videoID": 1, "uploader": 1, "category": 1}
+
+def normalizeID(video_id):
+    return video_id.strip()
+
+def normalizeUploader(uploader):
+    return uploader.strip()
+
+def findVideo(collection, video_id, codec=None):
+    # Single video record by its ID.
+    if codec:
+        return codec.decodeOne(collection.find_one({"_id": video_id}))
+    return collection.find_one({"videoID": video_id})
+
+def findUploaderVideos(collection, uploader, limit=5, codec=None):
+    # First few videos posted by an uploader.
+    return pageUploaderVideos(collection, uploader, pageSize=limit, codec=codec)[0]
+
+def pageUploaderVideos(collection, uploader, after=None, pageSize=PAGE_SIZE, codec=None):
+    # One page of an uploader's videos in videoID order, from the (uploader, videoID) index.
+    # Returns (videos, token for the next page or None).
+    if codec:
+        code = codec.uploaderCode(uploader)
+        if code is None:
+            return [], None
+        rows, token = keysetPage(collection, {"u": code}, COMPACT_VIDEO_FIELDS, "_id", after, pageSize)
+        return codec.decode(rows), token
+    return keysetPage(collection, {"uploader": uploader}, UPLOADER_VIDEO_FIELDS, "videoID", after, pageSize)
+
+def countUploaderVideos(db, collection, uploader, codec=None):
+    # Distinct videos of an uploader, read from its UploaderSearch entry (searchIndex.py) when there is one.
+    # Otherwise the documents are counted on the uploader index (one per video per crawl for Video).
+    # UploaderSearch covers every crawl, so one snapshot's partition (partitions.py) is always counted.
+    entry = None if singleSnapshot(collection) else db[SEARCH_COLLECTION].find_one({"_id": uploader}, {"videos": 1})
+    if entry:
+        return entry["videos"]
+    if codec:
+        code = codec.uploaderCode(uploader)
+        return 0 if code is None else countMatches(collection, {"u": code})
+    return countMatches(collection, {"uploader": uploader})
+
+def findReverseRelated(db, collection, target_id, after=None, pageSize=PAGE_SIZE, codec=None):
+    # One page of the videos that list target_id as related: (records with videoID/uploader/category, next token).
+    # Video is read by keyset on the (related, videoID) index. VideoCompact stores related IDs packed, so there the page
+    # comes from the RelatedBy reverse index by offset (one key lookup with $slice) and the token is that offset.
+    if not codec:
+        return keysetPage(collection, {"related": target_id}, REVERSE_FIELDS, "videoID", after, pageSize)
+    offset = after or 0
+    referrers = findReferrers(db, target_id, offset, pageSize + 1)
+    if referrers is None:
+        return [], None
+    page_ids, token = slicePage(offset, referrers[1], pageSize)
+    # Fetches just the columns shown for this page (one row per video).
+    found = {video["videoID"]: video for video in codec.decode(list(collection.find({"_id": {"$in": page_ids}}, {"u": 1, "c": 1})))}
+    return [found.get(video_id, {"videoID": video_id}) for video_id in page_ids], token
+
+def countReverseRelated(db, collection, target_id, codec=None):
+    # How many videos list target_id as related: the count kept in its RelatedBy entry (relatedIndex.py),
+    # or, before RelatedBy is built, the Video documents counted on the related index.
+    # RelatedBy covers every crawl, so one snapshot's partition is counted instead.
+    if singleSnapshot(collection):
+        return countMatches(collection, {"related": target_id})
+    count = countReferrers(db, target_id)
+    if count is not None:
+        return count
+    return 0 if codec else countMatches(collection, {"related": target_id})
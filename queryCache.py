@@ -0,0 +1,86 @@
+# Bounded LRU cache for the Search and Analytics queries in app.py.
+# Entries are dropped when the cache holds too many entries or too many bytes, and all of them are dropped
+# whenever dataInsertion.py bumps the load generation stored in the Meta collection.
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+import json
+
+GENERATION_ID = "loadGeneration"
+CURRENT = object() # put() default: store under whatever generation the cache is on
+
+def currentGeneration(db):
+    document = db["Meta"].find_one({"_id": GENERATION_ID})
+    return document["value"] if document else 0
+
+def bumpGeneration(db):
+    # Called after every load so every app.py process drops its cached results.
+    db["Meta"].update_one({"_id": GENERATION_ID}, {"$inc": {"value": 1}}, upsert=True)
+
+def entrySize(value):
+    # Rough size of a cached result: the length of its JSON form.
+    return len(json.dumps(value, default=str))
+
+class QueryCache:
+    def __init__(self, maxEntries=1000, maxBytes=32 * 1024 * 1024, generationCheck=5.0):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.generationCheck = generationCheck # seconds between reads of the load generation
+        self.entries = OrderedDict() # key -> (value, size), least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self.lastCheck = 0.0
+        self.lock = Lock() # Streamlit serves each session from its own thread
+
+    def checkGeneration(self, db):
+        # Reads the load generation at most once every generationCheck seconds and clears the cache if it moved.
+        now = monotonic()
+        if now - self.lastCheck < self.generationCheck:
+            return
+        generation = currentGeneration(db)
+        with self.lock:
+            self.lastCheck = now
+            if generation != self.generation:
+                self.entries.clear()
+                self.bytes = 0
+                self.generation = generation
+
+    def get(self, kind, key, loader):
+        # Returns (value, hit). On a miss loader() runs the query and its result is stored.
+        cacheKey = (kind,) + tuple(key)
+        with self.lock:
+            if cacheKey in self.entries:
+                self.entries.move_to_end(cacheKey)
+                self.hits += 1
+                return self.entries[cacheKey][0], True
+            self.misses += 1
+            generation = self.generation
+        value = loader()
+        self.put(cacheKey, value, generation)
+        return value, False
+
+    def put(self, cacheKey, value, generation=CURRENT):
+        # generation is the load generation the query started under. If a load was noticed
+        # while the query ran, its result may be from the old data and is returned without being stored.
+        size = entrySize(value)
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            if generation is not CURRENT and generation != self.generation:
+                return
+            if cacheKey in self.entries:
+                self.bytes -= self.entries.pop(cacheKey)[1]
+            self.entries[cacheKey] = (value, size)
+            self.bytes += size
+            while len(self.entries) > self.maxEntries or self.bytes > self.maxBytes:
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def describe(self, hit):
+        return (f"cache {'hit' if hit else 'miss'} · hit rate {self.hitRate():.0%} "
+                f"({self.hits} hits / {self.misses} misses, {len(self.entries)} entries, {self.bytes / 1024:,.0f} KB)")
@@ -0,0 +1,82 @@
+# Runs the independent read queries of an app.py page at the same time on a shared thread pool, so the page waits
+# for its slowest query instead of the sum of all of them. One MongoClient is thread-safe and serves every worker from its
+# connection pool. Each query runs under pymongo.timeout(), which sends the remaining time to the server as maxTimeMS,
+# so a query that runs too long is stopped by MongoDB itself rather than left running after the page gave up on it.
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pymongo.errors import PyMongoError
+from time import perf_counter
+import contextvars
+import pymongo
+
+QUERY_WORKERS = 8
+QUERY_TIMEOUT = 10.0 # seconds a query may run before MongoDB stops it
+GRACE = 0.5 # extra seconds the page waits for a timed-out query to report back
+
+def outcome(name, value=None, error=None, seconds=0.0, timedOut=False):
+    return {"name": name, "value": value, "error": error, "seconds": seconds, "timedOut": timedOut}
+
+def timedQuery(name, query, timeout):
+    # Worker side: runs one query under a client-side deadline and turns any error into an outcome, so a failing query
+    # (a driver error, or a KeyError from a codec or loader) only fails its own placeholder instead of the whole page.
+    start_time = perf_counter()
+    try:
+        with pymongo.timeout(timeout):
+            value = query()
+        return outcome(name, value, seconds=perf_counter() - start_time)
+    except Exception as e:
+        error = str(e) if isinstance(e, PyMongoError) else f"{type(e).__name__}: {e}"
+        return outcome(name, error=error, seconds=perf_counter() - start_time, timedOut=getattr(e, "timeout", False))
+
+class QueryRunner:
+    def __init__(self, workers=QUERY_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+
+    def submit(self, name, query, timeout=QUERY_TIMEOUT):
+        # The query runs in a copy of the caller's context, so the command monitor (instrumentation.py)
+        # adds its MongoDB time to the page that asked for it.
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, timedQuery, name, query, timeout)
+
+    def stream(self, queries, timeout=QUERY_TIMEOUT):
+        # Starts every query in {name: function} at once and yields their outcomes in the order they finish.
+        # Queries still running after timeout (+ GRACE) are reported as timed out. If the caller stops early
+        # (Streamlit reruns the page when a widget changes), queries that have not started yet are cancelled.
+        futures = {self.submit(name, query, timeout): name for name, query in queries.items()}
+        deadline = perf_counter() + timeout + GRACE
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - perf_counter()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    yield future.result()
+            for future in pending:
+                future.cancel()
+                yield outcome(futures[future], error=f"no result after {timeout:g} seconds", seconds=timeout, timedOut=True)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def gather(self, queries, timeout=QUERY_TIMEOUT):
+        # All outcomes at once: {name: outcome}.
+        return {result["name"]: result for result in self.stream(queries, timeout)}
+
+
+"""
+Pseudocode:
+
+timedQuery(name, query, timeout):
+    WITH a client-side deadline of timeout seconds (sent to MongoDB as maxTimeMS):
+        value = query()
+    IF it raised (driver or any other error): return the error and whether it was a timeout
+    return value and how long it took
+
+stream(queries, timeout):
+    submit every query to the shared thread pool (in a copy of the caller's context)
+    WHILE queries are pending and the deadline (timeout + GRACE) has not passed:
+        wait for the next query to finish and yield its outcome
+    cancel the queries still pending and yield them as timed out
+    (on early exit: cancel every query that has not started)
+
+"""
@@ -0,0 +1,109 @@
+# Builds the RelatedBy collection, a reverse index of the "related" lists: for every video, the videos that recommend it and how many there are.
+# This is a map/reduce job. Worker processes map each cleanData shard to {target: referrers}, and MongoDB reduces them by merging into one document per target.
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from multiprocessing import Pool, cpu_count
+import argparse
+import os
+from time import perf_counter
+from jsonCodec import iterDocuments, decodeLinks
+
+MONGO_URI = "mongodb://localhost:27017"
+BATCH_SIZE = 2000 # targets per bulk_write call
+
+def mapShard(jsonPath):
+    # Map step: inverts the related lists of one shard into {target videoID: [referrer videoIDs]}.
+    inverted = {}
+    for document in iterDocuments(jsonPath, decodeLinks):
+        referrer = document.get("videoID")
+        for target in document.get("related") or []:
+            inverted.setdefault(target, set()).add(referrer)
+    return jsonPath, {target: sorted(referrers) for target, referrers in inverted.items()}
+
+def reduceBatch(collection, batch):
+    # Reduce step: merges the new referrers into each target's document and recomputes its count.
+    # Running the same shard twice leaves the documents unchanged.
+    requests = [UpdateOne({"videoID": target},
+                          [{"$set": {"referrers": {"$setUnion": [{"$ifNull": ["$referrers", []]}, referrers]}}},
+                           {"$set": {"count": {"$size": "$referrers"}}}],
+                          upsert=True)
+                for target, referrers in batch]
+    collection.bulk_write(requests, ordered=False)
+
+def buildRelatedBy(db, jsonPaths, workers=None, rebuild=False):
+    # rebuild: builds from scratch into RelatedBy_staging and swaps it in, so readers always see a complete index.
+    # Otherwise the given shards are merged into the existing RelatedBy collection.
+    start_time = perf_counter()
+    collection = db["RelatedBy_staging"] if rebuild else db["RelatedBy"]
+    if rebuild:
+        collection.drop()
+    collection.create_index([("videoID", ASCENDING)], unique=True)
+
+    targets = 0
+    if jsonPaths:
+        with Pool(processes=min(workers or cpu_count(), len(jsonPaths))) as pool:
+            for jsonPath, inverted in pool.imap_unordered(mapShard, jsonPaths):
+                items = list(inverted.items())
+                for i in range(0, len(items), BATCH_SIZE):
+                    reduceBatch(collection, items[i:i + BATCH_SIZE])
+                targets += len(items)
+                print(f"{os.path.basename(jsonPath)}: merged referrers for {len(items)} videos")
+
+    if rebuild:
+        collection.rename("RelatedBy", dropTarget=True)
+    duration = perf_counter() - start_time
+    print(f"RelatedBy updated from {len(jsonPaths)} shards ({targets} target entries) in {duration:.4f} seconds")
+
+def findReferrers(db, target_id, offset=0, limit=50):
+    # Single-key lookup that only returns referrers[offset:offset + limit].
+    # Returns (total count, those referrer ids), or None if the video is never referenced.
+    result = db["RelatedBy"].find_one({"videoID": target_id},
+                                      {"_id": 0, "count": 1, "referrers": {"$slice": [offset, limit]}})
+    if result is None:
+        return None
+    return result.get("count", 0), result.get("referrers", [])
+
+def countReferrers(db, target_id):
+    # The stored count alone, without any of the referrer list. None if RelatedBy has no entry for the video.
+    result = db["RelatedBy"].find_one({"videoID": target_id}, {"_id": 0, "count": 1})
+    return None if result is None else result.get("count", 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the RelatedBy reverse index from the cleanData shards")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--incremental", action="store_true", help="merge into the existing index instead of rebuilding it")
+    args = parser.parse_args()
+
+    folder = os.path.join(os.getcwd(), "cleanData")
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if not name.startswith("_")]
+    client = MongoClient(MONGO_URI)
+    buildRelatedBy(client["YoutubeData"], paths, args.workers, rebuild=not args.incremental)
+
+
+"""
+Pseudocode:
+
+mapShard(file):
+    inverted = empty map
+    for each document in file:
+        for each target in document.related:
+            add document.videoID to inverted[target]
+    return inverted
+
+buildRelatedBy(db, files, rebuild):
+    collection = RelatedBy_staging if rebuild (emptied first) else RelatedBy
+    ensure unique index on videoID
+    run mapShard over the files in a pool of worker processes
+    for each inverted map, in batches of targets:
+        upsert { videoID: target } setting
+            referrers = union(existing referrers, new referrers)
+            count = size(referrers)
+    if rebuild:
+        rename RelatedBy_staging to RelatedBy
+
+findReferrers(db, target, offset, limit):
+    find the RelatedBy document for target, returning count and
+    only referrers[offset : offset + limit]
+
+countReferrers(db, target): the count field of target's RelatedBy document
+
+"""
@@ -1,52 +1,233 @@
+# Post-load regression gate: runs the app's queries against MongoDB and compares them with the expected results of the
+# last accepted load. The checks are independent, so they run at the same time on the query thread pool (queryRunner.py)
+# over one pooled client, and the whole run takes as long as its slowest check. Every check is timed and fails when its
+# result differs from the stored snapshot or its time grows past the stored baseline by more than the tolerance.
+# Baselines are timed with each check running on its own (--update runs them one after another); a check that looks
+# slow in the concurrent run is timed again on its own before it fails, so sharing the server does not fail the gate.
+#   python run_mongo_checks.py            check the current data (exit status 1 on any failure)
+#   python run_mongo_checks.py --update   accept the current results and times as the new snapshot
 import json
 from pymongo import MongoClient
+from datetime import datetime
+from time import perf_counter
+import argparse
 import os
+import sys
+from indexes import missingIndexes, describeIndex
+from compactSchema import currentSchema
+from partitions import LATEST, routeVideos
+from queryRunner import QueryRunner, timedQuery
+from dataCleansing import countLines
+from instrumentation import configure, registry, stage
 
-c = MongoClient('mongodb://localhost:27017')
-db = c['YoutubeData']
-col = db['Video']
-
-out = {}
-# 1. total count
-out['total_count'] = col.count_documents({})
-
-# 2. top 10 categories
-pipeline = [
-    {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
-    {'$sort': {'count': -1}},
-    {'$limit': 10}
-]
-out['top_categories'] = list(col.aggregate(pipeline))
-
-# 3. sample records with non-null rating and views (limit 1000)
-sample_cursor = col.find({'rating': {'$ne': None}, 'views': {'$ne': None}}, {'views':1,'rating':1,'category':1,'videoID':1}).limit(1000)
-sample_list = list(sample_cursor)
-out['sample_count'] = len(sample_list)
-out['sample_head'] = sample_list[:5]
-
-# 4. find specific video
-video_id = 'yZIkFwxLUeU'
-out['lookup_video'] = col.find_one({'videoID': video_id})
-
-# 5. find uploader
-uploader = 'dudeski0000'
-out['uploader_results'] = list(col.find({'uploader': uploader}).limit(5))
-
-# 6. reverse related lookup
-out['reverse_lookup_count'] = col.count_documents({'related': video_id})
-out['reverse_lookup_head'] = list(col.find({'related': video_id}, {'videoID':1,'uploader':1,'category':1}).limit(20))
-
-# 7. file-based: count lines in cleanData files
-clean_folder = os.path.join(os.getcwd(), 'cleanData')
-file_counts = {}
-if os.path.isdir(clean_folder):
-    for fn in os.listdir(clean_folder):
-        path = os.path.join(clean_folder, fn)
+MONGO_URI = "mongodb://localhost:27017"
+CHECK_WORKERS = 8
+CHECK_TIMEOUT = 60.0 # seconds a check may run before MongoDB stops it
+TOLERANCE = 0.5 # a check fails when it is this much slower than its baseline...
+SLACK = 0.05 # ...and more than this many seconds slower, so millisecond-level jitter does not fail the gate
+VIDEO_ID = "yZIkFwxLUeU"
+UPLOADER = "dudeski0000"
+LINE_COUNTS = "line_counts.json" # cached cleanData line counts, by file size and mtime
+
+# Every list is read in a fixed order without _id (new ObjectIds on every load), so a reload of the same data
+# gives the same results and the snapshot comparison only fails on a real change.
+def checkIndexes(col):
+    return [describeIndex(index) for index in missingIndexes(col)]
+
+def checkTotal(col):
+    return col.count_documents({})
+
+def checkCategories(col):
+    return list(col.aggregate([
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": 10},
+    ]))
+
+def checkSample(col):
+    # Records with a rating and views, in videoID order from its index.
+    sample = list(col.find({"rating": {"$ne": None}, "views": {"$ne": None}}, {"_id": 0, "views": 1, "rating": 1, "category": 1, "videoID": 1})
+                  .sort("videoID", 1).limit(1000))
+    return {"count": len(sample), "head": sample[:5]}
+
+def checkVideo(col):
+    # The first crawl of the video.
+    found = list(col.find({"videoID": VIDEO_ID}, {"_id": 0}).sort("snapshot", 1).limit(1))
+    return found[0] if found else None
+
+def checkUploader(col):
+    return list(col.find({"uploader": UPLOADER}, {"_id": 0}).sort("videoID", 1).limit(5))
+
+def checkReverse(col):
+    return {"count": col.count_documents({"related": VIDEO_ID}),
+            "head": list(col.find({"related": VIDEO_ID}, {"_id": 0, "videoID": 1, "uploader": 1, "category": 1}).sort("videoID", 1).limit(20))}
+
+def checkLineCounts(cleanDir, checksDir):
+    # Lines per cleanData shard, counted in binary blocks (dataCleansing.countLines). Counts are cached by file size
+    # and mtime, so after a load only the shards the cleansing step rewrote are read again.
+    if not os.path.isdir(cleanDir):
+        return {}
+    cachePath = os.path.join(checksDir, LINE_COUNTS)
+    cache = readJSON(cachePath) or {}
+    counts = {}
+    for name in sorted(os.listdir(cleanDir)):
+        if name.startswith("_"): # skip the cleansing manifest
+            continue
+        info = os.stat(os.path.join(cleanDir, name))
+        cached = cache.get(name)
+        if not cached or cached["size"] != info.st_size or cached["mtime"] != info.st_mtime:
+            cached = {"size": info.st_size, "mtime": info.st_mtime, "lines": countLines(os.path.join(cleanDir, name))}
+        cache[name] = cached
+        counts[name] = cached["lines"]
+    writeJSON(cachePath, {name: cache[name] for name in counts})
+    return counts
+
+CHECKS = {
+    "missing_indexes": checkIndexes,
+    "total_count": checkTotal,
+    "top_categories": checkCategories,
+    "sample": checkSample,
+    "lookup_video": checkVideo,
+    "uploader_results": checkUploader,
+    "reverse_lookup": checkReverse,
+}
+
+def readJSON(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def writeJSON(path, value):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f, indent=2, default=str)
+
+def normalize(value):
+    # The result as it is stored in the snapshot (dates and other BSON types as strings).
+    return json.loads(json.dumps(value, default=str))
+
+def snapshotPath(checksDir, scope):
+    return os.path.join(checksDir, f"expected_{scope}.json")
+
+def tooSlow(name, seconds, expected, tolerance=TOLERANCE, slack=SLACK):
+    baseline = expected["seconds"].get(name) if name in expected["results"] else None
+    return baseline is not None and seconds > baseline * (1 + tolerance) and seconds - baseline > slack
+
+def compare(name, result, seconds, expected, tolerance=TOLERANCE, slack=SLACK):
+    # Returns the reasons the check failed (empty when it passed).
+    problems = []
+    if result.get("error"):
+        problems.append(result["error"])
+        return problems
+    if name not in expected["results"]:
+        return problems
+    if result["value"] != expected["results"][name]:
+        problems.append("result differs from the snapshot")
+    if tooSlow(name, seconds, expected, tolerance, slack):
+        problems.append(f"{seconds:.4f}s vs {expected['seconds'][name]:.4f}s baseline")
+    return problems
+
+def runChecks(db, scope=LATEST, cleanDir=None, checksDir=None, update=False, tolerance=TOLERANCE, workers=CHECK_WORKERS, timeout=CHECK_TIMEOUT):
+    # Runs every check at once and compares it with the snapshot. Returns {"results", "failures", "seconds"}.
+    # update=True runs them one at a time and stores the results and times as the new snapshot instead.
+    cleanDir = cleanDir or os.path.join(os.getcwd(), "cleanData")
+    checksDir = checksDir or os.path.join(os.getcwd(), "checks")
+    # The partitioned layout (partitions.py) is routed like app.py: the newest crawl unless scope says otherwise.
+    partitioned = currentSchema(db) == "partitioned"
+    col = routeVideos(db, scope) if partitioned else db["Video"]
+    key = scope if partitioned else "video"
+
+    queries = {name: (lambda check=check: normalize(check(col))) for name, check in CHECKS.items()}
+    queries["cleanfile_line_counts"] = lambda: normalize(checkLineCounts(cleanDir, checksDir))
+    start_time = perf_counter()
+    if update:
+        # Baselines are timed without the other checks competing for the server.
+        outcomes = {name: timedQuery(name, query, timeout) for name, query in queries.items()}
+    else:
+        runner = QueryRunner(workers)
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                file_counts[fn] = sum(1 for _ in f)
-        except Exception as e:
-            file_counts[fn] = f'error: {e}'
-out['cleanfile_line_counts'] = file_counts
+            outcomes = runner.gather(queries, timeout)
+        finally:
+            runner.executor.shutdown(wait=False, cancel_futures=True)
+    seconds = perf_counter() - start_time
+
+    path = snapshotPath(checksDir, key)
+    expected = readJSON(path) or {"results": {}, "seconds": {}}
+    results = {"collection": col.name}
+    failures = {}
+    for name in queries:
+        result = outcomes[name]
+        results[name] = result["value"] if not result["error"] else {"error": result["error"]}
+        # --update only fails on checks that raised or timed out; their results are not stored.
+        if update:
+            problems = [result["error"]] if result["error"] else []
+        else:
+            if not result["error"] and tooSlow(name, result["seconds"], expected, tolerance):
+                # Slow next to the other checks: timed again on its own, like its baseline.
+                result = dict(result, seconds=timedQuery(name, queries[name], timeout)["seconds"])
+            problems = compare(name, result, result["seconds"], expected, tolerance)
+        if problems:
+            failures[name] = problems
+        status = "FAIL" if name in failures else "new" if name not in expected["results"] else "ok"
+        registry.set("check_seconds", round(result["seconds"], 4), check=name)
+        registry.set("check_failed", int(name in failures), check=name)
+        print(f"{status:<5}{name:<24}{result['seconds']:>9.4f}s  {'; '.join(problems)}")
+
+    if update and failures:
+        print(f"not updating {path}: {', '.join(failures)} failed")
+    elif update:
+        writeJSON(path, {"updated": datetime.now().isoformat(timespec="seconds"), "collection": col.name,
+                         "results": {name: outcomes[name]["value"] for name in queries},
+                         "seconds": {name: round(outcomes[name]["seconds"], 4) for name in queries}})
+        print(f"snapshot written to {path}")
+    elif not expected["results"]:
+        print(f"no snapshot at {path} yet; run with --update to accept these results")
+    print(f"{len(queries)} checks in {seconds:.4f} seconds, {len(failures)} failed")
+    return {"results": results, "failures": failures, "seconds": seconds}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the app's queries against MongoDB and compare them with the expected snapshot")
+    parser.add_argument("--snapshots", default=LATEST,
+                        help='partitioned layout only: "latest" (default), "all" (fan out over every partition) or one snapshot (YYMMDD)')
+    parser.add_argument("--update", action="store_true", help="store the current results and times as the expected snapshot")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown over the baseline time (0.5 = 50%%)")
+    parser.add_argument("--workers", type=int, default=CHECK_WORKERS, help="checks run at the same time")
+    parser.add_argument("--clean", default=os.path.join(os.getcwd(), "cleanData"))
+    parser.add_argument("--checks", default=os.path.join(os.getcwd(), "checks"), help="folder holding the expected snapshots")
+    parser.add_argument("--json", action="store_true", help="also print every check result as JSON")
+    parser.add_argument("--metrics", default=os.path.join(os.getcwd(), "metrics"), help="folder for run_mongo_checks.prom and run_mongo_checks.jsonl")
+    args = parser.parse_args()
+
+    configure("run_mongo_checks", args.metrics)
+    # One connection per concurrent check.
+    client = MongoClient(MONGO_URI, maxPoolSize=args.workers)
+    with stage("checks"):
+        report = runChecks(client["YoutubeData"], args.snapshots, args.clean, args.checks, args.update, args.tolerance, args.workers)
+    if args.json:
+        print(json.dumps(report["results"], indent=2, default=str))
+    registry.flush()
+    sys.exit(1 if report["failures"] else 0)
+
+
+"""
+Pseudocode:
+
+runChecks(db, scope):
+    col = Video (or the partitions picked by scope, partitions.py)
+    run at the same time on the query thread pool (one at a time with --update),
+    each timed and stopped by MongoDB after the timeout:
+        missing_indexes, total_count, top_categories (ties by name), a 1000-record sample in videoID order,
+        the first crawl of one video, one uploader's first videos, the videos listing one video as related
+        cleanfile_line_counts: lines per cleanData shard counted in 1 MB binary blocks,
+                               reusing the cached count of shards whose size and mtime did not change
+    FOR each check:
+        FAIL if it raised or timed out, if its result differs from checks/expected_<scope>.json,
+        or if it took more than (1 + tolerance) x its baseline time and over 0.05 s longer,
+        both in the concurrent run and when timed again on its own
+        set the check_seconds and check_failed gauges and print one line
+    --update: store the results and times as the new snapshot instead of comparing
+              (nothing is stored if a check raised or timed out; those checks are listed as failed)
+    exit status 1 if any check failed, so a load script can stop on it
 
-print(json.dumps(out, indent=2, default=str))
\ No newline at end of file
+"""
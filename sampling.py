@@ -0,0 +1,60 @@
+# Server-side sampling for the Views vs. Rating chart: a true random sample with $sample, or a 2D density grid
+# (log views x rating) computed inside MongoDB so only the bin counts reach the Streamlit process.
+# compact=True runs the same pipelines on VideoCompact, one row per snapshot observation (compactSchema.py).
+from compactSchema import OBSERVATIONS
+
+MAX_LOG_VIEWS = 10 # log10 of the largest view count the grid covers (10 billion)
+MAX_RATING = 5.0
+OVERSAMPLE = 1.2 # documents drawn per missing point, on top of the share the last draw found unplottable
+SAMPLE_ROUNDS = 5 # $sample draws before a sample is returned short (only when few documents are plottable)
+
+# Only documents that can actually be plotted.
+PLOTTABLE = {"views": {"$type": "number"}, "rating": {"$type": "number"}}
+
+def randomSample(collection, size, compact=False):
+    # $sample picks documents uniformly at random instead of the first ones in natural order,
+    # so the plot is not biased towards the snapshot that happened to be loaded first.
+    # $sample has to be the first stage for MongoDB to read random documents straight off the collection
+    # (instead of scanning and shuffling every match), so the unplottable ones are dropped after it. However many
+    # those are, the sample is filled by drawing again, scaled by the share of the last draw that was plottable.
+    # Separate draws can pick the same document, so rows are kept once per (_id, snapshot).
+    rows = {}
+    plottable = 1.0
+    for _ in range(SAMPLE_ROUNDS):
+        missing = size - len(rows)
+        if missing <= 0:
+            break
+        draw = int(missing * OVERSAMPLE / plottable) + 10
+        pipeline = [{"$sample": {"size": draw}}] + (OBSERVATIONS if compact else []) + [
+            {"$match": PLOTTABLE},
+            {"$project": {"views": 1, "rating": 1, "category": 1, "snapshot": 1}},
+        ]
+        found = 0
+        for row in collection.aggregate(pipeline):
+            key = (row.pop("_id"), row.pop("snapshot", None))
+            if key not in rows:
+                rows[key] = row
+                found += 1
+        if not found:
+            break # nothing new: every plottable document is already in the sample
+        plottable = max(found / draw, 0.01)
+    return list(rows.values())[:size]
+
+def densityGrid(collection, viewBins=40, ratingBins=20, compact=False):
+    # Buckets every plottable document into a viewBins x ratingBins grid on the server.
+    # Returns a ratingBins x viewBins matrix of counts (row = rating bin, column = log-views bin).
+    viewBin = {"$min": [viewBins - 1, {"$floor": {"$multiply": [
+        {"$log10": {"$add": ["$views", 1]}}, viewBins / MAX_LOG_VIEWS]}}]}
+    ratingBin = {"$min": [ratingBins - 1, {"$floor": {"$multiply": ["$rating", ratingBins / MAX_RATING]}}]}
+    pipeline = (OBSERVATIONS if compact else []) + [
+        {"$match": dict(PLOTTABLE, views={"$type": "number", "$gte": 0}, rating={"$type": "number", "$gte": 0})},
+        {"$group": {"_id": {"v": viewBin, "r": ratingBin}, "count": {"$sum": 1}}},
+    ]
+    grid = [[0] * viewBins for _ in range(ratingBins)]
+    for cell in collection.aggregate(pipeline):
+        grid[int(cell["_id"]["r"])][int(cell["_id"]["v"])] = cell["count"]
+    return grid
+
+def gridExtent():
+    # Axis extent of the grid for plotting: (log views min, max, rating min, max).
+    return [0, MAX_LOG_VIEWS, 0, MAX_RATING]
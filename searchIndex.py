@@ -0,0 +1,201 @@
+# Builds the UploaderSearch collection behind the uploader search in app.py: one document per uploader with
+#   {_id: uploader name, name: uploader name, key: case-folded name, grams: trigrams of key, size: number of grams,
+#    categories: [names], videos, views}
+# and three indexes, one per kind of search:
+#   key           anchored prefix queries (^prefix on the case-folded name, answered in name order from the index range)
+#   grams, size   fuzzy matches: candidates share a trigram with the query, have a gram count that can still reach the
+#                 similarity threshold, and are ranked by trigram overlap
+#   text          MongoDB full-text search over the uploader name and its categories, ranked by textScore
+# Video IDs are searched by prefix straight on the videoID index, which needs no extra collection.
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, InsertOne
+from time import perf_counter
+import argparse
+import math
+import re
+from compactSchema import COMPACT_COLLECTION, currentSchema
+from partitions import allVideos
+
+MONGO_URI = "mongodb://localhost:27017"
+SEARCH_COLLECTION = "UploaderSearch"
+BATCH_SIZE = 5000
+GRAM = 3
+MIN_SIMILARITY = 0.3 # trigram overlap (Jaccard) a fuzzy match needs
+MAX_CANDIDATES = 2000 # fuzzy candidates scored per query, so a query of very common trigrams stays typeahead-fast
+
+def searchKey(name):
+    return name.strip().casefold()
+
+def trigrams(key):
+    # Trigrams of the key padded with a space on each side, so the first and last letters count as well.
+    padded = f" {key} "
+    if len(padded) <= GRAM:
+        return [padded]
+    return sorted({padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)})
+
+def uploaderPipeline(compact=False):
+    # One row per uploader: how many distinct videos, their latest views summed, and the categories they post in.
+    if compact:
+        return [
+            {"$match": {"u": {"$ne": None}}},
+            {"$group": {"_id": "$u", "videos": {"$sum": 1}, "views": {"$sum": {"$max": "$s.v"}}, "categories": {"$addToSet": "$c"}}},
+            {"$lookup": {"from": "Uploaders", "localField": "_id", "foreignField": "_id", "as": "name"}},
+            {"$project": {"_id": {"$arrayElemAt": ["$name.name", 0]}, "videos": 1, "views": 1, "categories": 1}},
+        ]
+    return [
+        {"$match": {"uploader": {"$type": "string"}}},
+        {"$group": {"_id": {"uploader": "$uploader", "videoID": "$videoID"}, "views": {"$max": "$views"}, "category": {"$first": "$category"}}},
+        {"$group": {"_id": "$_id.uploader", "videos": {"$sum": 1}, "views": {"$sum": "$views"}, "categories": {"$addToSet": "$category"}}},
+    ]
+
+def searchDocument(row, categoryNames=None):
+    categories = row.get("categories") or []
+    if categoryNames is not None:
+        categories = [categoryNames.get(code) for code in categories]
+    key = searchKey(row["_id"])
+    grams = trigrams(key)
+    return {"_id": row["_id"], "name": row["_id"], "key": key, "grams": grams, "size": len(grams), "categories": sorted(c for c in categories if c),
+            "videos": row.get("videos", 0), "views": row.get("views") or 0}
+
+def buildSearchIndex(db, compact=None):
+    # Rebuilds UploaderSearch from scratch in a staging collection and swaps it in.
+    # compact=None reads whichever schema the last load wrote.
+    start_time = perf_counter()
+    if compact is None:
+        compact = currentSchema(db) == "compact"
+    categoryNames = {entry["_id"]: entry["name"] for entry in db["Categories"].find()} if compact else None
+    staging = db[SEARCH_COLLECTION + "_staging"]
+    staging.drop()
+
+    written = 0
+    requests = []
+    for row in (db[COMPACT_COLLECTION] if compact else allVideos(db)).aggregate(uploaderPipeline(compact), allowDiskUse=True):
+        if not row.get("_id") or not searchKey(row["_id"]):
+            continue
+        requests.append(InsertOne(searchDocument(row, categoryNames)))
+        if len(requests) >= BATCH_SIZE:
+            staging.bulk_write(requests, ordered=False)
+            written += len(requests)
+            requests = []
+    if requests:
+        staging.bulk_write(requests, ordered=False)
+        written += len(requests)
+
+    staging.create_index([("key", ASCENDING), ("videos", DESCENDING)])
+    staging.create_index([("grams", ASCENDING), ("size", ASCENDING)])
+    # No stemming or stop words: these are names, not sentences. Name matches weigh more than category matches.
+    staging.create_index([("name", TEXT), ("categories", TEXT)], weights={"name": 10, "categories": 1},
+                         default_language="none", name="search_text")
+    staging.rename(SEARCH_COLLECTION, dropTarget=True)
+    print(f"{SEARCH_COLLECTION} rebuilt for {written} uploaders in {perf_counter() - start_time:.4f} seconds")
+    return written
+
+def searchReady(db):
+    return SEARCH_COLLECTION in db.list_collection_names()
+
+SEARCH_FIELDS = {"_id": 0, "name": 1, "videos": 1, "views": 1, "categories": 1}
+
+def prefixSearch(db, text, page=0, pageSize=20):
+    # Uploaders whose case-folded name starts with text, in name order. The order is the (key, videos) index's own,
+    # so a one-letter prefix reads just the page from the index range instead of sorting every match in memory.
+    # Returns one extra result so the caller knows whether there is a next page.
+    key = searchKey(text)
+    if not key:
+        return []
+    query = {"key": {"$regex": "^" + re.escape(key)}}
+    cursor = db[SEARCH_COLLECTION].find(query, SEARCH_FIELDS).sort([("key", ASCENDING), ("videos", DESCENDING)])
+    return list(cursor.skip(page * pageSize).limit(pageSize + 1))
+
+def fuzzySearch(db, text, page=0, pageSize=20, minSimilarity=MIN_SIMILARITY):
+    # Uploaders whose names share enough trigrams with text, best match first. Misspellings, missing
+    # letters and swapped case still match. Candidates come from the (grams, size) index: a name with a gram count
+    # outside [minSimilarity * q, q / minSimilarity] cannot reach minSimilarity (Jaccard), whatever it shares, so
+    # those are never read. At most MAX_CANDIDATES are scored by counting their trigrams that are in the query
+    # (unwound and grouped back), and only the top page is kept by the sort.
+    key = searchKey(text)
+    if not key:
+        return []
+    grams = trigrams(key)
+    sizes = {"$gte": math.ceil(minSimilarity * len(grams)), "$lte": math.floor(len(grams) / minSimilarity)}
+    pipeline = [
+        {"$match": {"grams": {"$in": grams}, "size": sizes}},
+        {"$limit": MAX_CANDIDATES},
+        {"$project": {"grams": 1, "size": 1, "name": 1, "key": 1, "videos": 1, "views": 1, "categories": 1}},
+        {"$unwind": "$grams"},
+        {"$match": {"grams": {"$in": grams}}},
+        {"$group": {"_id": "$_id", "shared": {"$sum": 1}, "size": {"$first": "$size"}, "name": {"$first": "$name"},
+                    "key": {"$first": "$key"}, "videos": {"$first": "$videos"}, "views": {"$first": "$views"},
+                    "categories": {"$first": "$categories"}}},
+        {"$addFields": {"similarity": {"$divide": ["$shared", {"$subtract": [{"$add": ["$size", len(grams)]}, "$shared"]}]}}},
+        {"$match": {"similarity": {"$gte": minSimilarity}}},
+        {"$sort": {"similarity": -1, "videos": -1, "key": 1}},
+        {"$skip": page * pageSize},
+        {"$limit": pageSize + 1},
+        {"$project": dict(SEARCH_FIELDS, similarity=1)},
+    ]
+    return list(db[SEARCH_COLLECTION].aggregate(pipeline))
+
+def textSearch(db, text, page=0, pageSize=20):
+    # Full-text search over uploader names and categories, e.g. "music" or "gaming vlog", ranked by MongoDB's textScore.
+    if not text.strip():
+        return []
+    score = {"$meta": "textScore"}
+    cursor = db[SEARCH_COLLECTION].find({"$text": {"$search": text}}, dict(SEARCH_FIELDS, score=score))
+    cursor = cursor.sort([("score", score), ("videos", DESCENDING)])
+    return list(cursor.skip(page * pageSize).limit(pageSize + 1))
+
+SEARCH_MODES = {"prefix": prefixSearch, "fuzzy": fuzzySearch, "text": textSearch}
+
+def searchUploaders(db, text, mode="prefix", page=0, pageSize=20):
+    # Returns (results on this page, whether there is another page).
+    results = SEARCH_MODES[mode](db, text, page, pageSize)
+    return results[:pageSize], len(results) > pageSize
+
+def searchVideoIDs(collection, prefix, limit=10, compact=False):
+    # Video IDs starting with prefix (IDs are case-sensitive), from the videoID index alone.
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    query = {"_id" if compact else "videoID": {"$regex": "^" + re.escape(prefix)}}
+    if compact:
+        return [document["_id"] for document in collection.find(query, {"_id": 1}).sort("_id", ASCENDING).limit(limit)]
+    # Video has one document per video per crawl, so the IDs are made distinct on the server: grouping right after
+    # a sort on the indexed videoID lets MongoDB jump from one ID to the next in the index (DISTINCT_SCAN).
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"videoID": 1}},
+        {"$group": {"_id": "$videoID"}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+    ]
+    return [document["_id"] for document in collection.aggregate(pipeline)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the UploaderSearch collection used by the uploader search")
+    parser.add_argument("--schema", choices=["full", "compact"], default=None, help="defaults to the schema of the last load")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    buildSearchIndex(client["YoutubeData"], None if args.schema is None else args.schema == "compact")
+
+
+"""
+Pseudocode:
+
+buildSearchIndex(db):
+    FOR each uploader in Video (or VideoCompact, with names from Uploaders and Categories, or every partition):
+        count its distinct videos, sum their latest views, collect its categories
+        write {_id: name, name, key: lowercase name, grams: 3-letter pieces of " key ", categories, videos, views}
+    index key, grams and a text index over name and categories, then swap UploaderSearch_staging in
+
+prefixSearch(text): key starts with lowercase text, in key order (read straight from the index)
+fuzzySearch(text):
+    candidates = uploaders sharing any trigram with text whose trigram count is within
+                 [0.3 x, x / 0.3] of the text's x (no other count can reach 0.3), at most 2000 of them
+    unwind their trigrams, keep the ones in text and count them per uploader (shared)
+    similarity = shared trigrams / all trigrams of both (Jaccard); keep >= 0.3, best first
+textSearch(text): $text search over names and categories, best textScore first
+each returns one page plus one extra result to tell whether a next page exists
+
+searchVideoIDs(prefix): distinct videoIDs starting with prefix, grouped on the server in videoID order, first N
+
+"""
@@ -0,0 +1,193 @@
+# Spark analytics job suite over the cleaned dataset: category counts, per-uploader totals, reverse-related in-degree and per-snapshot view deltas.
+# All jobs share one SparkSession, a fixed schema and a cached DataFrame. The harness records wall time and shuffle size per job,
+# and can rerun the suite for several core counts and input fractions to see how the jobs scale before moving to a cluster.
+from pyspark.sql import SparkSession, Window
+from pyspark.sql import functions as F
+from pyspark.sql.types import StructType, StructField, StringType, LongType, DoubleType, ArrayType
+import argparse
+import json
+import time
+import urllib.request
+
+# Same columns as the cleanData JSONL (and parquetExport.VIDEO_SCHEMA); no schema inference pass over the input.
+VIDEO_SCHEMA = StructType([
+    StructField("videoID", StringType()),
+    StructField("uploader", StringType()),
+    StructField("age", LongType()),
+    StructField("category", StringType()),
+    StructField("duration", LongType()),
+    StructField("views", LongType()),
+    StructField("rating", DoubleType()),
+    StructField("ratings", LongType()),
+    StructField("comments", LongType()),
+    StructField("related", ArrayType(StringType())),
+])
+SHARD_SNAPSHOT = r"(\d{6})_\d+\.json"
+TOP_ROWS = 10
+
+def getSession(appName="FreshMongosJobs", master=None):
+    # One session per process, reused by every job. master=None leaves it to spark-submit.
+    builder = SparkSession.builder.appName(appName)
+    if master:
+        builder = builder.master(master)
+    # Partition values (snapshot=080329) are kept as strings so dates keep their leading zero.
+    return builder.config("spark.sql.sources.partitionColumnTypeInference.enabled", "false").getOrCreate()
+
+def loadVideos(spark, inputPath, inputFormat="json"):
+    if inputFormat == "parquet":
+        # parquetExport.py output: snapshot and category come from the partition directories.
+        return spark.read.parquet(inputPath)
+    # cleanData shards are named <YYMMDD>_<depth>.json, so the snapshot comes from the file name.
+    df = spark.read.schema(VIDEO_SCHEMA).json(inputPath)
+    return df.withColumn("snapshot", F.regexp_extract(F.input_file_name(), SHARD_SNAPSHOT, 1))
+
+# Jobs. Each takes the shared videos DataFrame and returns a DataFrame; the harness decides what action runs it.
+
+def categoryCounts(df):
+    return df.groupBy("category").count()
+
+def uploaderTotals(df):
+    # A video is counted once per uploader even if several snapshots saw it; its views are the highest observed.
+    perVideo = df.groupBy("uploader", "videoID").agg(F.max("views").alias("views"))
+    return perVideo.groupBy("uploader").agg(F.count("videoID").alias("videos"), F.sum("views").alias("views"))
+
+def relatedInDegree(df):
+    # Number of distinct videos that list each target as related.
+    edges = df.select("videoID", F.explode("related").alias("target")).distinct()
+    return edges.groupBy("target").agg(F.count("videoID").alias("inDegree"))
+
+def snapshotViewDeltas(df):
+    # Views gained by each video since the previous snapshot that saw it, summed per snapshot.
+    perSnapshot = df.groupBy("videoID", "snapshot").agg(F.max("views").alias("views"))
+    previous = F.lag("views").over(Window.partitionBy("videoID").orderBy("snapshot"))
+    deltas = perSnapshot.withColumn("delta", F.col("views") - previous).where(F.col("delta").isNotNull())
+    return deltas.groupBy("snapshot").agg(F.count("videoID").alias("reobserved"), F.sum("delta").alias("viewDelta"))
+
+# Job name -> (job, column to rank by for the printed top rows).
+JOBS = {
+    "categoryCounts": (categoryCounts, "count"),
+    "uploaderTotals": (uploaderTotals, "views"),
+    "relatedInDegree": (relatedInDegree, "inDegree"),
+    "snapshotViewDeltas": (snapshotViewDeltas, "snapshot"),
+}
+
+def stageMetrics(spark, group):
+    # Sums shuffle read/write bytes over every stage of the jobs run under this job group,
+    # using the Spark UI's REST API (None if the UI is disabled).
+    sc = spark.sparkContext
+    stageIds = set()
+    for jobId in sc.statusTracker().getJobIdsForGroup(group):
+        info = sc.statusTracker().getJobInfo(jobId)
+        if info:
+            stageIds.update(info.stageIds)
+    metrics = {"stages": len(stageIds), "shuffleReadBytes": None, "shuffleWriteBytes": None}
+    if not sc.uiWebUrl:
+        return metrics
+    read = written = 0
+    for stageId in stageIds:
+        url = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}/stages/{stageId}"
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                attempts = json.load(response)
+        except (OSError, ValueError):
+            continue # stage skipped (its shuffle output was reused) or not reported yet
+        for attempt in attempts:
+            read += attempt.get("shuffleReadBytes", 0)
+            written += attempt.get("shuffleWriteBytes", 0)
+    metrics.update(shuffleReadBytes=read, shuffleWriteBytes=written)
+    return metrics
+
+def timeStage(spark, group, action):
+    # Runs action() under its own job group and returns (result, metrics).
+    spark.sparkContext.setJobGroup(group, group)
+    start_time = time.time()
+    result = action()
+    seconds = time.time() - start_time
+    metrics = stageMetrics(spark, group)
+    metrics["seconds"] = round(seconds, 4)
+    return result, metrics
+
+def runSuite(spark, inputPath, inputFormat="json", fraction=1.0, outputDir=None, jobs=None, label=""):
+    # Loads and caches the input once, then runs every job against the cached DataFrame.
+    report = {}
+    df = loadVideos(spark, inputPath, inputFormat)
+    if fraction < 1.0:
+        df = df.sample(fraction=fraction, seed=42)
+    df = df.cache()
+    rows, report["load"] = timeStage(spark, f"{label}load", df.count)
+    report["load"]["rows"] = rows
+    print(f"{label}load: {rows} rows in {report['load']['seconds']}s")
+
+    for name in jobs or JOBS:
+        job, rankBy = JOBS[name]
+        result = job(df)
+        if outputDir:
+            # Full result written out as Parquet.
+            _, report[name] = timeStage(spark, f"{label}{name}", lambda: result.write.parquet(f"{outputDir}/{name}", mode="overwrite"))
+        else:
+            # orderBy + limit runs as a top-k (TakeOrderedAndProject), not a full sort.
+            _, report[name] = timeStage(spark, f"{label}{name}", lambda: result.orderBy(F.col(rankBy).desc()).limit(TOP_ROWS).collect())
+        print(f"{label}{name}: {report[name]}")
+    df.unpersist()
+    return report
+
+def benchmark(inputPath, inputFormat, cores, fractions, jobs=None):
+    # Reruns the suite in local mode for every (cores, fraction) pair. The master is fixed when a session starts,
+    # so each core count gets its own session.
+    results = []
+    for coreCount in cores:
+        spark = getSession(master=f"local[{coreCount}]")
+        spark.sparkContext.setLogLevel("WARN")
+        for fraction in fractions:
+            label = f"[{coreCount} cores, {fraction:g}] "
+            report = runSuite(spark, inputPath, inputFormat, fraction, jobs=jobs, label=label)
+            results.append({"cores": coreCount, "fraction": fraction, "jobs": report})
+        spark.stop()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Spark analytics job suite")
+    parser.add_argument("input_path", help="cleanData folder/glob (JSONL) or the Parquet export folder")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json")
+    parser.add_argument("--output", default=None, help="write every job's full result as Parquet under this folder")
+    parser.add_argument("--jobs", nargs="+", choices=list(JOBS), default=None)
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--cores", default=None, help="benchmark: comma separated core counts, e.g. 1,2,4")
+    parser.add_argument("--fractions", default="1", help="benchmark: comma separated input fractions, e.g. 0.25,0.5,1")
+    parser.add_argument("--report", default=None, help="save the timing report as JSON")
+    args = parser.parse_args()
+
+    if args.cores:
+        results = benchmark(args.input_path, args.format,
+                            [int(value) for value in args.cores.split(",")],
+                            [float(value) for value in args.fractions.split(",")], args.jobs)
+    else:
+        spark = getSession(master=args.master)
+        results = runSuite(spark, args.input_path, args.format, outputDir=args.output, jobs=args.jobs)
+        spark.stop()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+
+
+"""
+Pseudocode:
+
+runSuite(spark, input, format, fraction):
+    df <- read input with the fixed VIDEO_SCHEMA (snapshot from file name or partition)
+    optionally sample a fraction of the rows
+    cache df and count it (timed as the load stage)
+    FOR each job in [categoryCounts, uploaderTotals, relatedInDegree, snapshotViewDeltas]:
+        set a job group named after the job
+        run the job (top 10 rows, or write the full result)
+        record wall time, stage count and shuffle read/write bytes of the group
+    RETURN report
+
+benchmark(input, cores list, fractions list):
+    FOR each core count:
+        start a local[cores] session
+        FOR each fraction:
+            runSuite(...)
+        stop the session
+
+"""
@@ -1,27 +1,30 @@
 # Counts the number of videos in each category from the cleaned dataset.
 
-from pyspark.sql import SparkSession
 from pyspark.sql.functions import col
+from sparkJobs import getSession, loadVideos, categoryCounts
 import argparse
 import time
 
-def main(input_file, output_file):
+def main(input_file, output_file, input_format="json"):
     start_time = time.time()
 
-    # Initialize Spark session
-    spark = SparkSession.builder.appName("CategoryCount").getOrCreate()
+    # Initialize Spark session (shared with the sparkJobs.py suite)
+    spark = getSession("CategoryCount")
     print(spark.version)
 
-    # Input: cleaned JSONL dataset
-    df = spark.read.json(input_file)
+    # Input: cleaned JSONL dataset read with the fixed schema, or the Parquet dataset from parquetExport.py.
+    # Only the category column is kept; for Parquet it is a partition column, so no data columns are read.
+    df = loadVideos(spark, input_file, input_format).select("category")
 
-    # Computing operations: group by category and count videos
-    category_counts = df.groupBy("category").count().orderBy(col("count").desc())
+    # Computing operations: group by category and count videos. The result is only a few rows, so it is cached
+    # and both outputs below reuse it.
+    category_counts = categoryCounts(df).cache()
 
     # Output: save results to JSON
-    category_counts.coalesce(1).write.json(output_file, mode="overwrite")
+    category_counts.orderBy(col("count").desc()).coalesce(1).write.json(output_file, mode="overwrite")
 
-    category_counts.show(10, truncate=False)  # Display top 10 categories
+    # Display top 10 categories (orderBy + limit runs as a top-k, not a full sort)
+    category_counts.orderBy(col("count").desc()).limit(10).show(truncate=False)
 
     end_time = time.time()
     print(f"Execution time: {end_time - start_time:.2f} seconds")
@@ -32,8 +35,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Count videos per category using PySpark")
     parser.add_argument("input_file")
     parser.add_argument("output_file")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json", help="input is cleanData JSONL or the Parquet export")
     args = parser.parse_args()
-    main(args.input_file, args.output_file)
+    main(args.input_file, args.output_file, args.format)
 
 
 """
@@ -47,22 +51,22 @@ Output:
     
 Function CountVideosPerCategory(input_file, output_file):
     # Start Spark session
-    spark <- SparkSession.builder.appName("CategoryCount").getOrCreate()
+    spark <- sparkJobs.getSession("CategoryCount")
 
-    # Read input JSONL file into DataFrame
-    df <- spark.read.json(input_file)
+    # Read input into DataFrame
+    IF input is Parquet:
+        df <- spark.read.parquet(input_file), keeping only the category column
+    ELSE:
+        df <- spark.read.schema(VIDEO_SCHEMA).json(input_file), keeping only the category column
 
-    # Group by 'category' and count videos
+    # Group by 'category' and count videos, cached for both outputs
     category_counts  <- df.groupBy("category").count()
 
-    # Sort by count in descending order
-    category_counts <- category_counts.orderBy(count descending)
-
-    # Save results to JSON
-    category_counts.coalesce(1).write.json(output_file, mode="overwrite")
+    # Save results to JSON, sorted by count in descending order
+    category_counts.orderBy(count descending).coalesce(1).write.json(output_file, mode="overwrite")
 
     # Display top 10 categories
-    category_counts.show(10, truncate=False)
+    category_counts.orderBy(count descending).limit(10).show()
 
     # Stop Spark session
     spark.stop()
@@ -0,0 +1,260 @@
+# Fused load: raw crawl TSV -> cleanRow -> BSON -> insert_many, without writing and re-reading the cleanData JSON shards.
+# Parse worker processes each take one depth file, clean its rows and encode them to BSON, and send batches of encoded
+# documents through a bounded queue to the writer threads, which insert them as RawBSONDocuments (pymongo sends the
+# bytes as they are). With --tee the workers also write the usual cleanData shards and manifest, which the derived
+# collections (RelatedBy, VideoSeries/VideoTrend) and later incremental loads are built from.
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from bson import ObjectId, encode
+from bson.raw_bson import RawBSONDocument
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import argparse
+import csv
+import os
+import queue
+import sys
+import traceback
+from time import perf_counter
+from dataCleansing import cleanRow, findDepthFiles, shardName, fileDigest, writeManifest, WRITE_BUFFER, SHARD_FORMAT
+from dataInsertion import reportBatch, rejectedBatch, recordShards, BATCH_SIZE, WRITERS
+from indexes import VIDEO_KEY, ensureIndexes
+from relatedIndex import buildRelatedBy
+from timeSeries import buildTimeSeries
+from dashboardStats import refreshStats
+from searchIndex import buildSearchIndex
+from queryCache import bumpGeneration
+from compactSchema import setSchema
+from jsonCodec import dumpLine
+from instrumentation import CommandMonitor, configure, recordStage, registry, stage
+
+MONGO_URI = "mongodb://localhost:27017"
+QUEUE_BATCHES = 8 # encoded batches waiting for a writer; parse workers block once the queue is full
+POLL_SECONDS = 1.0 # how often a waiting writer loop checks that the parse processes are still alive
+
+def parseFile(task, out):
+    # Cleans one depth file and puts ("batch", label, [BSON bytes]) on the queue every batchSize rows,
+    # then ("done", key, stats). The _id is made here so the writer does not have to decode anything.
+    key, snapshot, depth, inp, teePath, maxRows, batchSize = task
+    start_time = perf_counter()
+    kept = 0
+    rejected = 0
+    batch = []
+    number = 0
+    tee = open(teePath, 'wb', buffering=WRITE_BUFFER) if teePath else None
+    try:
+        with open(inp, 'r', encoding='utf-8') as f:
+            for i, row in enumerate(csv.reader(f, delimiter='\t')):
+                if maxRows and i >= maxRows:
+                    break
+                clean = cleanRow(row, snapshot)
+                if not clean:
+                    rejected += 1
+                    continue
+                kept += 1
+                if tee:
+                    tee.write(dumpLine(clean))
+                clean["_id"] = ObjectId()
+                batch.append(encode(clean))
+                if len(batch) >= batchSize:
+                    out.put(("batch", f"{key} batch {number}", batch))
+                    batch = []
+                    number += 1
+        if batch:
+            out.put(("batch", f"{key} batch {number}", batch))
+    finally:
+        if tee:
+            tee.close()
+    stats = {"rows": kept, "rejected": rejected, "snapshot": snapshot, "depth": depth}
+    if teePath:
+        # Same entry cleanAll writes, so the teed shards count as up to date for dataCleansing.py.
+        info = os.stat(inp)
+        stats.update({"output": os.path.basename(teePath), "size": info.st_size, "mtime": info.st_mtime, "sha256": fileDigest(inp),
+                      "skipped": False, "format": SHARD_FORMAT, "maxRows": maxRows})
+    stats["seconds"] = round(perf_counter() - start_time, 4)
+    out.put(("done", key, stats))
+
+def parseWorker(tasks, out):
+    # Worker process: parses depth files until it receives None. A failure is reported instead of lost with the process.
+    for task in iter(tasks.get, None):
+        try:
+            parseFile(task, out)
+        except Exception:
+            out.put(("error", task[0], traceback.format_exc()))
+
+def insertEncoded(collection, batch, label):
+    # Inserts already-encoded documents. RawBSONDocument bytes are sent as they are, without another encode.
+    start_time = perf_counter()
+    try:
+        collection.insert_many([RawBSONDocument(document) for document in batch], ordered=False)
+        written = len(batch)
+    except BulkWriteError as e:
+        written = e.details.get("nInserted", 0)
+        rejectedBatch(label, e)
+    return reportBatch(label, "inserted", written, perf_counter() - start_time)
+
+def nextMessage(out, processes):
+    # The next queue message. A parse process killed outside parseWorker's error handling (out of memory, a signal)
+    # never reports its file, so instead of waiting forever this raises once one has died or all of them have
+    # exited with files still unfinished.
+    while True:
+        try:
+            return out.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            dead = [process for process in processes if process.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(", ".join(f"parse process {process.pid} died with exit code {process.exitcode}" for process in dead))
+            if not any(process.is_alive() for process in processes):
+                raise RuntimeError("every parse process exited before all files were parsed")
+
+def streamShards(collection, tasks, workers, writers, queueSize=QUEUE_BATCHES):
+    # Runs the parse processes and the writer threads side by side and returns (documents written, {key: stats}).
+    # Raises RuntimeError if a file fails to parse or a parse process dies.
+    context = multiprocessing.get_context()
+    taskQueue = context.Queue()
+    out = context.Queue(maxsize=queueSize)
+    for task in tasks:
+        taskQueue.put(task)
+    processes = [context.Process(target=parseWorker, args=(taskQueue, out), daemon=True) for _ in range(min(workers, len(tasks)))]
+    for process in processes:
+        taskQueue.put(None)
+        process.start()
+
+    total = 0
+    files = {}
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            while len(files) < len(tasks):
+                kind, key, payload = nextMessage(out, processes)
+                if kind == "error":
+                    raise RuntimeError(f"parsing {key} failed:\n{payload}")
+                if kind == "done":
+                    files[key] = payload
+                    print(f"{key}: {payload['rows']} rows, {payload['rejected']} rejected, parsed in {payload['seconds']}s")
+                    continue
+                # Back-pressure on the writer side too: at most two batches per writer are in flight.
+                if len(pending) >= writers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total += sum(future.result() for future in done)
+                pending.add(executor.submit(insertEncoded, collection, payload, key))
+            total += sum(future.result() for future in pending)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return total, files
+
+def main(dataDir, teeDir=None, workers=None, writers=WRITERS, batchSize=BATCH_SIZE, maxRows=None, client=None, database="YoutubeData", derived=True):
+    # Full rebuild of Video straight from the raw crawl, through a staging collection like dataInsertion.py.
+    workers = workers or multiprocessing.cpu_count()
+    client = client or MongoClient(MONGO_URI, maxPoolSize=writers, event_listeners=[CommandMonitor()])
+    db = client[database]
+    if teeDir:
+        os.makedirs(teeDir, exist_ok=True)
+
+    tasks = []
+    for snapshot, depth, path in findDepthFiles(dataDir):
+        key = os.path.relpath(path, dataDir).replace(os.sep, "/")
+        teePath = os.path.join(teeDir, shardName(snapshot, depth)) if teeDir else None
+        tasks.append((key, snapshot, depth, path, teePath, maxRows, batchSize))
+    # Largest files first so one big file does not end up parsing alone at the end.
+    tasks.sort(key=lambda task: os.path.getsize(task[3]), reverse=True)
+    print(f"streaming {len(tasks)} files with {workers} parse workers and {writers} writers")
+
+    start_time = perf_counter()
+    staging = db["Video_staging"]
+    staging.drop()
+    staging.create_index(VIDEO_KEY, unique=True)
+    try:
+        total, files = streamShards(staging, tasks, workers, writers)
+    except Exception:
+        # Video is left as it was; the half-filled staging copy is not kept around.
+        staging.drop()
+        raise
+    ensureIndexes(staging)
+    staging.rename("Video", dropTarget=True)
+    setSchema(db, "full")
+    duration = perf_counter() - start_time
+
+    for stats in files.values():
+        registry.inc("rows_total", stats["rows"], snapshot=stats["snapshot"], outcome="kept")
+        registry.inc("rows_total", stats["rejected"], snapshot=stats["snapshot"], outcome="rejected")
+    print(f"streamed {total} documents ({sum(stats['rejected'] for stats in files.values())} rows rejected) in {duration:.4f} seconds ({total / max(duration, 1e-9):,.0f} docs/sec)")
+    recordStage("stream", duration, documents=total, files=len(files))
+
+    shards = sorted(stats["output"] for stats in files.values()) if teeDir else []
+    if teeDir:
+        writeManifest(teeDir, files, workers, duration)
+        # LoadedShards now lists the teed shards. Without --tee it is left as it was: emptying it would make the next
+        # incremental dataInsertion.py load reload every cleanData shard.
+        recordShards(db, shards, replace=True, cleanDir=teeDir)
+
+    if derived and teeDir:
+        jsonPaths = [os.path.join(teeDir, name) for name in shards]
+        with stage("relatedBy"):
+            buildRelatedBy(db, jsonPaths, rebuild=True)
+        with stage("timeSeries"):
+            buildTimeSeries(db, jsonPaths, rebuild=True)
+    elif derived:
+        print("RelatedBy and VideoSeries/VideoTrend are built from shards; run with --tee to rebuild them")
+    if derived:
+        with stage("dashboardStats"):
+            refreshStats(db)
+        with stage("uploaderSearch"):
+            buildSearchIndex(db, compact=False)
+    bumpGeneration(db)
+    print(f"There are {db['Video'].count_documents({})} documents in the video collection")
+    return {"documents": total, "seconds": duration}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the raw crawl straight into MongoDB without the cleanData JSON pass")
+    parser.add_argument("--data", default=os.path.join(os.getcwd(), "allData"))
+    parser.add_argument("--tee", nargs="?", const=os.path.join(os.getcwd(), "cleanData"), default=None,
+                        help="also write the cleanData shards and manifest (to cleanData, or the given folder)")
+    parser.add_argument("--workers", type=int, default=None, help="parse processes")
+    parser.add_argument("--writers", type=int, default=WRITERS, help="concurrent writer threads")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="documents per insert_many call")
+    parser.add_argument("--maxRows", type=int, default=None)
+    parser.add_argument("--metrics", default=os.path.join(os.getcwd(), "metrics"), help="folder for streamLoad.prom and streamLoad.jsonl")
+    args = parser.parse_args()
+
+    configure("streamLoad", args.metrics)
+    try:
+        main(args.data, args.tee, args.workers, args.writers, args.batch, args.maxRows)
+    except RuntimeError as e:
+        print(f"load aborted, Video unchanged: {e}")
+        sys.exit(1)
+    finally:
+        registry.flush()
+
+
+"""
+Pseudocode:
+
+parseFile(depth file) in a worker process:
+    FOR each TSV row (up to maxRows):
+        clean = cleanRow(row, snapshot); IF invalid: count as rejected
+        IF tee: append clean as a JSON line to <snapshot>_<depth>.json
+        give clean an _id, encode it to BSON and add it to the batch
+        IF batch is full: put it on the bounded queue (waits while the queue is full)
+    put the last batch and the file's stats (plus size, mtime and sha256 for the manifest if teeing)
+
+main(dataDir, teeDir):
+    find every depth file, largest first
+    drop Video_staging and create the unique (videoID, snapshot) index
+    start the parse processes
+    WHILE files are unfinished:
+        take the next message from the queue
+        batch: hand it to a writer thread (at most 2 * writers in flight), which insert_many's the raw BSON
+        done: record the file's stats
+        error: stop and report it
+        nothing for a second: stop if a parse process died (or all exited with files unfinished)
+    on any failure: drop Video_staging, leave Video as it was and exit with status 1
+    build the query indexes, rename Video_staging to Video
+    IF teeDir: write _manifest.json there, record the shards in LoadedShards and rebuild RelatedBy and the time series
+             (without it LoadedShards is left as it was)
+    refresh DashboardStats and UploaderSearch, bump the load generation
+
+"""
@@ -0,0 +1,172 @@
+# Builds a per-video time series across crawl snapshots and ranks videos by how fast they gain views.
+# VideoSeries uses the bucket pattern: one document per video per month holding that month's observations, not one document per observation.
+# VideoTrend holds one document per video with its views/day, which the Trending page in app.py sorts on.
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne
+from datetime import date, datetime, timedelta
+import argparse
+import os
+import re
+from time import perf_counter
+from jsonCodec import iterDocuments
+
+MONGO_URI = "mongodb://localhost:27017"
+BATCH_SIZE = 2000
+# The crawl's "age" column counts days from YouTube's founding date to the upload.
+AGE_EPOCH = date(2005, 2, 15)
+SNAPSHOT_NAME = re.compile(r"^(\d{6})")
+
+def snapshotDate(snapshot):
+    return datetime.strptime(snapshot, "%y%m%d").date()
+
+def observation(document):
+    # The fields that change between crawls, stamped with the crawl date.
+    return {
+        "d": document["snapshot"],
+        "views": document.get("views"),
+        "rating": document.get("rating"),
+        "ratings": document.get("ratings"),
+        "comments": document.get("comments"),
+    }
+
+def readObservations(jsonPath):
+    snapshot = SNAPSHOT_NAME.match(os.path.basename(jsonPath))
+    for document in iterDocuments(jsonPath):
+        # Older shards do not carry the snapshot field; the file name does.
+        document["snapshot"] = document.get("snapshot") or (snapshot.group(1) if snapshot else None)
+        if document["snapshot"]:
+            yield document
+
+def appendObservations(series, jsonPaths):
+    # Adds each observation to its video's bucket for the crawl month (YYMM). It replaces any earlier observation of the
+    # same snapshot (like compactSchema.encodeUpdate), so reloading a shard, even one re-cleansed with changed values,
+    # never leaves two observations for one crawl.
+    touched = set()
+    requests = []
+    for jsonPath in jsonPaths:
+        for document in readObservations(jsonPath):
+            current = observation(document)
+            static = {"uploader": document.get("uploader"), "category": document.get("category"), "age": document.get("age")}
+            requests.append(UpdateOne({"videoID": document["videoID"], "bucket": document["snapshot"][:4]}, [
+                {"$set": {field: {"$ifNull": ["$" + field, {"$literal": value}]} for field, value in static.items()}},
+                {"$set": {"obs": {"$concatArrays": [
+                    {"$filter": {"input": {"$ifNull": ["$obs", []]}, "cond": {"$ne": ["$$this.d", current["d"]]}}},
+                    {"$literal": [current]},
+                ]}}},
+            ], upsert=True))
+            touched.add(document["videoID"])
+            if len(requests) >= BATCH_SIZE:
+                series.bulk_write(requests, ordered=False)
+                requests = []
+    if requests:
+        series.bulk_write(requests, ordered=False)
+    return touched
+
+def velocity(observations, age):
+    # Views per day. With two or more crawls: the growth between the first and last crawl.
+    # With a single crawl: the total views spread over the days since upload.
+    observations = sorted((obs for obs in observations if obs.get("views") is not None), key=lambda obs: obs["d"])
+    if not observations:
+        return None
+    first, last = observations[0], observations[-1]
+    days = (snapshotDate(last["d"]) - snapshotDate(first["d"])).days
+    if days > 0:
+        return (last["views"] - first["views"]) / days
+    if age is not None:
+        uploaded = AGE_EPOCH + timedelta(days=age)
+        return last["views"] / max(1, (snapshotDate(last["d"]) - uploaded).days)
+    return None
+
+def refreshTrend(series, trend, videoIDs=None):
+    # Recomputes views/day for the given videos (all of them if None) from every bucket they have.
+    chunks = [None] if videoIDs is None else [videoIDs[i:i + BATCH_SIZE] for i in range(0, len(videoIDs), BATCH_SIZE)]
+    updated = 0
+    for chunk in chunks:
+        pipeline = [] if chunk is None else [{"$match": {"videoID": {"$in": chunk}}}]
+        pipeline += [
+            {"$unwind": "$obs"},
+            {"$group": {"_id": "$videoID", "obs": {"$push": "$obs"}, "uploader": {"$first": "$uploader"},
+                        "category": {"$first": "$category"}, "age": {"$first": "$age"}}},
+        ]
+        requests = []
+        for video in series.aggregate(pipeline, allowDiskUse=True):
+            days = sorted(obs["d"] for obs in video["obs"])
+            requests.append(UpdateOne({"videoID": video["_id"]}, {"$set": {
+                "viewsPerDay": velocity(video["obs"], video.get("age")),
+                "views": max((obs["views"] for obs in video["obs"] if obs.get("views") is not None), default=None),
+                "observations": len(days),
+                "firstSeen": days[0],
+                "lastSeen": days[-1],
+                "uploader": video.get("uploader"),
+                "category": video.get("category"),
+            }}, upsert=True))
+            if len(requests) >= BATCH_SIZE:
+                trend.bulk_write(requests, ordered=False)
+                updated += len(requests)
+                requests = []
+        if requests:
+            trend.bulk_write(requests, ordered=False)
+            updated += len(requests)
+    return updated
+
+def buildTimeSeries(db, jsonPaths, rebuild=False):
+    # rebuild: builds both collections from scratch in staging collections and swaps them in.
+    # Otherwise the given shards are merged and only the videos they contain get a new views/day.
+    start_time = perf_counter()
+    suffix = "_staging" if rebuild else ""
+    series, trend = db["VideoSeries" + suffix], db["VideoTrend" + suffix]
+    if rebuild:
+        series.drop()
+        trend.drop()
+    series.create_index([("videoID", ASCENDING), ("bucket", ASCENDING)], unique=True)
+    trend.create_index([("videoID", ASCENDING)], unique=True)
+    trend.create_index([("viewsPerDay", DESCENDING)])
+
+    touched = appendObservations(series, jsonPaths)
+    updated = refreshTrend(series, trend, None if rebuild else sorted(touched))
+
+    if rebuild:
+        series.rename("VideoSeries", dropTarget=True)
+        trend.rename("VideoTrend", dropTarget=True)
+    print(f"time series updated for {updated} videos in {perf_counter() - start_time:.4f} seconds")
+
+def topTrending(db, limit=25, category=None):
+    query = {"viewsPerDay": {"$ne": None}}
+    if category:
+        query["category"] = category
+    return list(db["VideoTrend"].find(query, {"_id": 0}).sort("viewsPerDay", DESCENDING).limit(limit))
+
+def videoHistory(db, video_id):
+    # Every observation of one video, oldest first.
+    buckets = db["VideoSeries"].find({"videoID": video_id}, {"_id": 0, "obs": 1})
+    return sorted((obs for bucket in buckets for obs in bucket["obs"]), key=lambda obs: obs["d"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the VideoSeries time series and VideoTrend views/day ranking")
+    parser.add_argument("--incremental", action="store_true", help="merge into the existing collections instead of rebuilding them")
+    args = parser.parse_args()
+
+    folder = os.path.join(os.getcwd(), "cleanData")
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if not name.startswith("_")]
+    client = MongoClient(MONGO_URI)
+    buildTimeSeries(client["YoutubeData"], paths, rebuild=not args.incremental)
+
+
+"""
+Pseudocode:
+
+buildTimeSeries(db, files, rebuild):
+    use VideoSeries_staging/VideoTrend_staging (emptied) if rebuild, else VideoSeries/VideoTrend
+    FOR each document in files:
+        put {d: snapshot, views, rating, ratings, comments} in the obs array of the (videoID, month of snapshot)
+        bucket, replacing any observation with the same d, creating the bucket if needed
+    FOR each touched video (all videos if rebuild):
+        gather the observations from all its buckets
+        IF seen on two or more dates:
+            viewsPerDay = (last views - first views) / days between first and last crawl
+        ELSE:
+            viewsPerDay = views / days since upload (Feb 15, 2005 + age)
+        upsert VideoTrend {videoID, viewsPerDay, views, observations, firstSeen, lastSeen, uploader, category}
+    IF rebuild:
+        rename the staging collections over VideoSeries and VideoTrend
+
+"""